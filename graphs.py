@@ -1,13 +1,10 @@
-from .lib import Graph, operations
-import typing as tp
+from .lib import Graph, operations, readers
 
 
 def word_count_graph(input_stream_name: str, text_column: str = 'text', count_column: str = 'count') -> Graph:
     """Constructs graph which counts words in text_column of all rows passed"""
     return Graph.graph_from_iter(input_stream_name) \
-        .map(operations.FilterPunctuation(text_column)) \
-        .map(operations.LowerCase(text_column)) \
-        .map(operations.Split(text_column)) \
+        .map(operations.Tokenize(text_column)) \
         .sort([text_column]) \
         .reduce(operations.Count(count_column), [text_column]) \
         .sort([count_column, text_column])
@@ -17,9 +14,7 @@ def inverted_index_graph(input_stream_name: str, doc_column: str = 'doc_id', tex
                          result_column: str = 'tf_idf') -> Graph:
     """Constructs graph which calculates td-idf for every word/document pair"""
     graph_word: Graph = Graph.graph_from_iter(input_stream_name)\
-        .map(operations.FilterPunctuation(text_column))\
-        .map(operations.LowerCase(text_column))\
-        .map(operations.Split(text_column))
+        .map(operations.Tokenize(text_column))
 
     doc_count = 'doc_count'
 
@@ -56,17 +51,15 @@ def pmi_graph(input_stream_name: str, doc_column: str = 'doc_id', text_column: s
 
     word_in_doc = 'count'
 
+    # short words are dropped by inner join with filtered_graph anyway, so they are filtered before the sort
     graph: Graph = Graph.graph_from_iter(input_stream_name) \
-        .map(operations.FilterPunctuation(text_column)) \
-        .map(operations.LowerCase(text_column)) \
-        .map(operations.Split(text_column))\
+        .map(operations.Tokenize(text_column))\
+        .map(operations.Filter(lambda row: len(row[text_column]) > 4, [text_column]))\
         .sort([doc_column, text_column])
 
     filtered_graph: Graph = graph\
-        .map(operations.Filter(lambda row: len(row[text_column]) > 4))\
-        .sort([doc_column, text_column])\
         .reduce(operations.Count(word_in_doc), [doc_column, text_column])\
-        .map(operations.Filter(lambda row: row[word_in_doc] >= 2))
+        .map(operations.Filter(lambda row: row[word_in_doc] >= 2, [word_in_doc]))
     filtered_graph = filtered_graph.join(operations.InnerJoiner(), graph, [doc_column, text_column])
 
     tf_graph = filtered_graph\
@@ -98,7 +91,7 @@ def yandex_maps_graph(input_stream_name_time: str, input_stream_name_length: str
     dt_column = 'dt'
 
     length_graph: Graph = Graph.graph_from_iter(input_stream_name_length)\
-        .map(operations.Length(start_coord_column, end_coord_column, length_column))
+        .map(operations.Length(start_coord_column, end_coord_column, length_column, edge_id_column))
 
     suffix = '_datetime'
 
@@ -111,29 +104,28 @@ def yandex_maps_graph(input_stream_name_time: str, input_stream_name_length: str
 
     return length_graph.join(operations.InnerJoiner(),
                              time_graph,
-                             [edge_id_column])\
+                             [edge_id_column],
+                             algorithm='hash')\
         .map(operations.Speed(length_column, dt_column, speed_result_column)).\
         sort([weekday_result_column, hour_result_column])\
         .reduce(operations.Mean(speed_result_column), [weekday_result_column, hour_result_column])\
         .map(operations.Project([weekday_result_column, hour_result_column, speed_result_column]))
 
 
-def word_count_graph_file(input_stream_name: str, parser: tp.Callable[[str], operations.TRow],
+def word_count_graph_file(input_stream_name: str, parser: readers.TFormat,
                           text_column: str = 'text', count_column: str = 'count') -> Graph:
     """
     Constructs graph which counts words in text_column of all rows passed.
     Data is reading from file.
     """
     return Graph.graph_from_file(input_stream_name, parser) \
-        .map(operations.FilterPunctuation(text_column)) \
-        .map(operations.LowerCase(text_column)) \
-        .map(operations.Split(text_column)) \
+        .map(operations.Tokenize(text_column)) \
         .sort([text_column]) \
         .reduce(operations.Count(count_column), [text_column]) \
         .sort([count_column, text_column])
 
 
-def inverted_index_graph_file(input_stream_name: str, parser: tp.Callable[[str], operations.TRow],
+def inverted_index_graph_file(input_stream_name: str, parser: readers.TFormat,
                               doc_column: str = 'doc_id', text_column: str = 'text',
                               result_column: str = 'tf_idf') -> Graph:
     """
@@ -141,9 +133,7 @@ def inverted_index_graph_file(input_stream_name: str, parser: tp.Callable[[str],
     Data is reading from file.
     """
     graph_word: Graph = Graph.graph_from_file(input_stream_name, parser)\
-        .map(operations.FilterPunctuation(text_column))\
-        .map(operations.LowerCase(text_column))\
-        .map(operations.Split(text_column))
+        .map(operations.Tokenize(text_column))
 
     doc_count = 'doc_count'
 
@@ -174,7 +164,7 @@ def inverted_index_graph_file(input_stream_name: str, parser: tp.Callable[[str],
         .map(operations.Project([doc_column, text_column, result_column]))
 
 
-def pmi_graph_file(input_stream_name: str, parser: tp.Callable[[str], operations.TRow],
+def pmi_graph_file(input_stream_name: str, parser: readers.TFormat,
                    doc_column: str = 'doc_id', text_column: str = 'text',
                    result_column: str = 'pmi') -> Graph:
     """
@@ -184,17 +174,15 @@ def pmi_graph_file(input_stream_name: str, parser: tp.Callable[[str], operations
 
     word_in_doc = 'count'
 
+    # short words are dropped by inner join with filtered_graph anyway, so they are filtered before the sort
     graph: Graph = Graph.graph_from_file(input_stream_name, parser) \
-        .map(operations.FilterPunctuation(text_column)) \
-        .map(operations.LowerCase(text_column)) \
-        .map(operations.Split(text_column))\
+        .map(operations.Tokenize(text_column))\
+        .map(operations.Filter(lambda row: len(row[text_column]) > 4, [text_column]))\
         .sort([doc_column, text_column])
 
     filtered_graph: Graph = graph\
-        .map(operations.Filter(lambda row: len(row[text_column]) > 4))\
-        .sort([doc_column, text_column])\
         .reduce(operations.Count(word_in_doc), [doc_column, text_column])\
-        .map(operations.Filter(lambda row: row[word_in_doc] >= 2))
+        .map(operations.Filter(lambda row: row[word_in_doc] >= 2, [word_in_doc]))
     filtered_graph = filtered_graph.join(operations.InnerJoiner(), graph, [doc_column, text_column])
 
     tf_graph = filtered_graph\
@@ -218,7 +206,7 @@ def pmi_graph_file(input_stream_name: str, parser: tp.Callable[[str], operations
 
 def yandex_maps_graph_file(input_stream_name_time: str,
                            input_stream_name_length: str,
-                           parser: tp.Callable[[str], operations.TRow],
+                           parser: readers.TFormat,
                            enter_time_column: str = 'enter_time', leave_time_column: str = 'leave_time',
                            edge_id_column: str = 'edge_id', start_coord_column: str = 'start',
                            end_coord_column: str = 'end',
@@ -232,7 +220,7 @@ def yandex_maps_graph_file(input_stream_name_time: str,
     dt_column = 'dt'
 
     length_graph: Graph = Graph.graph_from_file(input_stream_name_length, parser)\
-        .map(operations.Length(start_coord_column, end_coord_column, length_column))
+        .map(operations.Length(start_coord_column, end_coord_column, length_column, edge_id_column))
 
     suffix = '_datetime'
 
@@ -245,7 +233,8 @@ def yandex_maps_graph_file(input_stream_name_time: str,
 
     return length_graph.join(operations.InnerJoiner(),
                              time_graph,
-                             [edge_id_column])\
+                             [edge_id_column],
+                             algorithm='hash')\
         .map(operations.Speed(length_column, dt_column, speed_result_column)).\
         sort([weekday_result_column, hour_result_column])\
         .reduce(operations.Mean(speed_result_column), [weekday_result_column, hour_result_column])\
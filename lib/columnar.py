@@ -0,0 +1,341 @@
+import math
+import operator
+import typing as tp
+
+from abc import ABC, abstractmethod
+from itertools import islice, repeat
+from os import environ
+
+from . import operations as ops
+
+COLUMNAR_BATCH_ROWS = int(environ.get("COLUMNAR_BATCH_ROWS", "4096"))
+
+TColumn = tp.Sequence[tp.Any]
+TBatch = tp.Dict[str, TColumn]
+TBatchesGenerator = tp.Generator[TBatch, None, None]
+
+
+def batch_length(batch: TBatch) -> int:
+    """
+    :param batch: column batch
+    :return: number of rows in batch
+    """
+    return len(next(iter(batch.values()))) if batch else 0
+
+
+def to_batches(rows: ops.TRowsIterable, batch_rows: tp.Optional[int] = None) -> TBatchesGenerator:
+    """
+    Group rows into column batches, consecutive rows with the same columns go to the same batch
+    :param rows: rows to group
+    :param batch_rows: maximum number of rows in batch, COLUMNAR_BATCH_ROWS by default
+    """
+    batch_rows = batch_rows if batch_rows is not None else COLUMNAR_BATCH_ROWS
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, batch_rows))
+        if not chunk:
+            break
+        start = 0
+        for end in range(1, len(chunk) + 1):
+            if end == len(chunk) or chunk[end].keys() != chunk[start].keys():
+                columns = list(chunk[start])
+                if len(columns) == 1:
+                    yield {columns[0]: [row[columns[0]] for row in chunk[start:end]]}
+                elif columns:
+                    values = map(operator.itemgetter(*columns), chunk[start:end])
+                    yield dict(zip(columns, map(list, zip(*values))))
+                else:
+                    yield {}
+                start = end
+
+
+def to_rows(batch: TBatch) -> ops.TRowsGenerator:
+    """
+    Convert column batch back to rows
+    :param batch: column batch
+    """
+    columns = list(batch)
+    for values in zip(*[batch[column] for column in columns]):
+        yield dict(zip(columns, values))
+
+
+class BatchMapper(ABC):
+    """Base class for mappers over column batches"""
+    @abstractmethod
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        """
+        :param batch: column batch
+        """
+        pass
+
+
+class RowMapper(BatchMapper):
+    """Adapter running chain of row-at-a-time mappers over column batch"""
+    def __init__(self, mappers: tp.Sequence[ops.Mapper]) -> None:
+        """
+        :param mappers: mappers to apply to every row one after another
+        """
+        self.mappers = mappers
+
+    def _apply(self, row: ops.TRow, index: int) -> ops.TRowsGenerator:
+        if index == len(self.mappers):
+            yield row
+            return
+        for new_row in self.mappers[index](row):
+            yield from self._apply(new_row, index + 1)
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        yield from to_batches(row for source in to_rows(batch) for row in self._apply(source, 0))
+
+
+def haversine(starts: TColumn, ends: TColumn) -> tp.List[float]:
+    """
+    Vectorized operations.haversine
+    :param starts: column with [longitude, latitude] of start points
+    :param ends: column with [longitude, latitude] of end points
+    :return: distances between points in km
+    """
+    lon_1 = map(math.radians, map(operator.itemgetter(0), starts))
+    lat_1 = list(map(math.radians, map(operator.itemgetter(1), starts)))
+    lon_2 = map(math.radians, map(operator.itemgetter(0), ends))
+    lat_2 = list(map(math.radians, map(operator.itemgetter(1), ends)))
+    sin_lon = map(math.sin, map(operator.truediv, map(operator.sub, lon_2, lon_1), repeat(2)))
+    sin_lat = map(math.sin, map(operator.truediv, map(operator.sub, lat_2, lat_1), repeat(2)))
+    cos_lat = map(operator.mul, map(math.cos, lat_1), map(math.cos, lat_2))
+    a = map(operator.add, map(pow, sin_lat, repeat(2)), map(operator.mul, cos_lat, map(pow, sin_lon, repeat(2))))
+    return [ops.EARTH_RADIUS * (2 * math.asin(x)) for x in map(math.sqrt, a)]
+
+
+class Length(BatchMapper):
+    """Vectorized operations.Length, lengths of cached edges are not computed"""
+    def __init__(self, mapper: ops.Length) -> None:
+        """
+        :param mapper: row mapper to take columns and cache of lengths from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        starts = batch[self.mapper.start_column]
+        ends = batch[self.mapper.end_column]
+        lengths = self.mapper.lengths
+        if lengths is None or self.mapper.edge_id_column is None:
+            yield {**batch, self.mapper.length_column: haversine(starts, ends)}
+            return
+        edge_ids = batch[self.mapper.edge_id_column]
+        length: tp.List[tp.Optional[float]] = list(map(lengths.get, edge_ids, starts, ends))
+        missing = [index for index, value in enumerate(length) if value is None]
+        if missing:
+            computed = haversine([starts[index] for index in missing], [ends[index] for index in missing])
+            for index, value in zip(missing, computed):
+                length[index] = value
+                lengths.put(edge_ids[index], starts[index], ends[index], value)
+        yield {**batch, self.mapper.length_column: length}
+
+
+class Speed(BatchMapper):
+    """Vectorized operations.Speed"""
+    def __init__(self, mapper: ops.Speed) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        speed = list(map(operator.truediv, batch[self.mapper.length_column], batch[self.mapper.dt_column]))
+        yield {**batch, self.mapper.result_column: speed}
+
+
+class Product(BatchMapper):
+    """Vectorized operations.Product"""
+    def __init__(self, mapper: ops.Product) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        result: tp.List[tp.Any] = [1.] * batch_length(batch)
+        for column in self.mapper.columns:
+            result = list(map(operator.mul, result, batch[column]))
+        yield {**batch, self.mapper.result_column: result}
+
+
+class Idf(BatchMapper):
+    """Vectorized operations.Idf"""
+    def __init__(self, mapper: ops.Idf) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        ratio = map(operator.truediv, batch[self.mapper.total_doc_count], batch[self.mapper.doc_with_word_count])
+        yield {**batch, self.mapper.result_column: list(map(math.log, ratio))}
+
+
+class DeltaTime(BatchMapper):
+    """Vectorized operations.DeltaTime"""
+    def __init__(self, mapper: ops.DeltaTime) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        deltas = map(operator.sub, batch[self.mapper.leave_time], batch[self.mapper.enter_time])
+        hours = [delta.total_seconds() / (60 ** 2) for delta in deltas]
+        yield {**batch, self.mapper.result_column: hours}
+
+
+class FormatDate(BatchMapper):
+    """Vectorized operations.FormatDate"""
+    def __init__(self, mapper: ops.FormatDate) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        yield {**batch, self.mapper.result_column: list(map(ops.parse_datetime, batch[self.mapper.date_column]))}
+
+
+class WeekDay(BatchMapper):
+    """Vectorized operations.WeekDay"""
+    def __init__(self, mapper: ops.WeekDay) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        weekdays = map(ops.WEEKDAYS.__getitem__, map(operator.methodcaller('weekday'), batch[self.mapper.date_column]))
+        yield {**batch, self.mapper.result_column: list(weekdays)}
+
+
+class Hour(BatchMapper):
+    """Vectorized operations.Hour"""
+    def __init__(self, mapper: ops.Hour) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        hours = map(operator.attrgetter('hour'), batch[self.mapper.date_column])
+        yield {**batch, self.mapper.result_column: list(hours)}
+
+
+class Prune(BatchMapper):
+    """Vectorized operations.Prune, whole columns are dropped"""
+    def __init__(self, mapper: ops.Prune) -> None:
+        """
+        :param mapper: row mapper to take columns from
+        """
+        self.mapper = mapper
+
+    def __call__(self, batch: TBatch) -> TBatchesGenerator:
+        yield {column: values for column, values in batch.items() if column in self.mapper.columns}
+
+
+VECTORIZED: tp.Dict[tp.Type[ops.Mapper], tp.Callable[[tp.Any], BatchMapper]] = {
+    ops.Length: Length,
+    ops.Speed: Speed,
+    ops.Product: Product,
+    ops.Idf: Idf,
+    ops.DeltaTime: DeltaTime,
+    ops.FormatDate: FormatDate,
+    ops.WeekDay: WeekDay,
+    ops.Hour: Hour,
+    ops.Prune: Prune,
+}
+
+
+def vectorize(mappers: tp.Sequence[ops.Mapper]) -> tp.List[BatchMapper]:
+    """
+    :param mappers: chain of row mappers
+    :return: chain of vectorized versions of mappers, consecutive mappers without them are run row by row
+    """
+    batch_mappers: tp.List[BatchMapper] = []
+    row_mappers: tp.List[ops.Mapper] = []
+    for mapper in mappers:
+        if type(mapper) in VECTORIZED:
+            if row_mappers:
+                batch_mappers.append(RowMapper(row_mappers))
+                row_mappers = []
+            batch_mappers.append(VECTORIZED[type(mapper)](mapper))
+        else:
+            row_mappers.append(mapper)
+    if row_mappers:
+        batch_mappers.append(RowMapper(row_mappers))
+    return batch_mappers
+
+
+class BatchMap(ops.Operation):
+    """Apply chain of mappers to rows grouped into column batches"""
+    def __init__(self, mappers: tp.Sequence[ops.Mapper], batch_rows: tp.Optional[int] = None) -> None:
+        """
+        :param mappers: mappers to apply one after another
+        :param batch_rows: maximum number of rows in batch, COLUMNAR_BATCH_ROWS by default
+        """
+        self.mappers = mappers
+        self.batch_mappers = vectorize(mappers)
+        self.batch_rows = batch_rows
+
+    def _apply(self, batches: tp.Iterable[TBatch], index: int) -> TBatchesGenerator:
+        if index == len(self.batch_mappers):
+            yield from batches
+            return
+        for batch in batches:
+            yield from self._apply(self.batch_mappers[index](batch), index + 1)
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        for batch in self._apply(to_batches(rows, self.batch_rows), 0):
+            yield from to_rows(batch)
+
+
+class BatchReduce(ops.Operation):
+    """
+    Hash aggregation over column batches for Count, Sum and Mean reducers. Only one accumulator per group is
+    kept, groups are emitted sorted by key like operations.Reduce over sorted rows does.
+    """
+    REDUCERS = (ops.Count, ops.Sum, ops.Mean)
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str], sort_keys: tp.Optional[tp.Sequence[str]] = None,
+                 batch_rows: tp.Optional[int] = None) -> None:
+        """
+        :param reducer: one of REDUCERS
+        :param keys: column names for reducer
+        :param sort_keys: keys in order groups are emitted in, keys by default
+        :param batch_rows: maximum number of rows in batch, COLUMNAR_BATCH_ROWS by default
+        """
+        assert type(reducer) in self.REDUCERS, f'Reducer {type(reducer).__name__} is not vectorized'
+        self.reducer = reducer
+        self.keys = keys
+        self.sort_keys = sort_keys if sort_keys is not None else keys
+        self.batch_rows = batch_rows
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        groups: tp.Dict[tp.Tuple[tp.Any, ...], int] = {}
+        counts: tp.List[int] = []
+        sums: tp.List[tp.Any] = []
+        for batch in to_batches(rows, self.batch_rows):
+            indices = [groups.setdefault(key, len(groups))
+                       for key in zip(*[batch[key] for key in self.sort_keys])]
+            if len(groups) > len(counts):
+                counts.extend([0] * (len(groups) - len(counts)))
+                sums.extend([0] * (len(groups) - len(sums)))
+            for index in indices:
+                counts[index] += 1
+            if not isinstance(self.reducer, ops.Count):
+                for index, value in zip(indices, batch[self.reducer.column]):
+                    sums[index] += value
+        for key in sorted(groups):
+            group = groups[key]
+            new_row = {column: value for column, value in zip(self.sort_keys, key)}
+            if isinstance(self.reducer, ops.Count):
+                new_row[self.reducer.column] = counts[group]
+            elif isinstance(self.reducer, ops.Sum):
+                new_row[self.reducer.column] = sums[group]
+            else:
+                new_row[self.reducer.column] = sums[group] / counts[group]
+            yield new_row
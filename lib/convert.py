@@ -0,0 +1,70 @@
+"""
+Convert files of rows between formats and benchmark parsing of them. Run from directory containing the package:
+    python -m package.lib.convert convert input.txt output.rows --to binary
+    python -m package.lib.convert benchmark package/resource/*.txt --scale 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+import typing as tp
+
+from . import readers
+
+
+def _eval_reader(filename: str) -> tp.Iterator[tp.Any]:
+    with open(filename, 'r') as file:
+        for line in file:
+            if line and not line.isspace():
+                yield eval(line)
+
+
+def benchmark(filenames: tp.Sequence[str], scale: int) -> tp.List[tp.Tuple[str, str, int, float]]:
+    """
+    Measure time of reading every file repeated scale times in every format, eval of lines is measured for
+    comparison. Return list of file name, format, number of rows and seconds.
+    :param filenames: files with rows in literal format
+    :param scale: number of repetitions of rows of file
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for filename in filenames:
+            rows = list(readers.make_reader('literal')(filename))
+            scaled = rows * scale
+            formats: tp.List[tp.Tuple[str, tp.Callable[[str], tp.Iterable[tp.Any]], str]] = [
+                ('eval', _eval_reader, 'literal')
+            ]
+            formats.extend((name, reader, name) for name, reader in readers.READERS.items())
+            for name, reader, written in formats:
+                path = os.path.join(directory, f'{os.path.basename(filename)}.{written}')
+                if not os.path.exists(path):
+                    readers.WRITERS[written](path, scaled)
+                start = time.perf_counter()
+                count = sum(1 for _ in reader(path))
+                results.append((filename, name, count, time.perf_counter() - start))
+    return results
+
+
+def main(args: tp.Optional[tp.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help='convert file of rows to another format')
+    convert.add_argument('source')
+    convert.add_argument('target')
+    convert.add_argument('--from', dest='source_format', choices=sorted(readers.READERS), default='literal')
+    convert.add_argument('--to', dest='target_format', choices=sorted(readers.WRITERS), default='binary')
+    bench = commands.add_parser('benchmark', help='compare speed of reading files in different formats')
+    bench.add_argument('filenames', nargs='+')
+    bench.add_argument('--scale', type=int, default=10000, help='number of repetitions of rows of every file')
+    options = parser.parse_args(args)
+
+    if options.command == 'convert':
+        count = readers.convert(options.source, options.target, options.source_format, options.target_format)
+        print(f'Converted {count} rows')
+        return
+    for filename, name, count, seconds in benchmark(options.filenames, options.scale):
+        print(f'{filename:40} {name:8} {count:9} rows {seconds:8.3f} s {count / max(seconds, 1e-9):12.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,244 @@
+import heapq
+import os
 import typing as tp
 
+from itertools import chain, groupby
 from multiprocessing import Pipe, Process, connection
 from operator import itemgetter
+from os import environ
 
 from . import operations as ops
+from . import spill
+from . import transport
 
+SORT_MEMORY_LIMIT = int(environ.get("SORT_MEMORY_LIMIT", str(16 * 1024 ** 2)))  # in bytes
+SORT_WORKERS = int(environ.get("SORT_WORKERS", "1"))
+SORT_MERGE_FAN_IN = int(environ.get("SORT_MERGE_FAN_IN", "64"))
 
-def do_sort(endpoint: connection.Connection, keys: tp.Tuple[str, ...]) -> None:
-    rows = []
-    while True:
-        row = endpoint.recv()
-        if row is None:
-            break
-        rows.append(row)
-    rows.sort(key=itemgetter(*keys))
-    for row in rows:
-        endpoint.send(row)
-    endpoint.send(None)
+
+def sort_key(keys: tp.Sequence[str]) -> tp.Callable[[ops.TRow], tp.Any]:
+    """
+    Make key function for sorting rows by columns
+    :param keys: name of columns to sort by
+    """
+    if not keys:
+        return lambda row: ()
+    return itemgetter(*keys)
+
+
+def chunk_rows(chunk_bytes: int, rows_size: int, rows_count: int) -> int:
+    """
+    Number of rows in one spilled chunk so that chunk read back during merge fits into its share of memory budget
+    :param chunk_bytes: memory available for one chunk in bytes
+    :param rows_size: total size of measured rows in bytes
+    :param rows_count: number of measured rows
+    """
+    if not rows_count:
+        return spill.CHUNK_ROWS
+    return max(1, min(spill.CHUNK_ROWS, chunk_bytes * rows_count // max(1, rows_size)))
+
+
+def spill_run(items: tp.List[tp.Tuple[int, ops.TRow]], keys: tp.Sequence[str], directory: str,
+              rows_in_chunk: int) -> str:
+    """
+    Sort numbered rows in memory and write them to new run file, return path to it
+    :param items: pairs of row number in input and row
+    :param keys: name of columns to sort by
+    :param directory: directory for run files
+    :param rows_in_chunk: number of rows in one pickled chunk of run file
+    """
+    key_func = sort_key(keys)
+    items.sort(key=lambda item: key_func(item[1]))
+    path = spill.run_path(directory, 'sort-')
+    spill.write_rows(path, items, rows_in_chunk)
+    return path
+
+
+def do_sort(channel: transport.Channel, endpoint: connection.Connection, keys: tp.Tuple[str, ...],
+            memory_limit: int, chunk_bytes: int, directory: str) -> None:
+    """
+    Receive batches of rows, spill sorted runs of bounded size to disk and send back paths to them
+    together with number of rows per chunk to use for merged runs
+    :param channel: channel to receive batches from, every batch is a pair of first row number and rows
+    :param endpoint: connection to send paths to runs through
+    :param keys: name of columns to sort by
+    :param memory_limit: approximate size of one run in bytes
+    :param chunk_bytes: approximate size of one chunk of run file in bytes
+    :param directory: directory for run files
+    """
+    channel.open(sending=False)
+    runs: tp.List[str] = []
+    items: tp.List[tp.Tuple[int, ops.TRow]] = []
+    size = 0
+    total_size = 0
+    total_count = 0
+    for first_index, rows in transport.receive(channel):
+        for item in enumerate(rows, first_index):
+            items.append(item)
+            size += spill.row_size(item[1])
+            if size >= memory_limit:
+                total_size += size
+                total_count += len(items)
+                runs.append(spill_run(items, keys, directory, chunk_rows(chunk_bytes, size, len(items))))
+                items = []
+                size = 0
+    if items:
+        total_size += size
+        total_count += len(items)
+        runs.append(spill_run(items, keys, directory, chunk_rows(chunk_bytes, size, len(items))))
+    endpoint.send((runs, chunk_rows(chunk_bytes, total_size, total_count)))
+
+
+def merge_runs(runs: tp.Sequence[str], keys: tp.Sequence[str]) -> ops.TRowsGenerator:
+    """
+    Lazily k-way merge sorted run files of numbered rows, rows with equal keys keep their order in input
+    :param runs: paths to run files
+    :param keys: name of columns rows are sorted by
+    """
+    key_func = sort_key(keys)
+    yield from heapq.merge(*[spill.read_rows(path) for path in runs], key=lambda item: (key_func(item[1]), item[0]))
+
+
+def reduce_runs(runs: tp.List[str], keys: tp.Sequence[str], directory: str, fan_in: int,
+                rows_in_chunk: int) -> tp.List[str]:
+    """
+    Merge groups of at most fan_in runs into intermediate runs until at most fan_in runs are left
+    :param runs: paths to run files, merged files are removed
+    :param keys: name of columns rows are sorted by
+    :param directory: directory for run files
+    :param fan_in: maximum number of runs merged at once
+    :param rows_in_chunk: number of rows in one pickled chunk of intermediate run file
+    """
+    while len(runs) > fan_in:
+        merged_runs: tp.List[str] = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start + fan_in]
+            if len(group) == 1:
+                merged_runs.extend(group)
+                continue
+            path = spill.run_path(directory, 'merge-')
+            spill.write_rows(path, merge_runs(group, keys), rows_in_chunk)
+            for run in group:
+                os.remove(run)
+            merged_runs.append(path)
+        runs = merged_runs
+    return runs
 
 
 class ExternalSort(ops.Operation):
     """
-    In order to not account materialization during sorting in main process memory consumption, we delegate
-    sorting to a separate process.
-    This class illustrates cross-process streaming.
+    External merge sort. Incoming rows are grouped into batches which are fanned out to worker processes
+    through shared memory or pipes. Each worker splits its rows into runs of bounded size, sorts them in memory
+    and spills to temporary files; main process merges the runs back, at most SORT_MERGE_FAN_IN of them at once,
+    the last merge pass is lazy. Sort is stable.
     """
 
-    def __init__(self, keys: tp.Sequence[str]):
+    def __init__(self, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None,
+                 workers: tp.Optional[int] = None):
+        """
+        :param keys: name of columns to sort by
+        :param memory_limit: approximate memory budget of the sort in bytes, SORT_MEMORY_LIMIT by default
+        :param workers: number of worker processes, SORT_WORKERS by default
+        """
+        if memory_limit is not None and memory_limit <= 0:
+            raise ValueError(f'Memory limit of sort must be positive, got {memory_limit}')
         self.keys = keys
+        self.memory_limit = memory_limit
+        self.workers = workers
+
+    @staticmethod
+    def _send(channels: tp.List[transport.Channel], processes: tp.List[Process], worker: int, data: bytes) -> None:
+        try:
+            channels[worker].send_bytes(data)
+        except BrokenPipeError:
+            processes[worker].join()
+            raise RuntimeError(f'Sort worker exited with code {processes[worker].exitcode}') from None
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        memory_limit = self.memory_limit if self.memory_limit is not None else SORT_MEMORY_LIMIT
+        workers = max(1, self.workers if self.workers is not None else SORT_WORKERS)
+        fan_in = max(2, SORT_MERGE_FAN_IN)
+        if memory_limit <= 0:
+            raise ValueError(f'Memory limit of sort must be positive, got {memory_limit}')
+        directory = spill.make_directory()
+        channels: tp.List[transport.Channel] = []
+        endpoints: tp.List[connection.Connection] = []
+        processes: tp.List[Process] = []
+        for _ in range(workers):
+            channel = transport.make_channel()
+            local_endpoint, remote_endpoint = Pipe(duplex=False)
+            process = Process(target=do_sort, args=(channel, remote_endpoint, tuple(self.keys),
+                                                    max(1, memory_limit // workers), max(1, memory_limit // fan_in),
+                                                    directory))
+            process.start()
+            remote_endpoint.close()
+            channel.open(sending=True, peer=process)
+            channels.append(channel)
+            endpoints.append(local_endpoint)
+            processes.append(process)
+        try:
+            row_count_before = 0
+            for batch_number, (count, data) in enumerate(transport.batched(rows)):
+                self._send(channels, processes, batch_number % workers, data)
+                row_count_before += count
+            runs: tp.List[str] = []
+            rows_in_chunk = spill.CHUNK_ROWS
+            for worker in range(workers):
+                self._send(channels, processes, worker, b'')
+            for endpoint, process in zip(endpoints, processes):
+                try:
+                    worker_runs, worker_rows_in_chunk = endpoint.recv()
+                except EOFError:
+                    process.join()
+                    raise RuntimeError(f'Sort worker exited with code {process.exitcode}') from None
+                runs.extend(worker_runs)
+                rows_in_chunk = min(rows_in_chunk, worker_rows_in_chunk)
+            for process in processes:
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f'Sort worker exited with code {process.exitcode}')
+            runs = reduce_runs(runs, self.keys, directory, fan_in, rows_in_chunk)
+            row_count_after = 0
+            for _, row in merge_runs(runs, self.keys):
+                yield row
+                row_count_after += 1
+            assert row_count_before == row_count_after
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            for channel in channels:
+                channel.close()
+            spill.remove_directory(directory)
+
+
+class GroupSort(ops.Operation):
+    """
+    Sort of rows which are already sorted by prefix of keys: every group of rows with equal prefix is sorted
+    separately, in memory while it fits into memory budget and by external sort otherwise
+    """
+
+    def __init__(self, sort: ExternalSort, prefix: int):
+        """
+        :param sort: full sort to replace
+        :param prefix: number of first keys of sort rows are already sorted by
+        """
+        self.sort = sort
+        self.prefix = prefix
 
     def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
-        local_endpoint, remote_endpoint = Pipe()
-        process = Process(target=do_sort, args=(remote_endpoint, self.keys))
-        process.start()
-        row_count_before = 0
-        for row in rows:
-            local_endpoint.send(row)
-            row_count_before += 1
-        local_endpoint.send(None)
-        row_count_after = 0
-        while True:
-            local_endpoint_row = local_endpoint.recv()
-            if local_endpoint_row is None:
-                break
-            yield local_endpoint_row
-            row_count_after += 1
-        assert row_count_before == row_count_after
-        process.join()
+        memory_limit = self.sort.memory_limit if self.sort.memory_limit is not None else SORT_MEMORY_LIMIT
+        key_func = sort_key(self.sort.keys)
+        for _, group in groupby(rows, sort_key(self.sort.keys[:self.prefix])):
+            buffer: tp.List[ops.TRow] = []
+            size = 0
+            for row in group:
+                buffer.append(row)
+                size += spill.row_size(row)
+                if size >= memory_limit:
+                    yield from self.sort(chain(buffer, group))
+                    break
+            else:
+                buffer.sort(key=key_func)
+                yield from buffer
@@ -0,0 +1,79 @@
+import typing as tp
+
+from . import operations as ops
+
+TInline = tp.Callable[[tp.Any, str, str], tp.Tuple[tp.List[str], str, bool]]
+
+
+def _filter(mapper: ops.Filter, name: str, row: str) -> tp.Tuple[tp.List[str], str, bool]:
+    return [f'if {name}.condition({row}):'], row, True
+
+
+def _project(mapper: ops.Project, name: str, row: str) -> tp.Tuple[tp.List[str], str, bool]:
+    new_row = f'{row}_p'
+    return [f'{new_row} = {{column: {row}[column] for column in {name}.columns}}'], new_row, False
+
+
+def _prune(mapper: ops.Prune, name: str, row: str) -> tp.Tuple[tp.List[str], str, bool]:
+    new_row = f'{row}_p'
+    return [f'{new_row} = {{column: value for column, value in {row}.items() if column in {name}.columns}}'], \
+        new_row, False
+
+
+def _lower_case(mapper: ops.LowerCase, name: str, row: str) -> tp.Tuple[tp.List[str], str, bool]:
+    return [f'{row}[{name}.column] = {row}[{name}.column].lower()'], row, False
+
+
+def _dummy(mapper: ops.DummyMapper, name: str, row: str) -> tp.Tuple[tp.List[str], str, bool]:
+    return [], row, False
+
+
+# Code templates of mappers which are inlined into fused loop: they take mapper, name of variable with mapper
+# and name of variable with row, and return lines of code, name of variable with result row and whether
+# following code is nested into the last line. Subclasses are not inlined as they may override __call__.
+INLINED: tp.Dict[tp.Type[ops.Mapper], TInline] = {
+    ops.Filter: _filter,
+    ops.Project: _project,
+    ops.Prune: _prune,
+    ops.LowerCase: _lower_case,
+    ops.DummyMapper: _dummy,
+}
+
+
+def compile_mappers(mappers: tp.Sequence[ops.Mapper]) -> tp.Callable[[ops.TRowsIterable], ops.TRowsGenerator]:
+    """
+    Generate function applying chain of mappers to rows in one loop. Mappers from INLINED are inlined,
+    other mappers are called in nested loops.
+    :param mappers: mappers to apply one after another
+    :return: function from rows to generator of result rows
+    """
+    namespace: tp.Dict[str, tp.Any] = {}
+    lines = ['def fused(rows):', '    for row_0 in rows:']
+    indent = 2
+    row = 'row_0'
+    for index, mapper in enumerate(mappers, 1):
+        name = f'mapper_{index}'
+        namespace[name] = mapper
+        if type(mapper) in INLINED:
+            code, row, nested = INLINED[type(mapper)](mapper, name, row)
+        else:
+            code, row, nested = [f'for row_{index} in {name}({row}):'], f'row_{index}', True
+        lines.extend('    ' * indent + line for line in code)
+        if nested:
+            indent += 1
+    lines.append('    ' * indent + f'yield {row}')
+    exec(compile('\n'.join(lines), '<fused map>', 'exec'), namespace)
+    return tp.cast(tp.Callable[[ops.TRowsIterable], ops.TRowsGenerator], namespace['fused'])
+
+
+class FusedMap(ops.Operation):
+    """Apply chain of mappers to rows in one generated loop instead of chain of Map operations"""
+    def __init__(self, mappers: tp.Sequence[ops.Mapper]) -> None:
+        """
+        :param mappers: mappers to apply one after another
+        """
+        self.mappers = mappers
+        self._fused = compile_mappers(mappers)
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from self._fused(rows)
@@ -1,75 +1,350 @@
+import functools
+import itertools
+import os
+import sys
+import types
 import typing as tp
+
+from os import environ
+
 from . import operations as ops
+from . import columnar
 from . import external_sort as es
-from copy import deepcopy
+from . import fusion
+from . import hashing
+from . import parallel
+from . import readers as rd
+from . import shuffle as shuffle_lib
+from . import spill
+from . import tee
+from . import transport
+
+COLUMNAR = int(environ.get("COLUMNAR", "0"))
+
+
+def freeze(value: tp.Any) -> tp.Hashable:
+    """
+    Make hashable description of value used to compare configuration of operations
+    :param value: value to describe
+    """
+    if value is None or isinstance(value, (str, bytes, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((repr(key), freeze(item)) for key, item in value.items()))
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType, types.MethodType)) \
+            or not hasattr(value, '__dict__'):
+        return 'id', id(value)
+    return type(value), freeze(vars(value))
 
 
 class Node:
-    """Parent class for nodes of graph"""
-    def __init(self) -> None:
-        pass
+    """Parent class for nodes of graph. Nodes are immutable, so extended graphs share their nodes"""
+    __slots__ = ()
+    input_names: tp.Tuple[str, ...] = ()
+
+    def __setattr__(self, name: str, value: tp.Any) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
 
-    def run(self) -> ops.TRowsGenerator:
+    def _set(self, **attributes: tp.Any) -> None:
         """
-        create generator of rows through this node
+        initialize attributes of node, used only in constructors
         """
-        pass
+        for name, value in attributes.items():
+            object.__setattr__(self, name, value)
+
+    def inputs(self) -> tp.List['Node']:
+        """
+        nodes this node reads rows from
+        """
+        return [getattr(self, name) for name in self.input_names]
+
+    def with_inputs(self, inputs: tp.Sequence['Node']) -> 'Node':
+        """
+        :param inputs: new input nodes in order of inputs()
+        :return: copy of this node reading rows from other nodes, or node itself if inputs are the same
+        """
+        if all(new is old for new, old in zip(inputs, self.inputs())):
+            return self
+        node = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                object.__setattr__(node, name, getattr(self, name))
+        node._set(**dict(zip(self.input_names, inputs)))
+        return node
+
+    def signature(self) -> tp.Hashable:
+        """
+        description of operation of this node, nodes with equal signatures and equal inputs produce equal rows
+        """
+        return 'id', id(self)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        """
+        :param orderings: columns rows of every input are sorted by
+        :return: columns output rows are sorted by
+        """
+        return ()
+
+    def required_columns(self, needed: ops.TColumns) -> tp.List[ops.TColumns]:
+        """
+        :param needed: columns of output rows read by following nodes, None if all of them
+        :return: columns of rows of every input this node needs, None if all of them
+        """
+        return [None] * len(self.input_names)
+
+    def output_columns(self, columns: tp.Sequence[ops.TColumns]) -> ops.TColumns:
+        """
+        :param columns: columns rows of every input may have, None if unknown
+        :return: columns output rows may have, None if unknown
+        """
+        return None
+
+    def optimize(self, inputs: tp.Sequence['Node'], orderings: tp.Sequence[ops.TOrdering],
+                 exclusive: tp.Sequence[bool]) -> 'Node':
+        """
+        Planning step: make node equivalent to this one reading rows from already planned inputs,
+        result is either one of inputs or node reading from them or from their inputs
+        :param inputs: planned input nodes
+        :param orderings: columns rows of every planned input are sorted by
+        :param exclusive: whether every input is read by this node only
+        """
+        return self.with_inputs(inputs)
+
+    def describe(self) -> str:
+        """
+        short description of node used when printing plan
+        """
+        return type(self).__name__[:-len('Node')]
+
+    def skew(self) -> tp.Optional[shuffle_lib.Skew]:
+        """
+        number of rows in partitions of shuffle stage of this node, known after it runs
+        """
+        return None
 
-    def add_source(self, source: tp.Callable[[], ops.TRowsGenerator]) -> None:
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
         """
-        add fabric of generators of rows to node
+        create generator of rows through this node
+        :param executor: executor providing rows of input nodes and data sources
         """
         pass
 
 
 class SourceNode(Node):
-    """Graph node receiving date from source"""
-    def __init__(self) -> None:
-        self.source: tp.Callable[[], ops.TRowsGenerator]
+    """Graph node receiving date from source passed to run"""
+    __slots__ = ('name',)
 
-    def add_source(self, source: tp.Callable[[], ops.TRowsGenerator]) -> None:
+    def __init__(self, name: str) -> None:
         """
-        :param source: fabric of generators of rows
+        :param name: name of kwarg to use as data source
         """
-        self.source = source
+        self._set(name=name)
+
+    def signature(self) -> tp.Hashable:
+        return 'source', self.name
 
-    def run(self) -> ops.TRowsGenerator:
-        for row in self.source():
+    def describe(self) -> str:
+        return f'Source({self.name!r})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        for row in executor.source(self.name)():
             yield row
 
 
+class FileSourceNode(Node):
+    """Graph node reading date from file"""
+    __slots__ = ('filename', 'reader', 'start', 'end')
+
+    def __init__(self, filename: str, reader: rd.Reader, start: int = 0, end: tp.Optional[int] = None) -> None:
+        """
+        :param filename: filename to read from
+        :param reader: reader of rows from file
+        :param start: offset of range of file to read in bytes
+        :param end: end of range of file, None for end of file
+        """
+        self._set(filename=filename, reader=reader, start=start, end=end)
+
+    def signature(self) -> tp.Hashable:
+        return 'file', self.filename, freeze(self.reader), self.start, self.end
+
+    def describe(self) -> str:
+        if self.start or self.end is not None:
+            return f'FileSource({self.filename!r}, start={self.start}, end={self.end})'
+        return f'FileSource({self.filename!r})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.reader(self.filename, self.start, self.end)
+
+
 class MapNode(Node):
     """ Graph node applying map to date from previous node"""
+    __slots__ = ('source', 'map')
+    input_names = ('source',)
+
     def __init__(self, source: Node, mapper: ops.Mapper) -> None:
         """
         :param source: previous node
         :param mapper: mapper to construct map operation from
         """
-        self.source = source
-        self.map = ops.Map(mapper)
+        self._set(source=source, map=ops.Map(mapper))
+
+    def signature(self) -> tp.Hashable:
+        return 'map', freeze(self.map.mapper)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return self.map.mapper.ordering(orderings[0])
+
+    def required_columns(self, needed: ops.TColumns) -> tp.List[ops.TColumns]:
+        return [self.map.mapper.required_columns(needed)]
+
+    def output_columns(self, columns: tp.Sequence[ops.TColumns]) -> ops.TColumns:
+        return self.map.mapper.output_columns(columns[0])
+
+    def optimize(self, inputs: tp.Sequence[Node], orderings: tp.Sequence[ops.TOrdering],
+                 exclusive: tp.Sequence[bool]) -> Node:
+        # Chain of maps is fused into one loop, map whose output is shared ends the chain
+        source = inputs[0]
+        if exclusive[0] and isinstance(source, (MapNode, FusedMapNode)):
+            return FusedMapNode(source.source, [*mappers_of(source), self.map.mapper])
+        return self.with_inputs(inputs)
+
+    def describe(self) -> str:
+        return f'Map({type(self.map.mapper).__name__})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.map(executor.rows(self.source))
+
+
+class FusedMapNode(Node):
+    """Graph node applying chain of mappers to date from previous node in one loop"""
+    __slots__ = ('source', 'map')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, mappers: tp.Sequence[ops.Mapper]) -> None:
+        """
+        :param source: previous node
+        :param mappers: mappers to apply one after another
+        """
+        self._set(source=source, map=fusion.FusedMap(mappers))
+
+    def signature(self) -> tp.Hashable:
+        return 'fused_map', freeze(self.map.mappers)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        ordering = orderings[0]
+        for mapper in self.map.mappers:
+            ordering = mapper.ordering(ordering)
+        return ordering
+
+    def describe(self) -> str:
+        return f'FusedMap({" -> ".join(type(mapper).__name__ for mapper in self.map.mappers)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.map(executor.rows(self.source))
+
 
-    def run(self) -> ops.TRowsGenerator:
-        yield from self.map(self.source.run())
+def mappers_of(node: tp.Union[MapNode, FusedMapNode]) -> tp.List[ops.Mapper]:
+    """
+    :param node: node applying one or several mappers
+    :return: mappers applied by node one after another
+    """
+    if isinstance(node, MapNode):
+        return [node.map.mapper]
+    return list(node.map.mappers)
 
 
 class ReduceNode(Node):
     """Graph node applying reduce operation to date from previous node"""
+    __slots__ = ('source', 'reduce')
+    input_names = ('source',)
+
     def __init__(self, source: Node, reducer: ops.Reducer, keys: tp.Sequence[str]) -> None:
         """
         :param source: previous node
         :param reducer: reducer to construct reduce operation from
         :param keys: name of columns for reduce operation
         """
-        self.source = source
-        self.reduce = ops.Reduce(reducer, keys)
+        self._set(source=source, reduce=ops.Reduce(reducer, keys))
+
+    def signature(self) -> tp.Hashable:
+        return 'reduce', freeze(self.reduce.reducer), tuple(self.reduce.keys)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return self.reduce.reducer.ordering(self.reduce.keys, orderings[0])
+
+    def required_columns(self, needed: ops.TColumns) -> tp.List[ops.TColumns]:
+        return [self.reduce.reducer.required_columns(self.reduce.keys, needed)]
+
+    def output_columns(self, columns: tp.Sequence[ops.TColumns]) -> ops.TColumns:
+        return self.reduce.reducer.output_columns(self.reduce.keys, columns[0])
 
-    def run(self) -> ops.TRowsGenerator:
-        for row in self.reduce(self.source.run()):
+    def optimize(self, inputs: tp.Sequence[Node], orderings: tp.Sequence[ops.TOrdering],
+                 exclusive: tp.Sequence[bool]) -> Node:
+        # Sort made only to group rows for this reduce is replaced with hash aggregation. Sort for TopN may
+        # also order rows of groups by its column, as rows with equal values keep input order either way
+        source = inputs[0]
+        keys = self.reduce.keys
+        if exclusive[0] and isinstance(source, SortNode) and set(source.es.keys[:len(keys)]) == set(keys) \
+                and (len(source.es.keys) == len(keys) or type(self.reduce.reducer) is ops.TopN
+                     and list(source.es.keys[len(keys):]) == [self.reduce.reducer.column_max]):
+            return HashReduceNode(source.source, self.reduce.reducer, keys, source.es.memory_limit,
+                                  source.es.keys[:len(keys)])
+        return self.with_inputs(inputs)
+
+    def describe(self) -> str:
+        return f'Reduce({type(self.reduce.reducer).__name__}, keys={list(self.reduce.keys)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        for row in self.reduce(executor.rows(self.source)):
             yield row
 
 
+class HashReduceNode(Node):
+    """
+    Graph node applying reduce operation with hash aggregation to unsorted date from previous node,
+    TopN reducer keeps only top rows of every group, reducer with combiner keeps only partial row
+    """
+    __slots__ = ('source', 'reduce')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, reducer: ops.Reducer, keys: tp.Sequence[str],
+                 memory_limit: tp.Optional[int] = None, sort_keys: tp.Optional[tp.Sequence[str]] = None) -> None:
+        """
+        :param source: previous node
+        :param reducer: reducer to construct reduce operation from
+        :param keys: name of columns for reduce operation
+        :param memory_limit: memory budget of hash table in bytes
+        :param sort_keys: keys in order groups are emitted in
+        """
+        if type(reducer) is ops.TopN:
+            self._set(source=source, reduce=hashing.HashTopN(reducer, keys, memory_limit, sort_keys))
+        elif reducer.combiner(keys) is not None:
+            self._set(source=source, reduce=hashing.CombineReduce(reducer, keys, memory_limit, sort_keys))
+        else:
+            self._set(source=source, reduce=hashing.HashReduce(reducer, keys, memory_limit, sort_keys))
+
+    def signature(self) -> tp.Hashable:
+        return 'hash_reduce', freeze(self.reduce)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return self.reduce.reducer.ordering(self.reduce.keys, tuple(self.reduce.sort_keys))
+
+    def describe(self) -> str:
+        return f'{type(self.reduce).__name__}({type(self.reduce.reducer).__name__}, keys={list(self.reduce.sort_keys)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.reduce(executor.rows(self.source))
+
+
 class JoinNode(Node):
     """Graph node applying join operation to date from two previous nodes"""
+    __slots__ = ('left', 'right', 'join')
+    input_names = ('left', 'right')
+
     def __init__(self, left: Node, right: Node, joiner: ops.Joiner, keys: tp.Sequence[str]) -> None:
         """
         :param left: previous left node
@@ -77,36 +352,770 @@ class JoinNode(Node):
         :param joiner: particular joiner for join operation
         :param keys: name of columns for join operation
         """
-        self.left = left
-        self.right = right
-        self.join = ops.Join(joiner, keys)
+        self._set(left=left, right=right, join=ops.Join(joiner, keys))
+
+    def signature(self) -> tp.Hashable:
+        return 'join', freeze(self.join.joiner), tuple(self.join.keys)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        keys = tuple(self.join.keys)
+        if all(ordering[:len(keys)] == keys for ordering in orderings):
+            return keys
+        return ()
+
+    def required_columns(self, needed: ops.TColumns) -> tp.List[ops.TColumns]:
+        return [self.join.joiner.required_columns(self.join.keys, needed)] * 2
+
+    def output_columns(self, columns: tp.Sequence[ops.TColumns]) -> ops.TColumns:
+        return self.join.joiner.output_columns(self.join.keys, columns[0], columns[1])
+
+    def optimize(self, inputs: tp.Sequence[Node], orderings: tp.Sequence[ops.TOrdering],
+                 exclusive: tp.Sequence[bool]) -> Node:
+        # Join on empty keys is cross join, right table is materialized once instead of grouping both tables
+        if not self.join.keys and ops.BroadcastJoin.supports(self.join.joiner):
+            return BroadcastJoinNode(inputs[0], inputs[1], self.join.joiner)
+        return self.with_inputs(inputs)
+
+    def describe(self) -> str:
+        return f'Join({type(self.join.joiner).__name__}, keys={list(self.join.keys)})'
 
-    def run(self) -> ops.TRowsGenerator:
-        for row in self.join(self.left.run(), self.right.run()):
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        for row in self.join(executor.rows(self.left), executor.rows(self.right)):
             yield row
 
 
+class BroadcastJoinNode(Node):
+    """Graph node applying cross join to date from two previous nodes, right one is materialized"""
+    __slots__ = ('left', 'right', 'join')
+    input_names = ('left', 'right')
+
+    def __init__(self, left: Node, right: Node, joiner: ops.Joiner) -> None:
+        """
+        :param left: previous left node
+        :param right: previous right node
+        :param joiner: particular joiner for join operation
+        """
+        self._set(left=left, right=right, join=ops.BroadcastJoin(joiner))
+
+    def signature(self) -> tp.Hashable:
+        return 'broadcast_join', freeze(self.join.joiner)
+
+    def describe(self) -> str:
+        return f'BroadcastJoin({type(self.join.joiner).__name__})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.join(executor.rows(self.left), executor.rows(self.right))
+
+
+class HashJoinNode(Node):
+    """Graph node applying hash join operation to unsorted date from two previous nodes"""
+    __slots__ = ('left', 'right', 'join')
+    input_names = ('left', 'right')
+
+    def __init__(self, left: Node, right: Node, joiner: ops.Joiner, keys: tp.Sequence[str],
+                 memory_limit: tp.Optional[int] = None) -> None:
+        """
+        :param left: previous left node
+        :param right: previous right node
+        :param joiner: particular joiner for join operation
+        :param keys: name of columns for join operation
+        :param memory_limit: memory budget of hash index in bytes
+        """
+        self._set(left=left, right=right, join=hashing.HashJoin(joiner, keys, memory_limit))
+
+    def signature(self) -> tp.Hashable:
+        return 'hash_join', freeze(self.join)
+
+    def required_columns(self, needed: ops.TColumns) -> tp.List[ops.TColumns]:
+        return [self.join.joiner.required_columns(self.join.keys, needed)] * 2
+
+    def output_columns(self, columns: tp.Sequence[ops.TColumns]) -> ops.TColumns:
+        return self.join.joiner.output_columns(self.join.keys, columns[0], columns[1])
+
+    def describe(self) -> str:
+        return f'HashJoin({type(self.join.joiner).__name__}, keys={list(self.join.keys)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.join(executor.rows(self.left), executor.rows(self.right))
+
+
 class SortNode(Node):
     """Graph node which sort date from previous node"""
-    def __init__(self, source: Node, keys: tp.Sequence[str]) -> None:
+    __slots__ = ('source', 'es')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None,
+                 workers: tp.Optional[int] = None) -> None:
         """
         :param source: previous node
         :param keys: name of columns to sort by
+        :param memory_limit: memory budget of the sort in bytes
+        :param workers: number of sorting processes
         """
-        self.es = es.ExternalSort(keys)
-        self.source = source
+        self._set(source=source, es=es.ExternalSort(keys, memory_limit, workers))
+
+    def signature(self) -> tp.Hashable:
+        return 'sort', freeze(self.es)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return tuple(self.es.keys)
+
+    def required_columns(self, needed: ops.TColumns) -> tp.List[ops.TColumns]:
+        return [None if needed is None else needed | frozenset(self.es.keys)]
 
-    def run(self) -> ops.TRowsGenerator:
-        for row in self.es(self.source.run()):
+    def output_columns(self, columns: tp.Sequence[ops.TColumns]) -> ops.TColumns:
+        return columns[0]
+
+    def optimize(self, inputs: tp.Sequence[Node], orderings: tp.Sequence[ops.TOrdering],
+                 exclusive: tp.Sequence[bool]) -> Node:
+        # Sort of stream already sorted by keys is dropped, sort of stream sorted by their prefix is
+        # replaced with sort of groups with equal prefix
+        keys = tuple(self.es.keys)
+        prefix = 0
+        while prefix < min(len(keys), len(orderings[0])) and keys[prefix] == orderings[0][prefix]:
+            prefix += 1
+        if prefix == len(keys):
+            return inputs[0]
+        if prefix > 0:
+            return GroupSortNode(inputs[0], self.es, prefix)
+        return self.with_inputs(inputs)
+
+    def describe(self) -> str:
+        return f'Sort(keys={list(self.es.keys)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        for row in self.es(executor.rows(self.source)):
             yield row
 
 
+class GroupSortNode(Node):
+    """Graph node which sort date from previous node already sorted by prefix of keys"""
+    __slots__ = ('source', 'sort')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, sort: es.ExternalSort, prefix: int) -> None:
+        """
+        :param source: previous node
+        :param sort: full sort to replace
+        :param prefix: number of first keys of sort rows are already sorted by
+        """
+        self._set(source=source, sort=es.GroupSort(sort, prefix))
+
+    def signature(self) -> tp.Hashable:
+        return 'group_sort', freeze(self.sort)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return tuple(self.sort.sort.keys)
+
+    def describe(self) -> str:
+        return f'GroupSort(keys={list(self.sort.sort.keys)}, prefix={self.sort.prefix})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.sort(executor.rows(self.source))
+
+
+class BatchMapNode(Node):
+    """Graph node applying chain of mappers to column batches of date from previous node"""
+    __slots__ = ('source', 'map')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, mappers: tp.Sequence[ops.Mapper]) -> None:
+        """
+        :param source: previous node
+        :param mappers: mappers to apply one after another
+        """
+        self._set(source=source, map=columnar.BatchMap(mappers))
+
+    def signature(self) -> tp.Hashable:
+        return 'batch_map', freeze(self.map.mappers)
+
+    def describe(self) -> str:
+        return f'BatchMap({" -> ".join(type(mapper).__name__ for mapper in self.map.mappers)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.map(executor.rows(self.source))
+
+
+class BatchReduceNode(Node):
+    """Graph node applying vectorized hash aggregation to date from previous node"""
+    __slots__ = ('source', 'reduce')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, reducer: ops.Reducer, keys: tp.Sequence[str],
+                 sort_keys: tp.Optional[tp.Sequence[str]] = None) -> None:
+        """
+        :param source: previous node
+        :param reducer: one of BatchReduce.REDUCERS
+        :param keys: name of columns for reduce operation
+        :param sort_keys: keys in order groups are emitted in
+        """
+        self._set(source=source, reduce=columnar.BatchReduce(reducer, keys, sort_keys))
+
+    def signature(self) -> tp.Hashable:
+        return 'batch_reduce', freeze(self.reduce)
+
+    def describe(self) -> str:
+        return f'BatchReduce({type(self.reduce.reducer).__name__}, keys={list(self.reduce.sort_keys)})'
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.reduce(executor.rows(self.source))
+
+
+class ParallelMapNode(Node):
+    """
+    Graph node applying chain of map nodes to rows of source on worker processes. File is split into byte ranges
+    of about PARALLEL_TASK_BYTES, rows of source passed to run are sent to workers by batches. Rows are yielded
+    in the same order as by the chain itself.
+    """
+    __slots__ = ('segment', 'source', 'map')
+
+    def __init__(self, segment: Node, source: tp.Union[SourceNode, FileSourceNode],
+                 workers: tp.Optional[int] = None) -> None:
+        """
+        :param segment: last node of chain of map nodes, every node of which is read only by the next one
+        :param source: source the chain starts with
+        :param workers: number of worker processes, GRAPH_WORKERS by default
+        """
+        self._set(segment=segment, source=source, map=parallel.ParallelMap(self._run_task, workers))
+
+    def chain(self) -> tp.List[Node]:
+        """
+        nodes of chain from the last one to source
+        """
+        nodes = [self.segment]
+        while nodes[-1] is not self.source:
+            nodes.append(nodes[-1].inputs()[0])
+        return nodes
+
+    def signature(self) -> tp.Hashable:
+        return 'parallel_map', self.map.workers, tuple(node.signature() for node in self.chain())
+
+    def describe(self) -> str:
+        workers = self.map.workers if self.map.workers is not None else parallel.GRAPH_WORKERS
+        return f'ParallelMap(workers={workers}: {" <- ".join(node.describe() for node in self.chain())})'
+
+    def _rebased(self, node: Node, source: Node) -> Node:
+        if node is self.source:
+            return source
+        return node.with_inputs([self._rebased(node.inputs()[0], source)])
+
+    def _run_task(self, task: parallel.TTask) -> ops.TRowsIterable:
+        if isinstance(self.source, SourceNode):
+            return SegmentExecutor({self.source.name: lambda: task}).rows(self.segment)
+        start, end = task
+        source = FileSourceNode(self.source.filename, self.source.reader, start, end)
+        return SegmentExecutor({}).rows(self._rebased(self.segment, source))
+
+    def _tasks(self, executor: 'Executor') -> tp.Iterator[parallel.TTask]:
+        if isinstance(self.source, SourceNode):
+            rows = iter(executor.source(self.source.name)())
+            yield from iter(lambda: list(itertools.islice(rows, transport.BATCH_ROWS)), [])
+            return
+        workers = self.map.workers if self.map.workers is not None else parallel.GRAPH_WORKERS
+        start = self.source.start
+        end = os.path.getsize(self.source.filename) if self.source.end is None else self.source.end
+        parts = max(1, workers, -(-(end - start) // max(1, parallel.PARALLEL_TASK_BYTES)))
+        bounds = [start + (end - start) * part // parts for part in range(parts + 1)]
+        yield from zip(bounds, bounds[1:])
+
+    def run_split(self, executor: 'Executor', split: tp.Callable[[ops.TRowsIterable, str], tp.Any],
+                  directory: str) -> tp.List[tp.Any]:
+        """
+        Run chain on workers, which pass rows of every task to split function themselves
+        :param executor: executor running graph
+        :param split: function of rows and directory spooling rows to files there
+        :param directory: directory for files
+        :return: results of split function in order of tasks
+        """
+        pool = parallel.WorkerPool(lambda task, task_directory: split(self._run_task(task), task_directory),
+                                   self.map.workers)
+        return list(pool(self._tasks(executor), directory))
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.map(self._tasks(executor))
+
+
+def _split(executor: 'Executor', node: Node, split: tp.Callable[[ops.TRowsIterable, str], tp.Any]) \
+        -> tp.Callable[[str], tp.List[tp.Any]]:
+    # rows of chain of maps run on workers are split by workers, rows of other nodes by main process
+    if isinstance(node, ParallelMapNode) and not executor.shared(node):
+        return functools.partial(node.run_split, executor, split)
+    return lambda directory: [split(executor.rows(node), directory)]
+
+
+class ShuffleReduceNode(Node):
+    """
+    Graph node splitting date from previous node into partitions by hash of keys and applying hash aggregation
+    to every partition on worker processes
+    """
+    __slots__ = ('source', 'reduce')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, reduce: hashing.HashReduce, partitions: tp.Optional[int] = None,
+                 workers: tp.Optional[int] = None) -> None:
+        """
+        :param source: previous node
+        :param reduce: hash aggregation applied to every partition
+        :param partitions: number of partitions
+        :param workers: number of worker processes, GRAPH_WORKERS by default
+        """
+        self._set(source=source, reduce=shuffle_lib.ShuffleReduce(reduce, partitions, workers=workers))
+
+    def signature(self) -> tp.Hashable:
+        return 'shuffle_reduce', freeze(self.reduce)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        reduce = self.reduce.reduce
+        return reduce.reducer.ordering(reduce.keys, tuple(reduce.sort_keys))
+
+    def describe(self) -> str:
+        reduce = self.reduce.reduce
+        partitions = self.reduce.shuffle.partitions
+        return f'ShuffleReduce({type(reduce).__name__}({type(reduce.reducer).__name__}), ' \
+               f'keys={list(reduce.sort_keys)}, partitions={partitions})'
+
+    def skew(self) -> tp.Optional[shuffle_lib.Skew]:
+        return self.reduce.skew
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.reduce.reduce_partitions(_split(executor, self.source, self.reduce.shuffle.split))
+
+
+class ShuffleJoinNode(Node):
+    """
+    Graph node splitting date from two previous nodes into partitions by hash of keys and joining every pair
+    of partitions on worker processes, partitions are sorted there
+    """
+    __slots__ = ('left', 'right', 'join')
+    input_names = ('left', 'right')
+
+    def __init__(self, left: Node, right: Node, joiner: ops.Joiner, keys: tp.Sequence[str],
+                 partitions: tp.Optional[int] = None, workers: tp.Optional[int] = None,
+                 memory_limit: tp.Optional[int] = None) -> None:
+        """
+        :param left: previous left node, unsorted
+        :param right: previous right node, unsorted
+        :param joiner: particular joiner for join operation
+        :param keys: name of columns for join operation
+        :param partitions: number of partitions
+        :param workers: number of worker processes, GRAPH_WORKERS by default
+        :param memory_limit: memory budget of sort of every partition in bytes
+        """
+        self._set(left=left, right=right, join=shuffle_lib.ShuffleJoin(joiner, keys, partitions, workers=workers,
+                                                                       memory_limit=memory_limit))
+
+    def signature(self) -> tp.Hashable:
+        return 'shuffle_join', freeze(self.join)
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return tuple(self.join.keys)
+
+    def describe(self) -> str:
+        return f'ShuffleJoin({type(self.join.joiner).__name__}, keys={list(self.join.keys)}, ' \
+               f'partitions={self.join.shuffle.partitions})'
+
+    def skew(self) -> tp.Optional[shuffle_lib.Skew]:
+        return self.join.skew
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        yield from self.join.join_partitions(_split(executor, self.left, self.join.shuffle.split),
+                                             _split(executor, self.right, self.join.shuffle.split))
+
+
+class RangeSortNode(Node):
+    """Graph node sorting date from previous node by ranges of keys on worker processes"""
+    __slots__ = ('source', 'sort')
+    input_names = ('source',)
+
+    def __init__(self, source: Node, keys: tp.Sequence[str], partitions: tp.Optional[int] = None,
+                 workers: tp.Optional[int] = None, memory_limit: tp.Optional[int] = None) -> None:
+        """
+        :param source: previous node
+        :param keys: name of columns to sort by
+        :param partitions: number of ranges
+        :param workers: number of worker processes, GRAPH_WORKERS by default
+        :param memory_limit: memory budget of the sort in bytes
+        """
+        self._set(source=source, sort=shuffle_lib.RangeSort(keys, partitions, workers, memory_limit))
+
+    def signature(self) -> tp.Hashable:
+        return 'range_sort', tuple(self.sort.keys), self.sort.partitions, self.sort.workers, self.sort.memory_limit
+
+    def ordering(self, orderings: tp.Sequence[ops.TOrdering]) -> ops.TOrdering:
+        return tuple(self.sort.keys)
+
+    def describe(self) -> str:
+        return f'RangeSort(keys={list(self.sort.keys)}, partitions={self.sort.partitions})'
+
+    def skew(self) -> tp.Optional[shuffle_lib.Skew]:
+        return self.sort.skew
+
+    def run(self, executor: 'Executor') -> ops.TRowsGenerator:
+        source = self.source
+        if isinstance(source, ParallelMapNode) and not executor.shared(source):
+            yield from self.sort.sort_pieces(functools.partial(source.run_split, executor, self.sort.spool_piece))
+        else:
+            yield from self.sort(executor.rows(source))
+
+
+class Executor:
+    """
+    Runs graph of nodes. Graph is planned first: filters are moved below sorts and joins, columns nobody reads
+    are dropped right after sources and before sorts and joins, sorts of streams which are already sorted are
+    removed or weakened, sorts feeding only a reduce are replaced with hash aggregation, joins on empty keys
+    become broadcast joins. In columnar mode chains of maps with vectorized mappers and hash aggregations with
+    Count, Sum and Mean run over column batches. With several workers chains of maps starting at sources run
+    on worker processes, as well as hash aggregations by keys and joins of sorted tables, whose rows are split
+    into partitions by hash of keys, and sorts, whose rows are split into ranges of keys. Nodes with equal
+    signatures and inputs are evaluated once, and output of a node with several consumers is teed to all of them.
+    """
+
+    def __init__(self, root: Node, sources: tp.Optional[tp.Dict[str, tp.Callable[[], ops.TRowsIterable]]] = None,
+                 buffer_rows: tp.Optional[int] = None, columnar: tp.Optional[bool] = None,
+                 workers: tp.Optional[int] = None) -> None:
+        """
+        :param root: last node of graph
+        :param sources: fabrics of generators of rows by names of sources
+        :param buffer_rows: number of rows kept in memory for every consumer of shared node
+        :param columnar: whether to use columnar mode, COLUMNAR by default
+        :param workers: number of processes running chains of maps, parallel.GRAPH_WORKERS by default
+        """
+        self.sources = sources if sources is not None else {}
+        self.buffer_rows = buffer_rows
+        self._canonical: tp.Dict[int, Node] = {}
+        self._consumers: tp.Dict[int, int] = {}
+        self._tees: tp.Dict[int, tee.Tee] = {}
+        self._directory: tp.Optional[str] = None
+        readers: tp.Dict[int, int] = {}
+        self._count_readers(root, readers, set())
+        pushed_root = self._push_filters(root, readers, {}, set(), {})
+        pruned_root = self._prune(pushed_root)
+        planned: tp.Dict[int, tp.Tuple[Node, Node, ops.TOrdering]] = {}
+        readers = {}
+        self._count_readers(pruned_root, readers, set())
+        planned_root = self._plan(pruned_root, planned, readers)[0]
+        if columnar if columnar is not None else COLUMNAR:
+            readers = {}
+            self._count_readers(planned_root, readers, set())
+            planned_root = self._vectorize(planned_root, readers, {})
+        workers = workers if workers is not None else parallel.GRAPH_WORKERS
+        if workers > 1 and parallel.supported():
+            readers = {}
+            self._count_readers(planned_root, readers, set())
+            planned_root = self._parallelize(planned_root, readers, workers, {})
+        by_signature: tp.Dict[tp.Hashable, Node] = {}
+        self.root = self._canonize(planned_root, by_signature)
+        self._count_consumers(self.root, set())
+        self._consumers[id(self.root)] += 1
+
+    @staticmethod
+    def _topological(node: Node, order: tp.List[Node], visited: tp.Set[int]) -> None:
+        if id(node) in visited:
+            return
+        visited.add(id(node))
+        for source in node.inputs():
+            Executor._topological(source, order, visited)
+        order.append(node)
+
+    @staticmethod
+    def _columns(node: Node, inferred: tp.Dict[int, tp.Tuple[Node, ops.TColumns]]) -> ops.TColumns:
+        if id(node) not in inferred:
+            columns = [Executor._columns(source, inferred) for source in node.inputs()]
+            inferred[id(node)] = node, node.output_columns(columns)
+        return inferred[id(node)][1]
+
+    @staticmethod
+    def _push_filters(node: Node, readers: tp.Dict[int, int], pushed: tp.Dict[int, tp.Tuple[Node, Node]],
+                      shared: tp.Set[int], inferred: tp.Dict[int, tp.Tuple[Node, ops.TColumns]]) -> Node:
+        if id(node) not in pushed:
+            new_node = node.with_inputs([Executor._push_filters(source, readers, pushed, shared, inferred)
+                                         for source in node.inputs()])
+            if isinstance(new_node, MapNode) and isinstance(new_node.map.mapper, ops.Filter) \
+                    and new_node.map.mapper.columns is not None:
+                new_node = Executor._filtered(new_node.source, new_node.map.mapper, shared, inferred)
+            pushed[id(node)] = node, new_node
+            if readers.get(id(node), 0) > 1:
+                shared.add(id(new_node))
+        return pushed[id(node)][1]
+
+    @staticmethod
+    def _filtered(node: Node, mapper: ops.Filter, shared: tp.Set[int],
+                  inferred: tp.Dict[int, tp.Tuple[Node, ops.TColumns]]) -> Node:
+        # Node yielding rows of node which satisfy filter. Filter is moved below sorts and filters, which keep
+        # order of rows, and below joins whose tables may be filtered instead. Nodes read by other nodes too are
+        # not passed, as their rows would be computed twice.
+        if id(node) not in shared:
+            if isinstance(node, SortNode) or isinstance(node, MapNode) and isinstance(node.map.mapper, ops.Filter):
+                return node.with_inputs([Executor._filtered(node.inputs()[0], mapper, shared, inferred)])
+            if isinstance(node, JoinNode):
+                columns = tp.cast(tp.Sequence[str], mapper.columns)
+                filtered = node.join.joiner.filtered_tables(node.join.keys, columns,
+                                                            Executor._columns(node.left, inferred),
+                                                            Executor._columns(node.right, inferred))
+                if any(filtered):
+                    return node.with_inputs([Executor._filtered(source, mapper, shared, inferred) if table else source
+                                             for source, table in zip(node.inputs(), filtered)])
+        return MapNode(node, mapper)
+
+    @staticmethod
+    def _prune(root: Node) -> Node:
+        # Columns needed from every node are propagated from root to sources, node read by several nodes
+        # needs union of their columns
+        order: tp.List[Node] = []
+        Executor._topological(root, order, set())
+        needed: tp.Dict[int, ops.TColumns] = {id(root): None}
+        required: tp.Dict[int, tp.List[ops.TColumns]] = {}
+        # nodes whose rows are read only by projections, which drop columns themselves
+        projected: tp.Dict[int, bool] = {id(root): False}
+        for node in reversed(order):
+            required[id(node)] = node.required_columns(needed[id(node)])
+            for source, columns in zip(node.inputs(), required[id(node)]):
+                projected[id(source)] = projected.get(id(source), True) and isinstance(node, MapNode) \
+                    and isinstance(node.map.mapper, ops.Project)
+                if id(source) not in needed:
+                    needed[id(source)] = columns
+                elif needed[id(source)] is not None:
+                    needed[id(source)] = None if columns is None else needed[id(source)] | columns
+        # Rows are pruned right after sources and before nodes buffering them, unless columns they may have
+        # are inferred to be needed
+        pruned: tp.Dict[int, Node] = {}
+        inferred: tp.Dict[int, ops.TColumns] = {}
+        for node in order:
+            inputs = [pruned[id(source)] for source in node.inputs()]
+            if isinstance(node, (SortNode, JoinNode, HashJoinNode)):
+                inputs = [Executor._pruned(source, columns, inferred)
+                          for source, columns in zip(inputs, required[id(node)])]
+            new_node = node.with_inputs(inputs)
+            inferred[id(new_node)] = new_node.output_columns([inferred[id(source)] for source in inputs])
+            if isinstance(node, (SourceNode, FileSourceNode)) and not projected[id(node)]:
+                new_node = Executor._pruned(new_node, needed[id(node)], inferred)
+            pruned[id(node)] = new_node
+        return pruned[id(root)]
+
+    @staticmethod
+    def _pruned(node: Node, columns: ops.TColumns, inferred: tp.Dict[int, ops.TColumns]) -> Node:
+        # rows without columns can not be represented by column batches, so rows are never pruned to nothing
+        if not columns or inferred[id(node)] is not None and inferred[id(node)] <= columns:
+            return node
+        new_node = MapNode(node, ops.Prune(columns))
+        inferred[id(new_node)] = new_node.output_columns([inferred[id(node)]])
+        return new_node
+
+    @staticmethod
+    def _count_readers(node: Node, readers: tp.Dict[int, int], visited: tp.Set[int]) -> None:
+        if id(node) in visited:
+            return
+        visited.add(id(node))
+        for source in node.inputs():
+            readers[id(source)] = readers.get(id(source), 0) + 1
+            Executor._count_readers(source, readers, visited)
+
+    def _plan(self, node: Node, planned: tp.Dict[int, tp.Tuple[Node, Node, ops.TOrdering]],
+              readers: tp.Dict[int, int]) -> tp.Tuple[Node, ops.TOrdering]:
+        if id(node) not in planned:
+            inputs = [self._plan(source, planned, readers) for source in node.inputs()]
+            orderings = [ordering for _, ordering in inputs]
+            exclusive = [readers[id(source)] == 1 for source in node.inputs()]
+            new_node = node.optimize([source for source, _ in inputs], orderings, exclusive)
+            ordering = next((source_ordering for source, source_ordering in inputs if source is new_node),
+                            None)
+            if ordering is None:
+                # optimized node may read inputs of inputs, so order is derived by the original node
+                ordering = node.ordering(orderings)
+            # original node is kept in the table so that its id is not reused while planning
+            planned[id(node)] = node, new_node, ordering
+        _, new_node, ordering = planned[id(node)]
+        return new_node, ordering
+
+    def _vectorize(self, node: Node, readers: tp.Dict[int, int], vectorized: tp.Dict[int, tp.Tuple[Node, Node]]) \
+            -> Node:
+        if id(node) not in vectorized:
+            new_node: tp.Optional[Node] = None
+            if isinstance(node, HashReduceNode) and type(node.reduce.reducer) in columnar.BatchReduce.REDUCERS:
+                new_node = BatchReduceNode(self._vectorize(node.source, readers, vectorized),
+                                                    node.reduce.reducer, node.reduce.keys, node.reduce.sort_keys)
+            elif isinstance(node, (MapNode, FusedMapNode)):
+                mappers = mappers_of(node)
+                source = node.source
+                while isinstance(source, (MapNode, FusedMapNode)) and readers[id(source)] == 1:
+                    mappers[:0] = mappers_of(source)
+                    source = source.source
+                # pruning alone is cheaper on rows than conversion to batches and back
+                if any(type(mapper) in columnar.VECTORIZED and type(mapper) is not ops.Prune for mapper in mappers):
+                    new_node = BatchMapNode(self._vectorize(source, readers, vectorized), mappers)
+            if new_node is None:
+                new_node = node.with_inputs([self._vectorize(source, readers, vectorized)
+                                             for source in node.inputs()])
+            vectorized[id(node)] = node, new_node
+        return vectorized[id(node)][1]
+
+    @staticmethod
+    def _parallelize(root: Node, readers: tp.Dict[int, int], workers: int,
+                     parallelized: tp.Dict[int, tp.Tuple[Node, Node]]) -> Node:
+        # Chain of maps from source to node which is not a map runs on workers. Maps read by several nodes end
+        # the chain, as well as sources passed to run which are read several times, as rows of such source
+        # are computed once and teed. Pruning alone is not worth sending rows to workers. Hash aggregation by keys
+        # and join of tables sorted only for it shuffle rows into partitions processed on workers, other sorts
+        # split rows into ranges of keys sorted on workers.
+        sources: tp.Dict[str, int] = {}
+        order: tp.List[Node] = []
+        Executor._topological(root, order, set())
+        for node in order:
+            if isinstance(node, SourceNode):
+                sources[node.name] = sources.get(node.name, 0) + readers.get(id(node), 0)
+        maps = (MapNode, FusedMapNode, BatchMapNode)
+        # maps read only by the next map of chain
+        inner = {id(node.inputs()[0]) for node in order if isinstance(node, maps)
+                 and isinstance(node.inputs()[0], maps) and readers[id(node.inputs()[0])] == 1}
+        partitions = max(shuffle_lib.SHUFFLE_PARTITIONS, workers)
+        for node in order:
+            new_node: tp.Optional[Node] = None
+            if isinstance(node, HashReduceNode) and node.reduce.keys:
+                new_node = ShuffleReduceNode(parallelized[id(node.source)][1], node.reduce, partitions, workers)
+            elif isinstance(node, JoinNode) and node.join.keys \
+                    and all(isinstance(source, SortNode) and readers[id(source)] == 1
+                            and list(source.es.keys) == list(node.join.keys) for source in node.inputs()):
+                left, right = tp.cast(tp.Sequence[SortNode], node.inputs())
+                new_node = ShuffleJoinNode(parallelized[id(left.source)][1], parallelized[id(right.source)][1],
+                                           node.join.joiner, node.join.keys, partitions, workers,
+                                           left.es.memory_limit)
+            elif isinstance(node, SortNode) and node.es.keys:
+                new_node = RangeSortNode(parallelized[id(node.source)][1], node.es.keys, partitions, workers,
+                                         node.es.memory_limit)
+            elif isinstance(node, maps) and id(node) not in inner:
+                chain = [node]
+                while id(chain[-1].inputs()[0]) in inner:
+                    chain.append(chain[-1].inputs()[0])
+                start = chain[-1].inputs()[0]
+                mappers = [mapper for link in chain
+                           for mapper in (link.map.mappers if isinstance(link, BatchMapNode) else mappers_of(link))]
+                if (isinstance(start, FileSourceNode) or isinstance(start, SourceNode) and sources[start.name] == 1) \
+                        and any(type(mapper) is not ops.Prune for mapper in mappers):
+                    new_node = ParallelMapNode(node, start, workers)
+            if new_node is None:
+                new_node = node.with_inputs([parallelized[id(source)][1] for source in node.inputs()])
+            parallelized[id(node)] = node, new_node
+        return parallelized[id(root)][1]
+
+    def _canonize(self, node: Node, by_signature: tp.Dict[tp.Hashable, Node]) -> Node:
+        if id(node) in self._canonical:
+            return self._canonical[id(node)]
+        inputs = tuple(id(self._canonize(source, by_signature)) for source in node.inputs())
+        canonical = by_signature.setdefault((node.signature(), inputs), node)
+        self._canonical[id(node)] = canonical
+        return canonical
+
+    def _count_consumers(self, node: Node, visited: tp.Set[int]) -> None:
+        self._consumers.setdefault(id(node), 0)
+        if id(node) in visited:
+            return
+        visited.add(id(node))
+        for source in node.inputs():
+            canonical = self._canonical[id(source)]
+            self._consumers[id(canonical)] = self._consumers.get(id(canonical), 0) + 1
+            self._count_consumers(canonical, visited)
+
+    def shared(self, node: Node) -> bool:
+        """
+        :param node: node of graph
+        :return: whether node output is consumed by several nodes
+        """
+        return self._consumers[id(self._canonical[id(node)])] > 1
+
+    def source(self, name: str) -> tp.Callable[[], ops.TRowsIterable]:
+        """
+        :param name: name of data source
+        :return: fabric of generators of rows passed to run under this name
+        """
+        if name not in self.sources:
+            raise KeyError(f'Data source {name!r} is not passed to run')
+        return self.sources[name]
+
+    def _spool_path(self) -> str:
+        if self._directory is None:
+            self._directory = spill.make_directory()
+        return spill.run_path(self._directory, 'tee-')
+
+    def rows(self, node: Node) -> ops.TRowsGenerator:
+        """
+        Create generator of rows produced by node
+        :param node: node of graph
+        """
+        canonical = self._canonical[id(node)]
+        if not self.shared(canonical):
+            return canonical.run(self)
+        if id(canonical) not in self._tees:
+            self._tees[id(canonical)] = tee.Tee(canonical.run(self), self._consumers[id(canonical)],
+                                                self._spool_path, self.buffer_rows)
+        return self._tees[id(canonical)].consumer()
+
+    def explain(self) -> str:
+        """
+        :return: planned graph as text, every node is followed by its inputs with larger indent
+        """
+        lines: tp.List[str] = []
+        self._explain(self.root, 0, lines, set())
+        return '\n'.join(lines)
+
+    def skew(self) -> str:
+        """
+        :return: number of rows in partitions of every shuffle stage which ran, as text, one stage per line
+        """
+        lines: tp.List[str] = []
+        self._skew(self.root, lines, set())
+        return '\n'.join(lines)
+
+    def _skew(self, node: Node, lines: tp.List[str], visited: tp.Set[int]) -> None:
+        if id(node) in visited:
+            return
+        visited.add(id(node))
+        for source in node.inputs():
+            self._skew(self._canonical[id(source)], lines, visited)
+        skew = node.skew()
+        if skew is not None:
+            lines.append(f'{node.describe()}: {skew}')
+
+    def _explain(self, node: Node, depth: int, lines: tp.List[str], visited: tp.Set[int]) -> None:
+        line = '    ' * depth + node.describe()
+        if self.shared(node):
+            line += ' [shared]'
+        lines.append(line)
+        if id(node) in visited:
+            return
+        visited.add(id(node))
+        for source in node.inputs():
+            self._explain(self._canonical[id(source)], depth + 1, lines, visited)
+
+    def close(self) -> None:
+        """Remove spool files"""
+        if self._directory is not None:
+            spill.remove_directory(self._directory)
+            self._directory = None
+
+
+class SegmentExecutor(Executor):
+    """
+    Executor of already planned chain of nodes without shared nodes, used to run parts of plan on workers
+    """
+
+    def __init__(self, sources: tp.Dict[str, tp.Callable[[], ops.TRowsIterable]]) -> None:
+        """
+        :param sources: fabrics of generators of rows by names of sources
+        """
+        self.sources = sources
+
+    def rows(self, node: Node) -> ops.TRowsGenerator:
+        return node.run(self)
+
+
 class Graph:
     """Computational graph implementation"""
 
-    def __init__(self, name: str):
-        self.last_node: Node = SourceNode()
-        self.sources = {name: self.last_node}
+    def __init__(self, last_node: Node):
+        """
+        :param last_node: node producing rows of graph, it may be shared with other graphs
+        """
+        self.last_node = last_node
 
     @staticmethod
     def graph_from_iter(name: str) -> 'Graph':
@@ -114,84 +1123,93 @@ class Graph:
         from 'kwargs' passed to 'run' method) into graph data-flow
         :param name: name of kwarg to use as data source
         """
-        return Graph(name)
+        return Graph(SourceNode(name))
 
     @staticmethod
-    def fabric(name: str, parser: tp.Callable[[str], ops.TRow]) -> tp.Callable[[], ops.TRowsGenerator]:
-        f_name = name
-
-        def source() -> ops.TRowsGenerator:
-            file = open(f_name, 'r')
-            while True:
-                line = file.readline()
-                if not line:
-                    file.close()
-                    break
-                else:
-                    yield parser(line)
-
-        return source
+    def fabric(name: str, parser: rd.TFormat = 'literal') -> tp.Callable[[], ops.TRowsGenerator]:
+        """Make fabric of generators of rows of file, which may be passed to run as source
+        :param name: filename to read from
+        :param parser: parser from string to Row, reader of rows, or name of format from readers.READERS
+        """
+        reader = rd.make_reader(parser)
+        return functools.partial(reader, name)
 
     @staticmethod
-    def graph_from_file(filename: str, parser: tp.Callable[[str], ops.TRow]) -> 'Graph':
+    def graph_from_file(filename: str, parser: rd.TFormat = 'literal', start: int = 0,
+                        end: tp.Optional[int] = None) -> 'Graph':
         """Construct new graph extended with operation for reading rows from file
         :param filename: filename to read from
-        :param parser: parser from string to Row
+        :param parser: parser from string to Row, reader of rows, or name of format from readers.READERS
+        :param start: offset of range of file to read in bytes, ranges from readers.split_file split file
+            between several graphs
+        :param end: end of range of file, None for end of file
         """
-
-        graph = Graph('')
-        graph.last_node.add_source(graph.fabric(filename, parser))
-        return graph
+        return Graph(FileSourceNode(filename, rd.make_reader(parser), start, end))
 
     def map(self, mapper: ops.Mapper) -> 'Graph':
         """Construct new graph extended with map operation with particular mapper
         :param mapper: mapper to use
         """
-        graph = deepcopy(self)
-        graph.last_node = MapNode(graph.last_node, mapper)
-        return graph
+        return Graph(MapNode(self.last_node, mapper))
 
     def reduce(self, reducer: ops.Reducer, keys: tp.Sequence[str]) -> 'Graph':
         """Construct new graph extended with reduce operation with particular reducer
         :param reducer: reducer to use
         :param keys: keys for grouping
         """
-        graph = deepcopy(self)
-        graph.last_node = ReduceNode(graph.last_node, reducer, keys)
-        return graph
+        return Graph(ReduceNode(self.last_node, reducer, keys))
 
-    def sort(self, keys: tp.Sequence[str]) -> 'Graph':
+    def sort(self, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None,
+             workers: tp.Optional[int] = None) -> 'Graph':
         """Construct new graph extended with sort operation
         :param keys: sorting keys (typical is tuple of strings)
+        :param memory_limit: memory budget of the sort in bytes, rows above it are spilled to disk
+        :param workers: number of processes generating sorted runs in parallel
         """
-        graph = deepcopy(self)
-        graph.last_node = SortNode(graph.last_node, keys)
-        return graph
+        return Graph(SortNode(self.last_node, keys, memory_limit, workers))
 
-    def join(self, joiner: ops.Joiner, join_graph: 'Graph', keys: tp.Sequence[str]) -> 'Graph':
+    def join(self, joiner: ops.Joiner, join_graph: 'Graph', keys: tp.Sequence[str], algorithm: str = 'merge',
+             memory_limit: tp.Optional[int] = None) -> 'Graph':
         """Construct new graph extended with join operation with another graph
         :param joiner: join strategy to use
         :param join_graph: other graph to join with
         :param keys: keys for grouping
+        :param algorithm: "merge" for join of graphs sorted by keys or "hash" for join of unsorted graphs
+        :param memory_limit: memory budget of hash join in bytes, larger graphs are partitioned on disk
+        """
+        if algorithm == 'merge':
+            return Graph(JoinNode(self.last_node, join_graph.last_node, joiner, keys))
+        if algorithm == 'hash':
+            return Graph(HashJoinNode(self.last_node, join_graph.last_node, joiner, keys, memory_limit))
+        raise ValueError(f'Unknown join algorithm: {algorithm}')
+
+    def explain(self, columnar: tp.Optional[bool] = None, workers: tp.Optional[int] = None) -> str:
+        """Describe plan graph is executed with, one node per line
+        :param columnar: whether to plan for columnar mode, COLUMNAR by default
+        :param workers: number of processes running chains of maps, GRAPH_WORKERS by default
+        """
+        return Executor(self.last_node, columnar=columnar, workers=workers).explain()
+
+    def stream(self, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        """Lazily generate result rows; data sources passed as kwargs"""
+        executor = Executor(self.last_node, kwargs)
+        try:
+            yield from executor.rows(executor.root)
+            if shuffle_lib.SKEW_REPORT and executor.skew():
+                print(executor.skew(), file=sys.stderr)
+        finally:
+            executor.close()
+
+    def run_to(self, sink: tp.Callable[[ops.TRow], tp.Any], **kwargs: tp.Any) -> int:
+        """Pass every result row to sink, return number of rows; data sources passed as kwargs
+        :param sink: function called with every result row
         """
-        graph = deepcopy(self)
-        graph.last_node = JoinNode(graph.last_node, join_graph.last_node, joiner, keys)
-        for key in join_graph.sources.keys():
-            new_key = key
-            while new_key in graph.sources.keys():
-                new_key += '_'
-            graph.sources[new_key] = join_graph.sources[key]
-        return graph
+        count = 0
+        for row in self.stream(**kwargs):
+            sink(row)
+            count += 1
+        return count
 
     def run(self, **kwargs: tp.Any) -> tp.List[ops.TRow]:
-        """Single method to start execution; data sources passed as kwargs"""
-        for key in kwargs.keys():
-            new_key = key
-            while new_key in self.sources.keys():
-                self.sources[new_key].add_source(kwargs[key])
-                new_key += '_'
-        result: tp.List[ops.TRow] = []
-        for row in self.last_node.run():
-            print(row)
-            result.append(row)
-        return result
+        """Single method to start execution and collect result to list; data sources passed as kwargs"""
+        return list(self.stream(**kwargs))
@@ -0,0 +1,440 @@
+import heapq
+import os
+import typing as tp
+
+from itertools import chain, groupby
+from os import environ
+
+from . import external_sort as es
+from . import operations as ops
+from . import rows as rows_lib
+from . import spill
+
+# Hash tables live in the main process, unlike sort runs, so the default budget is smaller than SORT_MEMORY_LIMIT
+HASH_MEMORY_LIMIT = int(environ.get("HASH_MEMORY_LIMIT", str(4 * 1024 ** 2)))  # in bytes
+HASH_PARTITIONS = int(environ.get("HASH_PARTITIONS", "16"))
+HASH_MAX_DEPTH = 3  # number of repartitioning passes before falling back to sort
+
+
+def hashable(value: tp.Any) -> tp.Hashable:
+    """
+    Hashable value equal for equal values, lists become tuples, sets become frozensets and dicts become sets
+    of items, other unhashable values are replaced with name of their type, so that rows with unhashable keys
+    may be partitioned by hash
+    :param value: value of key
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+    if isinstance(value, (list, tuple)):
+        return tuple(map(hashable, value))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(map(hashable, value))
+    if isinstance(value, dict):
+        return frozenset((hashable(key), hashable(item)) for key, item in value.items())
+    return type(value).__name__
+
+
+def partition_of(key: tp.Tuple[tp.Any, ...], salt: int, partitions: int) -> int:
+    """
+    Number of partition of key, keys which are equal get to the same partition
+    :param key: value of keys of row
+    :param salt: salt of hash, so that different partitioning passes split rows differently
+    :param partitions: number of partitions
+    """
+    try:
+        return hash((salt, key)) % partitions
+    except TypeError:
+        return hash((salt, hashable(key))) % partitions
+
+
+def split_rows(rows: ops.TRowsIterable, partition: tp.Callable[[ops.TRow], int], partitions: int,
+               directory: str, rows_in_chunk: int) -> tp.List[str]:
+    """
+    Split rows into files by number of partition of every row, rows keep their order inside every file.
+    Rows are packed, files are read back by rows.read_rows
+    :param rows: rows to split
+    :param partition: function from row to number of its partition
+    :param partitions: number of files
+    :param directory: directory for files
+    :param rows_in_chunk: number of rows buffered for every file before writing
+    """
+    paths = [spill.run_path(directory, 'partition-') for _ in range(partitions)]
+    chunks: tp.List[tp.List[ops.TRow]] = [[] for _ in range(partitions)]
+    files = [open(path, 'wb') for path in paths]
+    try:
+        for row in rows:
+            index = partition(row)
+            chunks[index].append(rows_lib.pack(row))
+            if len(chunks[index]) >= rows_in_chunk:
+                spill.dump_chunk(files[index], chunks[index])
+                chunks[index] = []
+        for file, chunk in zip(files, chunks):
+            if chunk:
+                spill.dump_chunk(file, chunk)
+    finally:
+        for file in files:
+            file.close()
+    return paths
+
+
+def partition_rows(rows: ops.TRowsIterable, keys: tp.Sequence[str], depth: int, partitions: int,
+                   directory: str, rows_in_chunk: int) -> tp.List[str]:
+    """
+    Split rows into files by hash of key, rows keep their order inside every file. Rows are packed,
+    files are read back by rows.read_rows
+    :param rows: rows to split
+    :param keys: name of columns to hash
+    :param depth: number of partitioning pass, used as salt of hash so that passes split rows differently
+    :param partitions: number of files
+    :param directory: directory for files
+    :param rows_in_chunk: number of rows buffered for every file before writing
+    """
+    return split_rows(rows, lambda row: partition_of(ops.get_key_value(keys, row), depth, partitions), partitions,
+                      directory, rows_in_chunk)
+
+
+class HashReduce(ops.Operation):
+    """
+    Reduce which groups rows in hash table instead of requiring rows sorted by keys. Rows of every group keep
+    their input order and groups are emitted sorted by key, so result equals result of sort followed by reduce.
+    When table exceeds memory budget all rows are split into partitions on disk by hash of key and every
+    partition is reduced separately, sorted results of partitions are merged back.
+    """
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None,
+                 sort_keys: tp.Optional[tp.Sequence[str]] = None) -> None:
+        """
+        :param reducer: used reducer
+        :param keys: column names for reducer
+        :param memory_limit: approximate memory budget of hash table in bytes, HASH_MEMORY_LIMIT by default
+        :param sort_keys: keys in order groups are emitted in, keys by default
+        """
+        if memory_limit is not None and memory_limit <= 0:
+            raise ValueError(f'Memory limit of hash reduce must be positive, got {memory_limit}')
+        self.reducer = reducer
+        self.keys = keys
+        self.memory_limit = memory_limit
+        self.sort_keys = sort_keys if sort_keys is not None else keys
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        for _, row in self.keyed(rows):
+            yield row
+
+    def keyed(self, rows: ops.TRowsIterable) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        """
+        Reduce rows and yield result rows together with values of sort keys of their groups
+        :param rows: rows to reduce
+        """
+        yield from self._keyed(rows, 0)
+
+    def _keyed(self, rows: ops.TRowsIterable, depth: int) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        memory_limit = self.memory_limit if self.memory_limit is not None else HASH_MEMORY_LIMIT
+        directory = spill.make_directory()
+        try:
+            yield from self._reduce(iter(rows), depth, memory_limit, directory)
+        finally:
+            spill.remove_directory(directory)
+
+    def _reduce(self, rows: tp.Iterator[ops.TRow], depth: int, memory_limit: int,
+                directory: str) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        # rows are kept packed, it takes several times less memory than dicts
+        groups: tp.Dict[tp.Tuple[tp.Any, ...], tp.List[rows_lib.TPackedRow]] = {}
+        size = 0
+        for row in rows:
+            key = ops.get_key_value(self.sort_keys, row)
+            try:
+                group = groups.setdefault(key, [])
+            except TypeError:
+                # unhashable key, stable sort of rows gives the same groups in the same order
+                grouped = map(rows_lib.unpack, chain.from_iterable(groups.values()))
+                yield from self._sorted(chain(grouped, [row], rows), memory_limit)
+                return
+            packed = rows_lib.pack(row)
+            group.append(packed)
+            size += rows_lib.packed_size(packed)
+            if size >= memory_limit:
+                rows_count = sum(len(group) for group in groups.values())
+                grouped = map(rows_lib.unpack, chain.from_iterable(groups.values()))
+                yield from self._partitioned(chain(grouped, rows), depth, memory_limit, directory, size, rows_count)
+                return
+        for key in sorted(groups):
+            for row in self.reducer(self.keys, map(rows_lib.unpack, groups[key])):
+                yield key, row
+
+    def _partitioned(self, rows: ops.TRowsIterable, depth: int, memory_limit: int, directory: str,
+                     rows_size: int, rows_count: int) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        partitions_count = max(2, HASH_PARTITIONS)
+        rows_in_chunk = es.chunk_rows(memory_limit // partitions_count, rows_size, rows_count)
+        partitions = partition_rows(rows, self.sort_keys, depth, partitions_count, directory, rows_in_chunk)
+        runs = []
+        for path in partitions:
+            if depth + 1 < HASH_MAX_DEPTH:
+                reduced = self._reduce(rows_lib.read_rows(path), depth + 1, memory_limit, directory)
+            else:
+                reduced = self._sorted(rows_lib.read_rows(path), memory_limit)
+            run = spill.run_path(directory, 'reduced-')
+            spill.write_rows(run, reduced, rows_in_chunk)
+            os.remove(path)
+            runs.append(run)
+        yield from heapq.merge(*[spill.read_rows(run) for run in runs], key=lambda item: item[0])
+
+    def _sorted(self, rows: ops.TRowsIterable,
+                memory_limit: int) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        sorted_rows = es.ExternalSort(self.sort_keys, memory_limit)(rows)
+        for key, group in groupby(sorted_rows, ops.key_func_maker(self.sort_keys)):
+            for row in self.reducer(self.keys, group):
+                yield key, row
+
+
+class CombineReduce(HashReduce):
+    """
+    Hash aggregation for reducers with combiner, which keeps only partial row of every group instead of all
+    rows of the group. When table exceeds memory budget, partial rows and following rows turned into partial
+    rows are split into partitions on disk by hash of key, and partial rows of every partition are merged
+    separately. Result equals result of sort followed by reduce.
+    """
+
+    def __init__(self, reducer: ops.Reducer, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None,
+                 sort_keys: tp.Optional[tp.Sequence[str]] = None) -> None:
+        """
+        :param reducer: reducer with combiner
+        :param keys: column names for reducer
+        :param memory_limit: approximate memory budget of hash table in bytes, HASH_MEMORY_LIMIT by default
+        :param sort_keys: keys in order groups are emitted in, keys by default
+        """
+        super().__init__(reducer, keys, memory_limit, sort_keys)
+        combiner = reducer.combiner(keys)
+        if combiner is None:
+            raise ValueError(f'Reducer {type(reducer).__name__} has no combiner')
+        self.combiner = combiner
+
+    def merged(self, partials: ops.TRowsIterable) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        """
+        Merge partial rows made by combiner of parts of groups, yield result rows together with values of sort
+        keys of their groups
+        :param partials: partial rows, partial rows of every group go in order of its parts
+        """
+        yield from self._keyed(partials, 1)
+
+    def _partials(self, rows: ops.TRowsIterable, depth: int) -> ops.TRowsIterable:
+        # rows of partitions are partial rows already
+        if depth > 0:
+            return rows
+        return (self.combiner.start(self.keys, row) for row in rows)
+
+    def _reduce(self, rows: tp.Iterator[ops.TRow], depth: int, memory_limit: int,
+                directory: str) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        combiner = self.combiner
+        fold = combiner.add if depth == 0 else combiner.merge
+        partials: tp.Dict[tp.Tuple[tp.Any, ...], ops.TRow] = {}
+        size = 0
+        for row in rows:
+            key = ops.get_key_value(self.sort_keys, row)
+            try:
+                partial = partials.get(key)
+            except TypeError:
+                # unhashable key, stable sort of partial rows gives the same groups in the same order
+                yield from self._sorted(chain(partials.values(), self._partials(chain([row], rows), depth)),
+                                        memory_limit)
+                return
+            if partial is not None:
+                fold(partial, row)
+                continue
+            partial = partials[key] = combiner.start(self.keys, row) if depth == 0 else row
+            size += spill.row_size(partial)
+            if size >= memory_limit:
+                yield from self._partitioned(chain(partials.values(), self._partials(rows, depth)), depth,
+                                             memory_limit, directory, size, len(partials))
+                return
+        for key in sorted(partials):
+            yield key, combiner.finish(self.keys, partials[key])
+
+    def _sorted(self, rows: ops.TRowsIterable,
+                memory_limit: int) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        # rows are partial rows
+        sorted_rows = es.ExternalSort(self.sort_keys, memory_limit)(rows)
+        for key, group in groupby(sorted_rows, ops.key_func_maker(self.sort_keys)):
+            partial = next(group)
+            for other in group:
+                self.combiner.merge(partial, other)
+            yield key, self.combiner.finish(self.keys, partial)
+
+
+class HashTopN(HashReduce):
+    """
+    Hash aggregation for TopN reducer, which keeps only a bounded heap of top rows for every group instead of
+    all rows of the group. Result equals result of sort by keys followed by reduce: groups are emitted sorted
+    by key and rows of every group go in order of heapq.nlargest, rows with equal values in input order.
+    Global top N is computed when keys are empty.
+    """
+
+    def __init__(self, reducer: ops.TopN, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None,
+                 sort_keys: tp.Optional[tp.Sequence[str]] = None) -> None:
+        """
+        :param reducer: TopN reducer
+        :param keys: column names for reducer
+        :param memory_limit: approximate memory budget of heaps in bytes, HASH_MEMORY_LIMIT by default
+        :param sort_keys: keys in order groups are emitted in, keys by default
+        """
+        super().__init__(reducer, keys, memory_limit, sort_keys)
+        self.column = reducer.column_max
+        self.n = reducer.n
+
+    def _reduce(self, rows: tp.Iterator[ops.TRow], depth: int, memory_limit: int,
+                directory: str) -> tp.Generator[tp.Tuple[tp.Any, ops.TRow], None, None]:
+        # heap items are value, negated number of row, so that later of equal rows is dropped first, and packed row
+        heaps: tp.Dict[tp.Tuple[tp.Any, ...], tp.List[tp.Tuple[tp.Any, int, rows_lib.TPackedRow]]] = {}
+        size = 0
+        for index, row in enumerate(rows):
+            key = ops.get_key_value(self.sort_keys, row)
+            try:
+                heap = heaps.setdefault(key, [])
+            except TypeError:
+                # unhashable key, stable sort of rows gives the same groups in the same order
+                yield from self._sorted(chain(self._kept(heaps), [row], rows), memory_limit)
+                return
+            value = row[self.column]
+            if len(heap) < self.n:
+                packed = rows_lib.pack(row)
+                heapq.heappush(heap, (value, -index, packed))
+                size += rows_lib.packed_size(packed)
+            elif heap and (value, -index) > heap[0][:2]:
+                packed = rows_lib.pack(row)
+                dropped = heapq.heapreplace(heap, (value, -index, packed))
+                size += rows_lib.packed_size(packed) - rows_lib.packed_size(dropped[2])
+            if size >= memory_limit:
+                rows_count = sum(len(heap) for heap in heaps.values())
+                yield from self._partitioned(chain(self._kept(heaps), rows), depth, memory_limit, directory, size,
+                                             rows_count)
+                return
+        for key in sorted(heaps):
+            for _, _, packed in sorted(heaps[key], key=lambda item: item[:2], reverse=True):
+                yield key, rows_lib.unpack(packed)
+
+    @staticmethod
+    def _kept(heaps: tp.Dict[tp.Tuple[tp.Any, ...], tp.List[tp.Tuple[tp.Any, int, rows_lib.TPackedRow]]]) \
+            -> ops.TRowsGenerator:
+        # rows kept in heaps in input order, dropped rows can not get to top with following rows
+        for _, _, packed in sorted(chain.from_iterable(heaps.values()), key=lambda item: -item[1]):
+            yield rows_lib.unpack(packed)
+
+
+def take(rows: tp.Iterator[ops.TRow], memory_limit: int) -> tp.Tuple[tp.List[ops.TRow], int, bool]:
+    """
+    Read rows into memory until memory budget is exhausted, return read rows, their size and whether all rows
+    were read
+    :param rows: iterator over rows
+    :param memory_limit: approximate memory budget in bytes
+    """
+    buffer: tp.List[ops.TRow] = []
+    size = 0
+    for row in rows:
+        buffer.append(row)
+        size += spill.row_size(row)
+        if size >= memory_limit:
+            return buffer, size, False
+    return buffer, size, True
+
+
+class HashJoin(ops.Operation):
+    """
+    Join which builds hash index on one input and streams the other one, inputs need not be sorted.
+    The side which fits into half of memory budget becomes build side, left one is tried first. When both sides
+    are larger, they are split into partitions on disk by hash of key and every pair of partitions is joined
+    separately (grace hash join). Rows are yielded in order of streamed side, unmatched rows of build side
+    go last.
+    """
+
+    def __init__(self, joiner: ops.Joiner, keys: tp.Sequence[str], memory_limit: tp.Optional[int] = None) -> None:
+        """
+        :param joiner: joiner with particular strategy
+        :param keys: name of columns for join
+        :param memory_limit: approximate memory budget of hash index in bytes, HASH_MEMORY_LIMIT by default
+        """
+        if memory_limit is not None and memory_limit <= 0:
+            raise ValueError(f'Memory limit of hash join must be positive, got {memory_limit}')
+        self.joiner = joiner
+        self.keys = keys
+        self.memory_limit = memory_limit
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        """
+        :param rows: left table with data
+        :param args: contain right table with data
+        """
+        memory_limit = self.memory_limit if self.memory_limit is not None else HASH_MEMORY_LIMIT
+        directory = spill.make_directory()
+        try:
+            yield from self._join(iter(rows), iter(args[0]), 0, memory_limit, directory)
+        finally:
+            spill.remove_directory(directory)
+
+    def _join(self, rows_a: tp.Iterator[ops.TRow], rows_b: tp.Iterator[ops.TRow], depth: int, memory_limit: int,
+              directory: str) -> ops.TRowsGenerator:
+        buffer_a, size_a, complete_a = take(rows_a, max(1, memory_limit // 2))
+        if complete_a:
+            yield from self._build_probe(buffer_a, rows_b, True, memory_limit)
+            return
+        buffer_b, size_b, complete_b = take(rows_b, max(1, memory_limit // 2))
+        if complete_b:
+            yield from self._build_probe(buffer_b, chain(buffer_a, rows_a), False, memory_limit)
+            return
+        if depth + 1 >= HASH_MAX_DEPTH:
+            yield from self._merge(chain(buffer_a, rows_a), chain(buffer_b, rows_b), memory_limit)
+            return
+        partitions = max(2, HASH_PARTITIONS)
+        rows_in_chunk_a = es.chunk_rows(memory_limit // partitions, size_a, len(buffer_a))
+        rows_in_chunk_b = es.chunk_rows(memory_limit // partitions, size_b, len(buffer_b))
+        partitions_a = partition_rows(chain(buffer_a, rows_a), self.keys, depth, partitions, directory,
+                                      rows_in_chunk_a)
+        del buffer_a
+        partitions_b = partition_rows(chain(buffer_b, rows_b), self.keys, depth, partitions, directory,
+                                      rows_in_chunk_b)
+        del buffer_b
+        for path_a, path_b in zip(partitions_a, partitions_b):
+            yield from self._join(rows_lib.read_rows(path_a), rows_lib.read_rows(path_b), depth + 1, memory_limit,
+                                  directory)
+            os.remove(path_a)
+            os.remove(path_b)
+
+    def _build_probe(self, build: tp.List[ops.TRow], probe: tp.Iterator[ops.TRow], build_left: bool,
+                     memory_limit: int) -> ops.TRowsGenerator:
+        index: tp.Dict[tp.Tuple[tp.Any, ...], tp.List[ops.TRow]] = {}
+        for row in build:
+            try:
+                index.setdefault(ops.get_key_value(self.keys, row), []).append(row)
+            except TypeError:
+                # unhashable key, join sorted inputs instead
+                if build_left:
+                    yield from self._merge(iter(build), probe, memory_limit)
+                else:
+                    yield from self._merge(probe, iter(build), memory_limit)
+                return
+        matched: tp.Set[tp.Tuple[tp.Any, ...]] = set()
+        for row in probe:
+            key = ops.get_key_value(self.keys, row)
+            try:
+                group = index.get(key)
+            except TypeError:
+                group = None
+            if group is not None:
+                matched.add(key)
+            if build_left:
+                yield from self.joiner(self.keys, group or [], [row])
+            else:
+                yield from self.joiner(self.keys, [row], group or [])
+        for key, group in index.items():
+            if key not in matched:
+                if build_left:
+                    yield from self.joiner(self.keys, group, [])
+                else:
+                    yield from self.joiner(self.keys, [], group)
+
+    def _merge(self, rows_a: tp.Iterator[ops.TRow], rows_b: tp.Iterator[ops.TRow],
+               memory_limit: int) -> ops.TRowsGenerator:
+        sorted_a = es.ExternalSort(self.keys, memory_limit)(rows_a)
+        sorted_b = es.ExternalSort(self.keys, memory_limit)(rows_b)
+        yield from ops.Join(self.joiner, self.keys)(sorted_a, sorted_b)
@@ -1,14 +1,23 @@
 from abc import ABC, abstractmethod
 from heapq import nlargest
-from itertools import groupby
+from itertools import chain, groupby, takewhile
 import typing as tp
 import string
 import math
 import datetime
 
+from functools import lru_cache
+from os import environ
+
 TRow = tp.Dict[str, tp.Any]
 TRowsIterable = tp.Iterable[TRow]
 TRowsGenerator = tp.Generator[TRow, None, None]
+TOrdering = tp.Tuple[str, ...]
+TColumns = tp.Optional[tp.FrozenSet[str]]  # None stands for all columns
+
+EDGE_LENGTHS_CACHE_SIZE = int(environ.get("EDGE_LENGTHS_CACHE_SIZE", str(2 ** 16)))  # in edges
+EARTH_RADIUS = 6371  # in km
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
 
 
 class Operation(ABC):
@@ -20,6 +29,41 @@ class Operation(ABC):
 # Operations
 
 
+def unchanged_prefix(ordering: TOrdering, columns: tp.Collection[str]) -> TOrdering:
+    """
+    :param ordering: columns rows are sorted by
+    :param columns: columns which are overwritten
+    :return: longest prefix of ordering without overwritten columns
+    """
+    for index, column in enumerate(ordering):
+        if column in columns:
+            return ordering[:index]
+    return ordering
+
+
+def added_columns(columns: TColumns, written: tp.Iterable[str]) -> TColumns:
+    """
+    Columns of output rows of mapper which writes some columns and passes other ones unchanged
+    :param columns: columns input rows may have, None if unknown
+    :param written: columns mapper writes
+    """
+    if columns is None:
+        return None
+    return columns | frozenset(written)
+
+
+def passed_columns(needed: TColumns, read: tp.Iterable[str], written: tp.Iterable[str]) -> TColumns:
+    """
+    Columns of input rows needed by mapper which reads and writes some columns and passes other ones unchanged
+    :param needed: columns of output rows read by following operations, None if all of them
+    :param read: columns mapper reads
+    :param written: columns mapper overwrites
+    """
+    if needed is None:
+        return None
+    return (needed - frozenset(written)) | frozenset(read)
+
+
 class Mapper(ABC):
     """Base class for mappers"""
     @abstractmethod
@@ -29,6 +73,30 @@ class Mapper(ABC):
         """
         pass
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        """
+        Used by planner to track sort order of stream, unknown mappers are assumed to break it
+        :param ordering: columns input rows are sorted by
+        :return: columns output rows are sorted by
+        """
+        return ()
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        """
+        Used by planner to drop columns nobody reads, unknown mappers are assumed to read all columns
+        :param needed: columns of output rows read by following operations, None if all of them
+        :return: columns of input rows the mapper needs, None if all of them
+        """
+        return None
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        """
+        Used by planner to infer columns of rows, unknown mappers may add any columns
+        :param columns: columns input rows may have, None if unknown
+        :return: columns output rows may have, None if unknown
+        """
+        return None
+
 
 class Map(Operation):
     def __init__(self, mapper: Mapper) -> None:
@@ -49,6 +117,92 @@ class Reducer(ABC):
         """
         pass
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        """
+        Used by planner to track sort order of stream, unknown reducers are assumed to break it
+        :param group_key: columns rows are grouped by
+        :param ordering: columns input rows are sorted by
+        :return: columns output rows are sorted by
+        """
+        return ()
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        """
+        Used by planner to drop columns nobody reads, unknown reducers are assumed to read all columns
+        :param group_key: columns rows are grouped by
+        :param needed: columns of output rows read by following operations, None if all of them
+        :return: columns of input rows the reducer needs, None if all of them
+        """
+        return None
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        """
+        Used by planner to infer columns of rows, unknown reducers may yield any columns
+        :param group_key: columns rows are grouped by
+        :param columns: columns input rows may have, None if unknown
+        :return: columns output rows may have, None if unknown
+        """
+        return None
+
+    def combiner(self, group_key: tp.Sequence[str]) -> tp.Optional['Combiner']:
+        """
+        Used by planner to aggregate rows of group partially as they come instead of keeping them
+        :param group_key: columns rows are grouped by
+        :return: combiner giving the same result as reducer, None if reducer can not be split
+        """
+        return None
+
+
+class Combiner(ABC):
+    """
+    Reducer yielding one row per group split into partial aggregation and its finish. Rows of group are folded
+    into partial row one by one in input order, partial rows of consecutive parts of group are merged in the same
+    order, and finished partial row of the whole group equals result of reducer. Partial rows keep group key
+    columns, so they can be grouped, sorted and spilled like other rows.
+    """
+    @abstractmethod
+    def start(self, group_key: tp.Sequence[str], row: TRow) -> TRow:
+        """
+        :param group_key: columns rows are grouped by
+        :param row: first row of group
+        :return: partial row of group
+        """
+        pass
+
+    @abstractmethod
+    def add(self, partial: TRow, row: TRow) -> None:
+        """
+        :param partial: partial row of group, it is updated
+        :param row: next row of group
+        """
+        pass
+
+    @abstractmethod
+    def merge(self, partial: TRow, other: TRow) -> None:
+        """
+        :param partial: partial row of group, it is updated
+        :param other: partial row of next part of group
+        """
+        pass
+
+    def finish(self, group_key: tp.Sequence[str], partial: TRow) -> TRow:
+        """
+        :param group_key: columns rows are grouped by
+        :param partial: partial row of the whole group
+        :return: result row of reducer
+        """
+        return partial
+
+
+def group_ordering(group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+    """
+    Sort order of output of reducer which keeps group key columns and yields groups in input order
+    :param group_key: columns rows are grouped by
+    :param ordering: columns input rows are sorted by
+    """
+    prefix = ordering[:len(group_key)]
+    return prefix if set(prefix) == set(group_key) else ()
+
 
 def key_func_maker(keys: tp.Sequence[str]) -> tp.Callable[[tp.Dict[str, tp.Any]], tp.Tuple[tp.Any, ...]]:
     f_keys = keys
@@ -96,6 +250,64 @@ class Joiner(ABC):
         """
         pass
 
+    def required_columns(self, keys: tp.Sequence[str], needed: TColumns) -> TColumns:
+        """
+        Used by planner to drop columns nobody reads. Column of merged row may come from column of the other
+        name without suffix, and whether it gets suffix depends on columns of both rows, so such columns are
+        kept in both tables. Joiners which may merge rows differently are assumed to read all columns.
+        :param keys: join keys
+        :param needed: columns of output rows read by following operations, None if all of them
+        :return: columns of rows of every table the joiner needs, None if all of them
+        """
+        if needed is None or not BroadcastJoin.supports(self):
+            return None
+        columns = set(needed) | set(keys)
+        for column in needed:
+            for suffix in (self._a_suffix, self._b_suffix):
+                if suffix and column.endswith(suffix):
+                    columns.add(column[:-len(suffix)])
+        return frozenset(columns)
+
+    def output_columns(self, keys: tp.Sequence[str], columns_a: TColumns, columns_b: TColumns) -> TColumns:
+        """
+        Used by planner to infer columns of rows, joiners which may merge rows differently may yield any columns
+        :param keys: join keys
+        :param columns_a: columns rows of left table may have, None if unknown
+        :param columns_b: columns rows of right table may have, None if unknown
+        :return: columns output rows may have, None if unknown
+        """
+        if columns_a is None or columns_b is None or not BroadcastJoin.supports(self):
+            return None
+        common = (columns_a & columns_b) - frozenset(keys)
+        return columns_a | columns_b | {column + suffix for column in common
+                                        for suffix in (self._a_suffix, self._b_suffix)}
+
+    def filtered_tables(self, keys: tp.Sequence[str], columns: tp.Collection[str], columns_a: TColumns,
+                        columns_b: TColumns) -> tp.Tuple[bool, bool]:
+        """
+        Used by planner to push filters below join. Filter reading only join keys may be applied to both tables.
+        Filter reading keys and columns only one table has may be applied to this table, if rows of the other
+        table without pair are not yielded. Joiners which may merge rows differently are not passed by filters.
+        :param keys: join keys
+        :param columns: columns filter condition reads
+        :param columns_a: columns rows of left table may have, None if unknown
+        :param columns_b: columns rows of right table may have, None if unknown
+        :return: whether filter of joined rows may be applied to rows of left and right table instead
+        """
+        if not BroadcastJoin.supports(self):
+            return False, False
+        own = frozenset(columns) - frozenset(keys)
+        if not own:
+            return True, True
+        if columns_a is None or columns_b is None:
+            return False, False
+        joiner_call = type(self).__call__
+        if own <= columns_a - columns_b and joiner_call in (InnerJoiner.__call__, LeftJoiner.__call__):
+            return True, False
+        if own <= columns_b - columns_a and joiner_call in (InnerJoiner.__call__, RightJoiner.__call__):
+            return False, True
+        return False, False
+
     def join_row_pair(self, keys: tp.Sequence[str], row_a: tp.Dict[str, tp.Any], row_b: tp.Dict[str, tp.Any]) \
             -> tp.Dict[str, tp.Any]:
         """
@@ -115,6 +327,27 @@ class Joiner(ABC):
                 new_row[key] = row_b[key]
         return new_row
 
+    def pair_layout(self, keys: tp.Sequence[str], columns_a: tp.Collection[str],
+                    columns_b: tp.Collection[str]) -> tp.List[tp.Tuple[str, int, str]]:
+        """
+        Precompute how join_row_pair merges rows with given columns
+        :param keys: name of columns to use for join
+        :param columns_a: columns of row of left table
+        :param columns_b: columns of row of right table
+        :return: triples of column of merged row, index of source row (0 for left, 1 for right) and its column
+        """
+        layout: tp.List[tp.Tuple[str, int, str]] = []
+        for key in columns_a:
+            if key not in keys and key in columns_b:
+                layout.append((key + self._a_suffix, 0, key))
+                layout.append((key + self._b_suffix, 1, key))
+            else:
+                layout.append((key, 0, key))
+        for key in columns_b:
+            if key not in columns_a:
+                layout.append((key, 1, key))
+        return layout
+
     def join_rows(self, keys: tp.Sequence[str],
                   rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
         """
@@ -171,6 +404,56 @@ class Join(Operation):
                 key_b, group_b = get_next(iterator_b)
 
 
+class BroadcastJoin(Operation):
+    """
+    Join on empty list of keys, i.e. cross join. Right table is materialized once and every row of left table
+    is streamed and merged with all its rows; merge layout of columns is computed once per set of columns.
+    Result is the same as of Join with empty keys for joiners which cross join non-empty tables and merge
+    rows with Joiner.join_row_pair, see supports.
+    """
+    def __init__(self, joiner: Joiner):
+        """
+        :param joiner: joiner with particular strategy, it decides what to yield if one of tables is empty
+        """
+        self.joiner = joiner
+
+    @staticmethod
+    def supports(joiner: Joiner) -> bool:
+        """
+        :param joiner: joiner to check
+        :return: whether broadcast join with this joiner gives the same result as Join
+        """
+        joiner_type = type(joiner)
+        return joiner_type in (InnerJoiner, OuterJoiner, LeftJoiner, RightJoiner) \
+            or joiner_type.__call__ in (InnerJoiner.__call__, OuterJoiner.__call__, LeftJoiner.__call__,
+                                        RightJoiner.__call__) \
+            and joiner_type.join_rows is Joiner.join_rows and joiner_type.join_row_pair is Joiner.join_row_pair
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        """
+        :param rows: left table with data
+        :param args: contain right table with data
+        """
+        rows_b = list(args[0])
+        iterator_a = iter(rows)
+        first_a = next(iterator_a, None)
+        if first_a is None or not rows_b:
+            rows_a: tp.Iterable[TRow] = [] if first_a is None else chain([first_a], iterator_a)
+            yield from self.joiner([], rows_a, rows_b)
+            return
+        columns_b = [tuple(row_b) for row_b in rows_b]
+        layouts: tp.Dict[tp.Tuple[str, ...], tp.List[tp.List[tp.Tuple[str, int, str]]]] = {}
+        for row_a in chain([first_a], iterator_a):
+            columns_a = tuple(row_a)
+            row_layouts = layouts.get(columns_a)
+            if row_layouts is None:
+                row_layouts = layouts[columns_a] = [self.joiner.pair_layout([], columns_a, columns)
+                                                    for columns in columns_b]
+            for row_b, layout in zip(rows_b, row_layouts):
+                pair = (row_a, row_b)
+                yield {column: pair[side][source] for column, side, source in layout}
+
+
 # Dummy operators
 
 
@@ -179,6 +462,15 @@ class DummyMapper(Mapper):
     def __call__(self, row: TRow) -> TRowsGenerator:
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return ordering
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return needed
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return columns
+
 
 class FirstReducer(Reducer):
     """Yield only first row from passed ones"""
@@ -187,6 +479,18 @@ class FirstReducer(Reducer):
             yield row
             break
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        return group_ordering(group_key, ordering)
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        return None if needed is None else needed | frozenset(group_key)
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        return columns
+
+    def combiner(self, group_key: tp.Sequence[str]) -> tp.Optional[Combiner]:
+        return FirstCombiner()
+
 
 # Mappers
 
@@ -207,6 +511,38 @@ class Idf(Mapper):
         row[self.result_column] = math.log(row[self.total_doc_count]/row[self.doc_with_word_count])
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.total_doc_count, self.doc_with_word_count], [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(date: str) -> tp.Tuple[int, int, int]:
+    return int(date[:4]), int(date[4:6]), int(date[6:8])
+
+
+def parse_datetime(date: str) -> datetime.datetime:
+    """
+    Parse datetime in format %Y%m%dT%H%M%S with optional .%f, which is much faster than datetime.strptime.
+    Date part is memoized as timestamps of one table usually share few dates. Strings in other layout are
+    passed to datetime.strptime.
+    :param date: datetime in string format
+    """
+    if len(date) == 15 or len(date) > 16 and date[15] == '.' and len(date) <= 22 and date[16:].isdigit():
+        if date[8] == 'T' and date[:8].isdigit() and date[9:15].isdigit():
+            year, month, day = _parse_date(date[:8])
+            microsecond = int(date[16:].ljust(6, '0')) if len(date) > 15 else 0
+            return datetime.datetime(year, month, day, int(date[9:11]), int(date[11:13]), int(date[13:15]),
+                                     microsecond)
+    if '.' not in date:
+        date += '.0'
+    return datetime.datetime.strptime(date, "%Y%m%dT%H%M%S.%f")
+
 
 class FormatDate(Mapper):
     """Add column with datetime converted from string"""
@@ -219,15 +555,21 @@ class FormatDate(Mapper):
         self.result_column = result_column
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        date = row[self.date_column]
-        if '.' not in date:
-            date += '.0'
-        row[self.result_column] = datetime.datetime.strptime(date, "%Y%m%dT%H%M%S.%f")
+        row[self.result_column] = parse_datetime(row[self.date_column])
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.date_column], [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
 
 class WeekDay(Mapper):
-    """Add column with weekday of datetime column"""
+    """Add column with abbreviated English name of weekday of datetime column"""
     def __init__(self, date_column: str, result_column: str = 'day'):
         """
         :param date_column: name of column with date in datetime format
@@ -237,9 +579,18 @@ class WeekDay(Mapper):
         self.result_column = result_column
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        row[self.result_column] = row[self.date_column].strftime("%A")[:3]
+        row[self.result_column] = WEEKDAYS[row[self.date_column].weekday()]
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.date_column], [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
 
 class Hour(Mapper):
     """Add column with hour of datetime column"""
@@ -255,6 +606,15 @@ class Hour(Mapper):
         row[self.result_column] = row[self.date_column].hour
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.date_column], [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
 
 class DeltaTime(Mapper):
     """Add column with delta time for datetime columns in hours"""
@@ -272,32 +632,108 @@ class DeltaTime(Mapper):
         row[self.result_column] = (row[self.leave_time] - row[self.enter_time]).total_seconds() / (60 ** 2)
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.enter_time, self.leave_time], [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
+
+def haversine(lon_1: float, lat_1: float, lon_2: float, lat_2: float) -> float:
+    """
+    :return: distance between two points on Earth in km, coordinates are in degrees
+    """
+    lon_1, lat_1, lon_2, lat_2 = map(math.radians, (lon_1, lat_1, lon_2, lat_2))
+    d_lon = lon_2 - lon_1
+    d_lat = lat_2 - lat_1
+    a = math.sin(d_lat/2)**2 + math.cos(lat_1) * math.cos(lat_2) * math.sin(d_lon/2)**2
+    angle = 2 * math.asin(math.sqrt(a))
+    return EARTH_RADIUS * angle
+
+
+class EdgeLengths:
+    """
+    Cache of lengths of road graph edges by edge id. Coordinates are stored with length, so edge whose
+    coordinates changed is computed again. When cache is full new edges are not cached.
+    """
+    __slots__ = ('max_size', '_lengths')
+
+    def __init__(self, max_size: tp.Optional[int] = None) -> None:
+        """
+        :param max_size: maximum number of cached edges, EDGE_LENGTHS_CACHE_SIZE by default
+        """
+        self.max_size = max_size if max_size is not None else EDGE_LENGTHS_CACHE_SIZE
+        self._lengths: tp.Dict[tp.Any, tp.Tuple[tp.Tuple[float, ...], float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def get(self, edge_id: tp.Any, start: tp.Sequence[float], end: tp.Sequence[float]) -> tp.Optional[float]:
+        """
+        :return: cached length of edge or None
+        """
+        cached = self._lengths.get(edge_id)
+        if cached is not None and cached[0] == (*start, *end):
+            return cached[1]
+        return None
+
+    def put(self, edge_id: tp.Any, start: tp.Sequence[float], end: tp.Sequence[float], length: float) -> None:
+        """
+        Remember length of edge
+        """
+        if len(self._lengths) < self.max_size or edge_id in self._lengths:
+            self._lengths[edge_id] = ((*start, *end), length)
+
 
 class Length(Mapper):
     """
     Add column with distance between two points on Earth in km.
-    Points position defined by column with [longitude, latitude]
+    Points position defined by column with [longitude, latitude].
+    If column with edge id is given, lengths are cached by it and reused by following runs of the same mapper.
     """
-    def __init__(self, start_column: str, end_column: str, length_column: str):
+    def __init__(self, start_column: str, end_column: str, length_column: str,
+                 edge_id_column: tp.Optional[str] = None):
         """
         :param start_column: name of column with position of start point
         :param end_column: name of column with position of end point
         :param length_column: name of column to write calculated length in
+        :param edge_id_column: name of column with edge id to cache lengths by
         """
         self.start_column = start_column
         self.end_column = end_column
         self.length_column = length_column
+        self.edge_id_column = edge_id_column
+        self.lengths = EdgeLengths() if edge_id_column is not None else None
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        lon_1, lat_1, lon_2, lat_2 = map(math.radians, [*row[self.start_column], *row[self.end_column]])
-        d_lon = lon_2 - lon_1
-        d_lat = lat_2 - lat_1
-        a = math.sin(d_lat/2)**2 + math.cos(lat_1) * math.cos(lat_2) * math.sin(d_lon/2)**2
-        angle = 2 * math.asin(math.sqrt(a))
-        radius = 6371
-        row[self.length_column] = radius * angle
+        start = row[self.start_column]
+        end = row[self.end_column]
+        if self.lengths is None or self.edge_id_column is None:
+            row[self.length_column] = haversine(*start, *end)
+        else:
+            edge_id = row[self.edge_id_column]
+            length = self.lengths.get(edge_id, start, end)
+            if length is None:
+                length = haversine(*start, *end)
+                self.lengths.put(edge_id, start, end, length)
+            row[self.length_column] = length
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.length_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        read = [self.start_column, self.end_column]
+        if self.edge_id_column is not None:
+            read.append(self.edge_id_column)
+        return passed_columns(needed, read, [self.length_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.length_column])
+
 
 class Speed(Mapper):
     """Calculate speed from path length and path time in km/h"""
@@ -315,9 +751,20 @@ class Speed(Mapper):
         row[self.result_column] = row[self.length_column] / (row[self.dt_column])
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.length_column, self.dt_column], [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
 
 class FilterPunctuation(Mapper):
     """Left only non-punctuation symbols"""
+    PUNCTUATION = str.maketrans('', '', string.punctuation)
+
     def __init__(self, column: str):
         """
         :param column: name of column to process
@@ -325,9 +772,18 @@ class FilterPunctuation(Mapper):
         self.column = column
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        row[self.column] = row[self.column].translate(str.maketrans('', '', string.punctuation))
+        row[self.column] = row[self.column].translate(self.PUNCTUATION)
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.column], [self.column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return columns
+
 
 class LowerCase(Mapper):
     """Replace column value with value in lower case"""
@@ -345,6 +801,15 @@ class LowerCase(Mapper):
         row[self.column] = self._lower_case(row[self.column])
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.column], [self.column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return columns
+
 
 class Split(Mapper):
     """Split row on multiple rows by separator"""
@@ -362,6 +827,45 @@ class Split(Mapper):
             new_row[self.column] = sub_str
             yield new_row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.column], [self.column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return columns
+
+
+class Tokenize(Mapper):
+    """
+    Split text into words without punctuation in lower case, one row per word. Equals chain of FilterPunctuation,
+    LowerCase and Split, but text is processed in one pass and only the rows of words are created.
+    """
+    def __init__(self, column: str, separator: tp.Optional[str] = None) -> None:
+        """
+        :param column: name of column with text
+        :param separator: string to separate words by, whitespace by default
+        """
+        self.column = column
+        self.separator = separator
+
+    def __call__(self, row: TRow) -> TRowsGenerator:
+        column = self.column
+        for word in row[column].translate(FilterPunctuation.PUNCTUATION).lower().split(self.separator):
+            new_row = row.copy()
+            new_row[column] = word
+            yield new_row
+
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, [self.column], [self.column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return columns
+
 
 class Product(Mapper):
     """Calculates product of multiple columns"""
@@ -380,19 +884,41 @@ class Product(Mapper):
         row[self.result_column] = res
         yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return unchanged_prefix(ordering, [self.result_column])
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return passed_columns(needed, self.columns, [self.result_column])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return added_columns(columns, [self.result_column])
+
 
 class Filter(Mapper):
     """Remove records that don't satisfy some condition"""
-    def __init__(self, condition: tp.Callable[[TRow], bool]) -> None:
+    def __init__(self, condition: tp.Callable[[TRow], bool], columns: tp.Optional[tp.Sequence[str]] = None) -> None:
         """
         :param condition: if condition is not true - remove record
+        :param columns: names of columns condition reads, unknown by default, which keeps all columns up to filter
         """
         self.condition = condition
+        self.columns = columns
 
     def __call__(self, row: TRow) -> TRowsGenerator:
         if self.condition(row):
             yield row
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return ordering
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        if self.columns is None:
+            return None
+        return passed_columns(needed, self.columns, [])
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return columns
+
 
 class Project(Mapper):
     """Leave only mentioned columns"""
@@ -405,6 +931,36 @@ class Project(Mapper):
     def __call__(self, row: TRow) -> TRowsGenerator:
         yield {col: row[col] for col in self.columns}
 
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return tuple(takewhile(lambda column: column in self.columns, ordering))
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return frozenset(self.columns)
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return frozenset(self.columns)
+
+
+class Prune(Mapper):
+    """Leave only mentioned columns which are present in row, inserted by planner to drop columns nobody reads"""
+    def __init__(self, columns: tp.Iterable[str]) -> None:
+        """
+        :param columns: names of columns to keep
+        """
+        self.columns = frozenset(columns)
+
+    def __call__(self, row: TRow) -> TRowsGenerator:
+        yield {column: value for column, value in row.items() if column in self.columns}
+
+    def ordering(self, ordering: TOrdering) -> TOrdering:
+        return tuple(takewhile(lambda column: column in self.columns, ordering))
+
+    def required_columns(self, needed: TColumns) -> TColumns:
+        return self.columns if needed is None else self.columns & needed
+
+    def output_columns(self, columns: TColumns) -> TColumns:
+        return self.columns if columns is None else self.columns & columns
+
 
 # Reducers
 
@@ -423,6 +979,15 @@ class TopN(Reducer):
         for row in nlargest(self.n, rows, lambda row_val: row_val[self.column_max]):
             yield row
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        return group_ordering(group_key, ordering)
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        return None if needed is None else needed | frozenset([*group_key, self.column_max])
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        return columns
+
 
 class TermFrequency(Reducer):
     """Calculate frequency of values in column"""
@@ -455,6 +1020,15 @@ class TermFrequency(Reducer):
             new_row[self.result_column] = words_count[word] / row_number
             yield new_row
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        return group_ordering(group_key, ordering)
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        return frozenset([*group_key, self.words_column])
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        return frozenset([*group_key, self.words_column, self.result_column])
+
 
 class Count(Reducer):
     """Count rows passed and yield single row as a result"""
@@ -480,6 +1054,19 @@ class Count(Reducer):
         new_row[self.column] = row_number
         yield new_row
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        return group_ordering(group_key, ordering)
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        return frozenset(group_key)
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        return frozenset([*group_key, self.column])
+
+    def combiner(self, group_key: tp.Sequence[str]) -> tp.Optional[Combiner]:
+        # partial value in key column would break grouping of partial rows
+        return None if self.column in group_key else CountCombiner(self.column)
+
 
 class Sum(Reducer):
     """Sum values in column passed and yield single row as a result"""
@@ -503,6 +1090,19 @@ class Sum(Reducer):
         new_row[self.column] = sum_value
         yield new_row
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        return group_ordering(group_key, ordering)
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        return frozenset([*group_key, self.column])
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        return frozenset([*group_key, self.column])
+
+    def combiner(self, group_key: tp.Sequence[str]) -> tp.Optional[Combiner]:
+        # partial value in key column would break grouping of partial rows
+        return None if self.column in group_key else SumCombiner(self.column)
+
 
 class Mean(Reducer):
     """Find mean value in column passed and yield single row as a result"""
@@ -528,6 +1128,111 @@ class Mean(Reducer):
         new_row[self.column] = sum_value / num_rows
         yield new_row
 
+    def ordering(self, group_key: tp.Sequence[str], ordering: TOrdering) -> TOrdering:
+        return group_ordering(group_key, ordering)
+
+    def required_columns(self, group_key: tp.Sequence[str], needed: TColumns) -> TColumns:
+        return frozenset([*group_key, self.column])
+
+    def output_columns(self, group_key: tp.Sequence[str], columns: TColumns) -> TColumns:
+        return frozenset([*group_key, self.column])
+
+    def combiner(self, group_key: tp.Sequence[str]) -> tp.Optional[Combiner]:
+        # partial value in key column would break grouping of partial rows
+        return None if self.column in group_key else MeanCombiner(self.column)
+
+
+# Combiners
+
+
+def group_columns(group_key: tp.Sequence[str], row: TRow) -> TRow:
+    """
+    :param group_key: columns rows are grouped by
+    :param row: row of group
+    :return: columns of group key row has, in order of row
+    """
+    return {key: value for key, value in row.items() if key in group_key}
+
+
+class FirstCombiner(Combiner):
+    """Combiner of FirstReducer, partial row is the first row itself"""
+    def start(self, group_key: tp.Sequence[str], row: TRow) -> TRow:
+        return row
+
+    def add(self, partial: TRow, row: TRow) -> None:
+        pass
+
+    def merge(self, partial: TRow, other: TRow) -> None:
+        pass
+
+
+class CountCombiner(Combiner):
+    """Combiner of Count, partial row has number of rows"""
+    def __init__(self, column: str) -> None:
+        """
+        :param column: name of column to count
+        """
+        self.column = column
+
+    def start(self, group_key: tp.Sequence[str], row: TRow) -> TRow:
+        partial = group_columns(group_key, row)
+        partial[self.column] = 1
+        return partial
+
+    def add(self, partial: TRow, row: TRow) -> None:
+        partial[self.column] += 1
+
+    def merge(self, partial: TRow, other: TRow) -> None:
+        partial[self.column] += other[self.column]
+
+
+class SumCombiner(Combiner):
+    """Combiner of Sum, partial row has sum of values"""
+    def __init__(self, column: str) -> None:
+        """
+        :param column: name of column to sum
+        """
+        self.column = column
+
+    def start(self, group_key: tp.Sequence[str], row: TRow) -> TRow:
+        partial = group_columns(group_key, row)
+        partial[self.column] = 0 + row[self.column]
+        return partial
+
+    def add(self, partial: TRow, row: TRow) -> None:
+        partial[self.column] += row[self.column]
+
+    def merge(self, partial: TRow, other: TRow) -> None:
+        partial[self.column] += other[self.column]
+
+
+class MeanCombiner(Combiner):
+    """Combiner of Mean, partial row has pair of sum and number of values"""
+    def __init__(self, column: str) -> None:
+        """
+        :param column: name of column to calculate mean
+        """
+        self.column = column
+
+    def start(self, group_key: tp.Sequence[str], row: TRow) -> TRow:
+        partial = group_columns(group_key, row)
+        partial[self.column] = (0 + row[self.column], 1)
+        return partial
+
+    def add(self, partial: TRow, row: TRow) -> None:
+        sum_value, num_rows = partial[self.column]
+        partial[self.column] = (sum_value + row[self.column], num_rows + 1)
+
+    def merge(self, partial: TRow, other: TRow) -> None:
+        sum_value, num_rows = partial[self.column]
+        other_sum, other_rows = other[self.column]
+        partial[self.column] = (sum_value + other_sum, num_rows + other_rows)
+
+    def finish(self, group_key: tp.Sequence[str], partial: TRow) -> TRow:
+        sum_value, num_rows = partial[self.column]
+        partial[self.column] = sum_value / num_rows
+        return partial
+
 # Joiners
 
 
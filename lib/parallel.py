@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import typing as tp
+
+from collections import deque
+from multiprocessing import connection
+from multiprocessing.process import BaseProcess
+from os import environ
+
+from . import operations as ops
+from . import spill
+from . import transport
+
+GRAPH_WORKERS = int(environ.get("GRAPH_WORKERS", "1"))
+PARALLEL_TASK_BYTES = int(environ.get("PARALLEL_TASK_BYTES", str(4 * 1024 ** 2)))  # size of range of file
+PARALLEL_TASKS_IN_FLIGHT = 2  # tasks sent to every worker before result of the first one is read
+
+TTask = tp.Any
+TRunTask = tp.Callable[[TTask], ops.TRowsIterable]
+TFunction = tp.Callable[[TTask, str], tp.Any]
+
+
+def supported() -> bool:
+    """
+    Whether tasks may be run by worker processes: workers are forked, so that they inherit operations
+    which can not be pickled, e.g. lambdas and generated functions of fused maps
+    """
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def do_tasks(channel: transport.Channel, endpoint: connection.Connection, function: TFunction,
+             directory: str) -> None:
+    """
+    Receive tasks, call function with every task and send back its result
+    :param channel: channel to receive tasks from
+    :param endpoint: connection to send results through
+    :param function: function of task and directory for spill files
+    :param directory: directory for spill files
+    """
+    channel.open(sending=False)
+    for task in transport.receive(channel):
+        endpoint.send(function(task, directory))
+
+
+class WorkerPool:
+    """
+    Run function on tasks in worker processes and yield results in order of tasks. Tasks are sent to workers
+    round-robin, every worker has at most PARALLEL_TASKS_IN_FLIGHT of them at once. Workers are forked and
+    inherit function, so it need not be picklable, but tasks and results must be. Function is expected to write
+    large results to files in given directory and return paths to them.
+    """
+
+    def __init__(self, function: TFunction, workers: tp.Optional[int] = None) -> None:
+        """
+        :param function: function of task and directory for spill files, called in worker processes
+        :param workers: number of worker processes, GRAPH_WORKERS by default
+        """
+        self.function = function
+        self.workers = workers
+
+    @staticmethod
+    def _failed(process: BaseProcess) -> RuntimeError:
+        process.join()
+        return RuntimeError(f'Worker exited with code {process.exitcode}')
+
+    def __call__(self, tasks: tp.Iterable[TTask], directory: str) -> tp.Generator[tp.Any, None, None]:
+        """
+        :param tasks: tasks to run
+        :param directory: directory for spill files, it is owned by caller
+        """
+        workers = max(1, self.workers if self.workers is not None else GRAPH_WORKERS)
+        context = multiprocessing.get_context('fork')
+        channels: tp.List[transport.Channel] = []
+        endpoints: tp.List[connection.Connection] = []
+        processes: tp.List[BaseProcess] = []
+        for _ in range(workers):
+            channel = transport.make_channel()
+            local_endpoint, remote_endpoint = context.Pipe(duplex=False)
+            process = context.Process(target=do_tasks, args=(channel, remote_endpoint, self.function, directory))
+            process.start()
+            remote_endpoint.close()
+            channel.open(sending=True, peer=process)
+            channels.append(channel)
+            endpoints.append(local_endpoint)
+            processes.append(process)
+        try:
+            iterator = iter(tasks)
+            # workers of sent tasks whose results are not received yet, in order of tasks
+            pending: tp.Deque[int] = deque()
+            sent = 0
+
+            def send_next() -> None:
+                nonlocal sent
+                for task in iterator:
+                    worker = sent % workers
+                    try:
+                        transport.send(channels[worker], task)
+                    except BrokenPipeError:
+                        raise self._failed(processes[worker]) from None
+                    pending.append(worker)
+                    sent += 1
+                    return
+
+            for _ in range(workers * PARALLEL_TASKS_IN_FLIGHT):
+                send_next()
+            while pending:
+                worker = pending.popleft()
+                try:
+                    result = endpoints[worker].recv()
+                except EOFError:
+                    raise self._failed(processes[worker]) from None
+                send_next()
+                yield result
+            for worker in range(workers):
+                try:
+                    transport.send_end(channels[worker])
+                except BrokenPipeError:
+                    raise self._failed(processes[worker]) from None
+            for process in processes:
+                process.join()
+                if process.exitcode != 0:
+                    raise self._failed(process)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            for channel in channels:
+                channel.close()
+
+
+class ParallelMap(ops.Operation):
+    """
+    Run tasks on worker processes and yield their rows in order of tasks, as if tasks were run one after another.
+    Rows of every task are spilled by worker to a file, which main process reads when rows of previous tasks
+    are yielded.
+    """
+
+    def __init__(self, run_task: TRunTask, workers: tp.Optional[int] = None) -> None:
+        """
+        :param run_task: function from task to its rows, called in worker processes
+        :param workers: number of worker processes, GRAPH_WORKERS by default
+        """
+        self.run_task = run_task
+        self.workers = workers
+
+    def _spool(self, task: TTask, directory: str) -> str:
+        path = spill.run_path(directory, 'map-')
+        spill.write_rows(path, self.run_task(task))
+        return path
+
+    def __call__(self, tasks: tp.Iterable[TTask], *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        directory = spill.make_directory()
+        try:
+            for path in WorkerPool(self._spool, self.workers)(tasks, directory):
+                yield from spill.read_rows(path)
+                os.remove(path)
+        finally:
+            spill.remove_directory(directory)
@@ -0,0 +1,346 @@
+import ast
+import contextlib
+import itertools
+import json
+import marshal
+import mmap
+import os
+import struct
+import typing as tp
+
+from abc import ABC, abstractmethod
+from os import environ
+
+from . import operations as ops
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+READ_BLOCK_BYTES = int(environ.get("READ_BLOCK_BYTES", str(256 * 1024)))  # in bytes
+READ_MMAP = int(environ.get("READ_MMAP", "0"))  # read files via mmap
+BINARY_BLOCK_ROWS = int(environ.get("BINARY_BLOCK_ROWS", "1024"))  # maximum number of rows in one record
+
+BINARY_MAGIC = b'ROWS\x02\n'
+BINARY_MARSHAL_VERSION = 4
+_LENGTH = struct.Struct('<I')
+# Values allowed in rows of binary files, marshal may also load code objects which are rejected
+_SCALARS = frozenset([type(None), bool, int, float, complex, str, bytes])
+_CONTAINERS = frozenset([list, tuple, dict, set, frozenset])
+
+TParser = tp.Callable[[str], ops.TRow]
+TBlockParser = tp.Callable[[str], tp.Iterable[ops.TRow]]
+
+
+def _json_loads(text: str) -> tp.Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # orjson rejects integers wider than 64 bits which json accepts
+            pass
+    return json.loads(text)
+
+
+def _checked_row(value: tp.Any, line: str) -> ops.TRow:
+    if not isinstance(value, dict):
+        raise ValueError(f'Line is not a row: {line!r}')
+    return value
+
+
+def literal_row(line: str) -> ops.TRow:
+    """
+    Parse row written as Python literal, e.g. by repr, without evaluating code. Lines which are valid JSON
+    after replacing single quotes are decoded by JSON decoder, which is much faster, other lines are parsed
+    by ast.literal_eval.
+    :param line: line with dict literal
+    """
+    if '"' not in line and '\\' not in line:
+        # strings in single quotes without escapes contain no quotes at all, so they are kept unchanged
+        text = line.replace("'", '"')
+    else:
+        text = line
+    try:
+        return _checked_row(_json_loads(text), line)
+    except ValueError:
+        pass
+    return _checked_row(ast.literal_eval(line.strip()), line)
+
+
+def json_row(line: str) -> ops.TRow:
+    """
+    Parse row written as JSON object, orjson is used when installed
+    :param line: line with JSON object
+    """
+    return _checked_row(_json_loads(line), line)
+
+
+def _lines(text: str) -> tp.Iterator[str]:
+    return (line for line in text.split('\n') if line and not line.isspace())
+
+
+def _json_block(text: str) -> tp.Optional[tp.List[ops.TRow]]:
+    """Parse block of JSON lines as one JSON array, return None if block is not a list of rows one per line"""
+    text = text.rstrip()
+    if not text:
+        return []
+    try:
+        rows = _json_loads('[' + text.replace('\n', ',') + ']')
+    except ValueError:
+        return None
+    if len(rows) != text.count('\n') + 1 or not set(map(type, rows)) <= {dict}:
+        return None
+    return tp.cast(tp.List[ops.TRow], rows)
+
+
+def literal_block(text: str) -> tp.List[ops.TRow]:
+    """
+    Parse block of lines with rows written as Python literals. Blocks without double quotes and backslashes are
+    decoded by one call of JSON decoder when possible, other blocks are parsed line by line by literal_row.
+    :param text: whole lines
+    """
+    if '"' not in text and '\\' not in text:
+        rows = _json_block(text.replace("'", '"'))
+        if rows is not None:
+            return rows
+    return [literal_row(line) for line in _lines(text)]
+
+
+def json_block(text: str) -> tp.List[ops.TRow]:
+    """
+    Parse block of JSON lines by one call of JSON decoder when possible, otherwise line by line
+    :param text: whole lines
+    """
+    rows = _json_block(text)
+    if rows is not None:
+        return rows
+    return [json_row(line) for line in _lines(text)]
+
+
+class Reader(ABC):
+    """
+    Base class for readers of rows from files. Reader may be given byte range of file, so that several readers
+    split one file: ranges which cover file without gaps and overlaps read every row of file exactly once.
+    """
+    @abstractmethod
+    def __call__(self, filename: str, start: int = 0, end: tp.Optional[int] = None) -> ops.TRowsGenerator:
+        """
+        :param filename: file to read rows from
+        :param start: offset of range of file in bytes
+        :param end: end of range of file, None for end of file
+        """
+        pass
+
+
+@contextlib.contextmanager
+def _open(filename: str, use_mmap: tp.Optional[bool] = None) -> tp.Iterator[tp.Tuple[tp.BinaryIO, int]]:
+    """Open file for reading as file object or memory map, which support read, readline and seek, and its size"""
+    with open(filename, 'rb', buffering=max(1, READ_BLOCK_BYTES)) as file:
+        size = os.fstat(file.fileno()).st_size
+        if not (READ_MMAP if use_mmap is None else use_mmap) or size == 0:
+            yield file, size
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield tp.cast(tp.BinaryIO, mapped), size
+
+
+def read_blocks(filename: str, start: int = 0, end: tp.Optional[int] = None, block_bytes: tp.Optional[int] = None,
+                use_mmap: tp.Optional[bool] = None) -> tp.Iterator[bytes]:
+    """
+    Read file by blocks of whole lines, approximately block_bytes each. Only lines starting in range [start, end)
+    are read, line which starts before range is left to previous range.
+    :param filename: file to read
+    :param start: offset of range in bytes
+    :param end: end of range, None for end of file
+    :param block_bytes: size of block, READ_BLOCK_BYTES by default
+    :param use_mmap: read file via mmap, READ_MMAP by default
+    """
+    block_bytes = max(1, READ_BLOCK_BYTES if block_bytes is None else block_bytes)
+    with _open(filename, use_mmap) as (source, size):
+        end = size if end is None else min(end, size)
+        position = start
+        if start > 0:
+            source.seek(start - 1)
+            position += len(source.readline()) - 1
+        source.seek(position)
+        while position < end:
+            block = source.read(min(block_bytes, end - position))
+            if not block.endswith(b'\n'):
+                block += source.readline()
+            if not block:
+                break
+            position += len(block)
+            yield block
+
+
+def split_file(filename: str, parts: int) -> tp.List[tp.Tuple[int, int]]:
+    """
+    Split file into byte ranges of almost equal size for readers
+    :param filename: file to split
+    :param parts: number of ranges
+    """
+    size = os.path.getsize(filename)
+    bounds = [size * part // parts for part in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+class LineReader(Reader):
+    """
+    Read text file with one row per line, empty lines are skipped. File is read by blocks of READ_BLOCK_BYTES
+    of whole lines, which are decoded at once and parsed by block parser when it is given.
+    """
+    def __init__(self, parser: TParser, block_parser: tp.Optional[TBlockParser] = None) -> None:
+        """
+        :param parser: parser from line to row
+        :param block_parser: parser from text of whole lines to rows, by default lines are parsed one by one
+        """
+        self.parser = parser
+        self.block_parser = block_parser
+
+    def __call__(self, filename: str, start: int = 0, end: tp.Optional[int] = None) -> ops.TRowsGenerator:
+        for block in read_blocks(filename, start, end):
+            text = block.decode('utf-8')
+            if self.block_parser is not None:
+                yield from self.block_parser(text)
+            else:
+                yield from map(self.parser, _lines(text))
+
+
+def _check_values(values: tp.Iterable[tp.Any]) -> None:
+    """Raise ValueError if values contain anything but plain data, values are checked by levels of nesting"""
+    while True:
+        values = list(values)
+        if _SCALARS.issuperset(map(type, values)):
+            return
+        nested = [value for value in values if type(value) not in _SCALARS]
+        wrong = set(map(type, nested)) - _CONTAINERS
+        if wrong:
+            raise ValueError(f'Value of type {next(iter(wrong)).__name__} is not allowed in binary rows')
+        values = itertools.chain.from_iterable(
+            itertools.chain.from_iterable(value.items()) if type(value) is dict else value for value in nested)
+
+
+class BinaryReader(Reader):
+    """
+    Read file written by write_binary: magic header followed by records, every record is length as 4-byte little
+    endian integer and marshalled tuple of column names and list of tuples of values of rows with these columns.
+    Values other than plain data are rejected, so code objects are never returned, but marshal is not hardened
+    against malicious data, so the format is meant for files converted locally. Range of file contains records
+    whose lengths start in it, records before range are skipped by their lengths without reading them.
+    """
+    def __call__(self, filename: str, start: int = 0, end: tp.Optional[int] = None) -> ops.TRowsGenerator:
+        with _open(filename) as (source, size):
+            end = size if end is None else min(end, size)
+            if source.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError(f'File {filename!r} is not in binary row format')
+            position = len(BINARY_MAGIC)
+            while position < end:
+                header = source.read(_LENGTH.size)
+                if len(header) < _LENGTH.size:
+                    raise ValueError(f'File {filename!r} ends with incomplete record')
+                length, = _LENGTH.unpack(header)
+                if position < start:
+                    position += _LENGTH.size + length
+                    source.seek(position)
+                    continue
+                data = source.read(length)
+                if len(data) < length:
+                    raise ValueError(f'File {filename!r} ends with incomplete record')
+                position += _LENGTH.size + length
+                record = marshal.loads(data)
+                if type(record) is not tuple or len(record) != 2 or type(record[0]) is not tuple \
+                        or type(record[1]) is not list or not all(type(column) is str for column in record[0]):
+                    raise ValueError(f'Broken record in file {filename!r}')
+                columns, values = record
+                if not all(type(row) is tuple and len(row) == len(columns) for row in values):
+                    raise ValueError(f'Broken record in file {filename!r}')
+                _check_values(itertools.chain.from_iterable(values))
+                yield from map(dict, map(zip, itertools.repeat(columns), values))
+
+
+def write_binary(filename: str, rows: ops.TRowsIterable) -> int:
+    """
+    Write rows in format read by BinaryReader, return number of rows. Consecutive rows with the same columns
+    are written in one record of at most BINARY_BLOCK_ROWS rows.
+    :param filename: file to write
+    :param rows: rows to write
+    """
+    count = 0
+    columns: tp.Tuple[str, ...] = ()
+    values: tp.List[tp.Tuple[tp.Any, ...]] = []
+
+    def flush() -> None:
+        if values:
+            data = marshal.dumps((columns, values), BINARY_MARSHAL_VERSION)
+            file.write(_LENGTH.pack(len(data)) + data)
+            values.clear()
+
+    with open(filename, 'wb') as file:
+        file.write(BINARY_MAGIC)
+        for row in rows:
+            row_columns = tuple(row)
+            if row_columns != columns or len(values) >= BINARY_BLOCK_ROWS:
+                flush()
+                columns = row_columns
+            values.append(tuple(row.values()))
+            count += 1
+        flush()
+    return count
+
+
+def write_lines(filename: str, rows: ops.TRowsIterable, formatter: tp.Callable[[ops.TRow], str]) -> int:
+    """
+    Write rows one per line, return number of rows
+    :param filename: file to write
+    :param rows: rows to write
+    :param formatter: function from row to line without line break
+    """
+    count = 0
+    with open(filename, 'w') as file:
+        for row in rows:
+            file.write(formatter(row) + '\n')
+            count += 1
+    return count
+
+
+# Readers and writers of built-in formats by names
+READERS: tp.Dict[str, Reader] = {
+    'literal': LineReader(literal_row, literal_block),
+    'json': LineReader(json_row, json_block),
+    'binary': BinaryReader(),
+}
+WRITERS: tp.Dict[str, tp.Callable[[str, ops.TRowsIterable], int]] = {
+    'literal': lambda filename, rows: write_lines(filename, rows, repr),
+    'json': lambda filename, rows: write_lines(filename, rows, json.dumps),
+    'binary': write_binary,
+}
+
+TFormat = tp.Union[str, Reader, TParser]
+
+
+def make_reader(file_format: TFormat) -> Reader:
+    """
+    :param file_format: name of built-in format, reader, or parser of lines
+    :return: reader of rows in this format
+    """
+    if isinstance(file_format, str):
+        if file_format not in READERS:
+            raise ValueError(f'Unknown file format: {file_format}')
+        return READERS[file_format]
+    if isinstance(file_format, Reader):
+        return file_format
+    return LineReader(file_format)
+
+
+def convert(source: str, target: str, source_format: TFormat = 'literal', target_format: str = 'binary') -> int:
+    """
+    Convert file of rows from one format to another, return number of rows
+    :param source: file to read
+    :param target: file to write
+    :param source_format: format of source, see make_reader
+    :param target_format: name of built-in format of target
+    """
+    if target_format not in WRITERS:
+        raise ValueError(f'Unknown file format: {target_format}')
+    return WRITERS[target_format](target, make_reader(source_format)(source))
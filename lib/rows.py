@@ -0,0 +1,63 @@
+import sys
+import typing as tp
+
+from os import environ
+
+from . import operations as ops
+from . import spill
+
+ROW_SCHEMAS = int(environ.get("ROW_SCHEMAS", "1024"))  # maximum number of shared schemas
+
+TSchema = tp.Tuple[str, ...]
+# Schema of row followed by its values
+TPackedRow = tp.Tuple[tp.Any, ...]
+
+_schemas: tp.Dict[TSchema, TSchema] = {}
+
+
+def schema(columns: TSchema) -> TSchema:
+    """
+    Shared instance of schema, so that packed rows with the same columns refer to one tuple of column names.
+    When there are too many different schemas new ones are not shared.
+    :param columns: names of columns in order of row
+    """
+    shared = _schemas.get(columns)
+    if shared is not None:
+        return shared
+    if len(_schemas) < ROW_SCHEMAS:
+        _schemas[columns] = columns
+    return columns
+
+
+def pack(row: ops.TRow) -> TPackedRow:
+    """
+    Convert row to compact tuple of schema and values, which takes several times less memory than dict
+    as column names and hash table are not stored in every row
+    :param row: table row
+    """
+    return (schema(tuple(row)), *row.values())
+
+
+def unpack(packed: TPackedRow) -> ops.TRow:
+    """
+    Convert row packed by pack back to dict
+    :param packed: packed row
+    """
+    return dict(zip(packed[0], packed[1:]))
+
+
+def packed_size(packed: TPackedRow) -> int:
+    """
+    Estimate memory occupied by packed row in bytes, shared schema is not counted
+    :param packed: packed row
+    """
+    return sys.getsizeof(packed) + sum(map(spill.value_size, packed[1:]))
+
+
+def read_rows(path: str) -> ops.TRowsGenerator:
+    """
+    Lazily read rows packed with pack and written by spill.write_rows or spill.dump_chunk
+    :param path: path to file
+    """
+    for packed in spill.read_rows(path):
+        yield unpack(packed)
@@ -0,0 +1,463 @@
+import heapq
+import os
+import random
+import typing as tp
+
+from bisect import bisect_right
+from functools import partial
+from itertools import chain, count, islice
+from operator import itemgetter
+from os import environ
+
+from . import external_sort as es
+from . import hashing
+from . import operations as ops
+from . import parallel
+from . import rows as rows_lib
+from . import spill
+
+SHUFFLE_PARTITIONS = int(environ.get("SHUFFLE_PARTITIONS", "16"))
+SHUFFLE_BUFFER_BYTES = int(environ.get("SHUFFLE_BUFFER_BYTES", str(4 * 1024 ** 2)))  # in bytes
+SHUFFLE_SAMPLE_ROWS = int(environ.get("SHUFFLE_SAMPLE_ROWS", "1024"))  # rows sampled to estimate distribution
+# Keys taking at least this share of sampled rows are hot, their rows are combined before shuffle
+SHUFFLE_HOT_KEY_SHARE = float(environ.get("SHUFFLE_HOT_KEY_SHARE", "0.01"))
+SKEW_REPORT = int(environ.get("SKEW_REPORT", "0"))
+# Salt of hash of shuffle differs from salts of partitioning passes of hash aggregation and hash join, so that
+# rows of one partition are split by them
+SHUFFLE_SALT = -1
+
+# Files of every partition, rows of partition are rows of its files one after another
+TPartitions = tp.List[tp.List[str]]
+# Function writing files to given directory and returning files of partitions of every part of rows
+TSplit = tp.Callable[[str], tp.List[tp.List[str]]]
+# Spooled part of rows: path to file, number of rows and sample of their keys
+TPiece = tp.Tuple[str, int, tp.List[tp.Any]]
+TSpool = tp.Callable[[str], tp.List[TPiece]]
+
+
+class Skew:
+    """Number of rows in every partition of shuffle stage, measured when stage runs"""
+
+    def __init__(self, rows: tp.Sequence[int]) -> None:
+        """
+        :param rows: number of rows of every partition
+        """
+        self.rows = list(rows)
+
+    def ratio(self) -> float:
+        """
+        :return: number of rows of the largest partition divided by mean number of rows of partition
+        """
+        total = sum(self.rows)
+        return max(self.rows) * len(self.rows) / total if total else 1.0
+
+    def __str__(self) -> str:
+        return f'partitions={len(self.rows)}, rows={sum(self.rows)}, max={max(self.rows, default=0)}, ' \
+               f'min={min(self.rows, default=0)}, skew={self.ratio():.2f}'
+
+
+def read_partition(files: tp.Sequence[str]) -> ops.TRowsGenerator:
+    """
+    Lazily read rows of partition
+    :param files: files of partition in order of rows
+    """
+    for path in files:
+        yield from rows_lib.read_rows(path)
+
+
+def transpose(splits: tp.Iterable[tp.List[str]]) -> TPartitions:
+    """
+    :param splits: files of partitions of every part of rows, parts in order of rows
+    :return: files of every partition in order of rows
+    """
+    partitions: TPartitions = []
+    for files in splits:
+        if not partitions:
+            partitions = [[] for _ in files]
+        for partition, path in zip(partitions, files):
+            partition.append(path)
+    return partitions
+
+
+def merge_keyed(runs: tp.Sequence[str]) -> ops.TRowsGenerator:
+    """
+    Lazily merge files of pairs of key and row sorted by key, yield rows
+    :param runs: paths to files
+    """
+    for _, row in heapq.merge(*[spill.read_rows(run) for run in runs], key=itemgetter(0)):
+        yield row
+
+
+def split_buffered(rows: ops.TRowsIterable, partition: tp.Callable[[ops.TRow], int], partitions: int,
+                   directory: str, buffer_bytes: int) -> tp.List[str]:
+    """
+    Split rows into files of partitions, every partition buffers rows until its share of buffer is filled,
+    size of rows is estimated by first rows
+    :param rows: rows to split
+    :param partition: function from row to number of its partition
+    :param partitions: number of partitions
+    :param directory: directory for files
+    :param buffer_bytes: approximate memory for buffered rows of all partitions in bytes
+    """
+    iterator = iter(rows)
+    sample = list(islice(iterator, SHUFFLE_SAMPLE_ROWS))
+    rows_in_chunk = es.chunk_rows(max(1, buffer_bytes // partitions), sum(map(spill.row_size, sample)),
+                                  len(sample))
+    return hashing.split_rows(chain(sample, iterator), partition, partitions, directory, rows_in_chunk)
+
+
+def _counted(rows: ops.TRowsIterable, counter: tp.Iterator[int]) -> ops.TRowsGenerator:
+    # counter is advanced once per row, so next(counter) is number of rows read
+    for row, _ in zip(rows, counter):
+        yield row
+
+
+class Shuffle:
+    """
+    Route rows to partitions by hash of keys and spool every partition to its own file, rows with equal keys get
+    to the same partition and keep their order in it. When rows are reduced after shuffle by reducer with
+    combiner, rows are turned into its partial rows, and rows of keys frequent among first rows are combined
+    into one partial row per key, so that hot keys do not overload their partitions.
+    """
+
+    def __init__(self, keys: tp.Sequence[str], partitions: tp.Optional[int] = None,
+                 buffer_bytes: tp.Optional[int] = None, combiner: tp.Optional[ops.Combiner] = None) -> None:
+        """
+        :param keys: name of columns to hash
+        :param partitions: number of partitions, SHUFFLE_PARTITIONS by default
+        :param buffer_bytes: approximate memory for buffered rows of all partitions in bytes,
+            SHUFFLE_BUFFER_BYTES by default
+        :param combiner: combiner of reducer grouping rows by keys after shuffle
+        """
+        if partitions is not None and partitions <= 0:
+            raise ValueError(f'Number of partitions must be positive, got {partitions}')
+        self.keys = keys
+        self.partitions = partitions
+        self.buffer_bytes = buffer_bytes
+        self.combiner = combiner
+
+    def split(self, rows: ops.TRowsIterable, directory: str) -> tp.List[str]:
+        """
+        Spool rows to files of partitions, return paths to them, files are read back by read_partition
+        :param rows: rows to split
+        :param directory: directory for files
+        """
+        partitions = self.partitions if self.partitions is not None else max(1, SHUFFLE_PARTITIONS)
+        buffer_bytes = self.buffer_bytes if self.buffer_bytes is not None else SHUFFLE_BUFFER_BYTES
+        if self.combiner is not None:
+            rows = self._combined(rows)
+        keys = self.keys
+        return split_buffered(rows, lambda row: hashing.partition_of(ops.get_key_value(keys, row), SHUFFLE_SALT,
+                                                                     partitions),
+                              partitions, directory, buffer_bytes)
+
+    def _combined(self, rows: ops.TRowsIterable) -> ops.TRowsGenerator:
+        # Rows of hot keys are folded into one partial row per key yielded after other rows, which are turned
+        # into partial rows one by one, so partial rows of every group keep order of its rows
+        combiner = tp.cast(ops.Combiner, self.combiner)
+        iterator = iter(rows)
+        sample = list(islice(iterator, SHUFFLE_SAMPLE_ROWS))
+        counts: tp.Dict[tp.Tuple[tp.Any, ...], int] = {}
+        for row in sample:
+            key = ops.get_key_value(self.keys, row)
+            try:
+                counts[key] = counts.get(key, 0) + 1
+            except TypeError:
+                pass
+        threshold = max(2.0, SHUFFLE_HOT_KEY_SHARE * len(sample))
+        hot: tp.Dict[tp.Tuple[tp.Any, ...], tp.Optional[ops.TRow]] = \
+            {key: None for key, key_count in counts.items() if key_count >= threshold}
+        if not hot:
+            for row in chain(sample, iterator):
+                yield combiner.start(self.keys, row)
+            return
+        for row in chain(sample, iterator):
+            key = ops.get_key_value(self.keys, row)
+            try:
+                partial_row = hot[key]
+            except (KeyError, TypeError):
+                yield combiner.start(self.keys, row)
+                continue
+            if partial_row is None:
+                hot[key] = combiner.start(self.keys, row)
+            else:
+                combiner.add(partial_row, row)
+        for partial_row in hot.values():
+            if partial_row is not None:
+                yield partial_row
+
+
+class ShuffleReduce(ops.Operation):
+    """
+    Reduce which shuffles rows to partitions by hash of keys and reduces every partition independently
+    with hash aggregation on worker processes. Reduced partitions are merged by key, so result equals result
+    of hash aggregation of all rows, i.e. of sort followed by reduce. Reducer with combiner gets partial rows
+    from shuffle, in which hot keys are already combined.
+    """
+
+    def __init__(self, reduce: hashing.HashReduce, partitions: tp.Optional[int] = None,
+                 buffer_bytes: tp.Optional[int] = None, workers: tp.Optional[int] = None) -> None:
+        """
+        :param reduce: hash aggregation applied to every partition
+        :param partitions: number of partitions, SHUFFLE_PARTITIONS by default
+        :param buffer_bytes: memory for buffered rows of partitions in bytes, SHUFFLE_BUFFER_BYTES by default
+        :param workers: number of worker processes, parallel.GRAPH_WORKERS by default
+        """
+        self.reduce = reduce
+        combiner = reduce.combiner if isinstance(reduce, hashing.CombineReduce) else None
+        self.shuffle = Shuffle(reduce.sort_keys, partitions, buffer_bytes, combiner)
+        self.workers = workers
+        self.skew: tp.Optional[Skew] = None
+
+    def _reduce_partition(self, files: tp.List[str], directory: str) -> tp.Tuple[str, int]:
+        path = spill.run_path(directory, 'reduced-')
+        counter = count()
+        rows = _counted(read_partition(files), counter)
+        if isinstance(self.reduce, hashing.CombineReduce):
+            spill.write_rows(path, self.reduce.merged(rows))
+        else:
+            spill.write_rows(path, self.reduce.keyed(rows))
+        for file in files:
+            os.remove(file)
+        return path, next(counter)
+
+    def reduce_partitions(self, split: TSplit) -> ops.TRowsGenerator:
+        """
+        Reduce rows split into partitions
+        :param split: function writing files of partitions of parts of rows with shuffle of this operation
+        """
+        directory = spill.make_directory()
+        try:
+            partitions = transpose(split(directory))
+            results = list(parallel.WorkerPool(self._reduce_partition, self.workers)(partitions, directory))
+            self.skew = Skew([rows for _, rows in results])
+            yield from merge_keyed([path for path, _ in results])
+        finally:
+            spill.remove_directory(directory)
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from self.reduce_partitions(lambda directory: [self.shuffle.split(rows, directory)])
+
+
+class KeyedJoiner(ops.Joiner):
+    """Joiner yielding rows of other joiner together with key of their group, used to merge joined partitions"""
+
+    def __init__(self, joiner: ops.Joiner) -> None:
+        """
+        :param joiner: joiner yielding rows
+        """
+        super().__init__()
+        self.joiner = joiner
+
+    def __call__(self, keys: tp.Sequence[str], rows_a: ops.TRowsIterable, rows_b: ops.TRowsIterable) \
+            -> ops.TRowsGenerator:
+        rows_a = list(rows_a)
+        rows_b = list(rows_b)
+        key = ops.key_func_maker(keys)(rows_a[0] if rows_a else rows_b[0])
+        for row in self.joiner(keys, rows_a, rows_b):
+            yield tp.cast(ops.TRow, (key, row))
+
+
+class ShuffleJoin(ops.Operation):
+    """
+    Join which shuffles rows of both tables to partitions by hash of keys and joins every pair of partitions
+    independently on worker processes: partitions are sorted by external sort and merge joined. Joined
+    partitions are merged by key, so result equals result of merge join of sorted tables.
+    """
+
+    def __init__(self, joiner: ops.Joiner, keys: tp.Sequence[str], partitions: tp.Optional[int] = None,
+                 buffer_bytes: tp.Optional[int] = None, workers: tp.Optional[int] = None,
+                 memory_limit: tp.Optional[int] = None) -> None:
+        """
+        :param joiner: joiner with particular strategy
+        :param keys: name of columns for join
+        :param partitions: number of partitions, SHUFFLE_PARTITIONS by default
+        :param buffer_bytes: memory for buffered rows of partitions in bytes, SHUFFLE_BUFFER_BYTES by default
+        :param workers: number of worker processes, parallel.GRAPH_WORKERS by default
+        :param memory_limit: memory budget of sort of every partition in bytes
+        """
+        self.joiner = joiner
+        self.keys = keys
+        self.shuffle = Shuffle(keys, partitions, buffer_bytes)
+        self.workers = workers
+        self.memory_limit = memory_limit
+        self.skew: tp.Optional[Skew] = None
+
+    def _join_partition(self, files: tp.Tuple[tp.List[str], tp.List[str]], directory: str) -> tp.Tuple[str, int]:
+        sort = es.ExternalSort(self.keys, self.memory_limit, 1)
+        path = spill.run_path(directory, 'joined-')
+        counter = count()
+        joined = ops.Join(KeyedJoiner(self.joiner), self.keys)(sort(_counted(read_partition(files[0]), counter)),
+                                                               sort(_counted(read_partition(files[1]), counter)))
+        spill.write_rows(path, joined)
+        for file in chain(*files):
+            os.remove(file)
+        return path, next(counter)
+
+    def join_partitions(self, split_a: TSplit, split_b: TSplit) -> ops.TRowsGenerator:
+        """
+        Join tables split into partitions
+        :param split_a: function writing files of partitions of parts of left table with shuffle of this operation
+        :param split_b: the same for right table
+        """
+        directory = spill.make_directory()
+        try:
+            partitions = list(zip(transpose(split_a(directory)), transpose(split_b(directory))))
+            results = list(parallel.WorkerPool(self._join_partition, self.workers)(partitions, directory))
+            self.skew = Skew([rows for _, rows in results])
+            yield from merge_keyed([path for path, _ in results])
+        finally:
+            spill.remove_directory(directory)
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        """
+        :param rows: left table with data
+        :param args: contain right table with data
+        """
+        yield from self.join_partitions(lambda directory: [self.shuffle.split(rows, directory)],
+                                        lambda directory: [self.shuffle.split(args[0], directory)])
+
+
+def boundaries(pieces: tp.Sequence[TPiece], partitions: int) -> tp.List[tp.Any]:
+    """
+    Increasing keys splitting rows into ranges with about equal number of rows, estimated by samples of pieces.
+    Every sampled key stands for rows of its piece divided by size of its sample. Rows with equal keys can not
+    be split between ranges, so key taking several ranges gets a range of its own and there may be less ranges
+    than requested.
+    :param pieces: spooled pieces of rows
+    :param partitions: number of ranges
+    """
+    weighted = sorted(((key, rows / len(sample)) for _, rows, sample in pieces for key in sample), key=itemgetter(0))
+    total = sum(weight for _, weight in weighted)
+    result: tp.List[tp.Any] = []
+    accumulated = 0.0
+    part = 1
+    # whether range of hot key is closed by the next key
+    pending = False
+    for key, weight in weighted:
+        if pending and result[-1] < key:
+            result.append(key)
+            pending = False
+        accumulated += weight
+        while part < partitions and accumulated >= total * part / partitions:
+            if not result or result[-1] < key:
+                result.append(key)
+            else:
+                pending = True
+            part += 1
+    return result
+
+
+class RangeSort(ops.Operation):
+    """
+    Sort by ranges of keys on worker processes. Sampling pre-pass spools rows to pieces and samples their keys
+    uniformly, boundaries of ranges are quantiles of samples, so that ranges get about equal number of rows
+    even when keys are skewed. Pieces are split into ranges on workers, then every range is sorted by external
+    sort on a worker, and sorted ranges are read one after another, without merging in main process. Rows with
+    equal keys get to one range, so sort is stable.
+    """
+
+    def __init__(self, keys: tp.Sequence[str], partitions: tp.Optional[int] = None,
+                 workers: tp.Optional[int] = None, memory_limit: tp.Optional[int] = None) -> None:
+        """
+        :param keys: name of columns to sort by
+        :param partitions: number of ranges, SHUFFLE_PARTITIONS by default
+        :param workers: number of worker processes, parallel.GRAPH_WORKERS by default
+        :param memory_limit: memory budget of the sort in bytes, shared by workers, SORT_MEMORY_LIMIT by default
+        """
+        if partitions is not None and partitions <= 0:
+            raise ValueError(f'Number of partitions must be positive, got {partitions}')
+        self.keys = keys
+        self.partitions = partitions
+        self.workers = workers
+        self.memory_limit = memory_limit
+        self.skew: tp.Optional[Skew] = None
+
+    def spool_piece(self, rows: ops.TRowsIterable, directory: str) -> TPiece:
+        """
+        Write rows to one piece while sampling their keys
+        :param rows: rows of piece
+        :param directory: directory for file of piece
+        """
+        key_func = es.sort_key(self.keys)
+        generator = random.Random(0)
+        sample: tp.List[tp.Any] = []
+        rows_count = 0
+
+        def sampled() -> tp.Generator[rows_lib.TPackedRow, None, None]:
+            nonlocal rows_count
+            for row in rows:
+                # reservoir sampling keeps every row in sample with equal probability
+                if rows_count < SHUFFLE_SAMPLE_ROWS:
+                    sample.append(key_func(row))
+                else:
+                    index = generator.randrange(rows_count + 1)
+                    if index < SHUFFLE_SAMPLE_ROWS:
+                        sample[index] = key_func(row)
+                rows_count += 1
+                yield rows_lib.pack(row)
+
+        path = spill.run_path(directory, 'piece-')
+        spill.write_rows(path, sampled())
+        return path, rows_count, sample
+
+    def spool(self, rows: ops.TRowsIterable, directory: str) -> tp.List[TPiece]:
+        """
+        Sampling pre-pass in current process: write rows to pieces of about PARALLEL_TASK_BYTES
+        :param rows: rows to sort
+        :param directory: directory for files of pieces
+        """
+        iterator = iter(rows)
+        sample = list(islice(iterator, SHUFFLE_SAMPLE_ROWS))
+        piece_rows = max(1, parallel.PARALLEL_TASK_BYTES * len(sample) // max(1, sum(map(spill.row_size, sample))))
+        iterator = chain(sample, iterator)
+        pieces: tp.List[TPiece] = []
+        while True:
+            piece = self.spool_piece(islice(iterator, piece_rows), directory)
+            if not piece[1]:
+                os.remove(piece[0])
+                return pieces
+            pieces.append(piece)
+
+    @staticmethod
+    def _route(bounds: tp.List[tp.Any], key_func: tp.Callable[[ops.TRow], tp.Any], path: str,
+               directory: str) -> tp.List[str]:
+        files = split_buffered(rows_lib.read_rows(path), lambda row: bisect_right(bounds, key_func(row)),
+                               len(bounds) + 1, directory, SHUFFLE_BUFFER_BYTES)
+        os.remove(path)
+        return files
+
+    def _sort_range(self, memory_limit: int, files: tp.List[str], directory: str) -> tp.Tuple[str, int]:
+        path = spill.run_path(directory, 'range-')
+        rows = spill.write_rows(path, map(rows_lib.pack, es.ExternalSort(self.keys, memory_limit, 1)(
+            read_partition(files))))
+        for file in files:
+            os.remove(file)
+        return path, rows
+
+    def sort_pieces(self, spool: TSpool) -> ops.TRowsGenerator:
+        """
+        Sort rows spooled to pieces
+        :param spool: function writing pieces of rows to given directory with spool_piece of this operation
+        """
+        partitions = self.partitions if self.partitions is not None else max(1, SHUFFLE_PARTITIONS)
+        workers = max(1, self.workers if self.workers is not None else parallel.GRAPH_WORKERS)
+        memory_limit = self.memory_limit if self.memory_limit is not None else es.SORT_MEMORY_LIMIT
+        directory = spill.make_directory()
+        try:
+            pieces = spool(directory)
+            bounds = boundaries(pieces, partitions)
+            route = partial(self._route, bounds, es.sort_key(self.keys))
+            ranges = transpose(parallel.WorkerPool(route, workers)([path for path, _, _ in pieces], directory))
+            sort = partial(self._sort_range, max(1, memory_limit // workers))
+            counts: tp.List[int] = []
+            for path, rows in parallel.WorkerPool(sort, workers)(ranges, directory):
+                counts.append(rows)
+                yield from rows_lib.read_rows(path)
+                os.remove(path)
+            self.skew = Skew(counts)
+        finally:
+            spill.remove_directory(directory)
+
+    def __call__(self, rows: ops.TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        yield from self.sort_pieces(partial(self.spool, rows))
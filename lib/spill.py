@@ -0,0 +1,98 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import typing as tp
+
+from . import operations as ops
+
+CHUNK_ROWS = 1024
+
+
+def value_size(value: tp.Any) -> int:
+    """
+    Estimate memory occupied by cell value in bytes, elements of lists and tuples are counted one level deep
+    :param value: cell value
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+def row_size(row: ops.TRow) -> int:
+    """
+    Estimate memory occupied by row in bytes, including column names
+    :param row: table row
+    """
+    return sys.getsizeof(row) + sum(sys.getsizeof(key) + value_size(value) for key, value in row.items())
+
+
+def make_directory() -> str:
+    """Create temporary directory for spill files"""
+    return tempfile.mkdtemp(prefix='compute-graph-')
+
+
+def remove_directory(directory: str) -> None:
+    """
+    Remove spill directory with all files in it
+    :param directory: path to directory
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def dump_chunk(file: tp.BinaryIO, chunk: tp.List[tp.Any]) -> None:
+    """
+    Append pickled chunk of rows to file, it is read back by read_rows
+    :param file: file opened for binary writing
+    :param chunk: rows to write
+    """
+    pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+
+
+def write_rows(path: str, rows: tp.Iterable[tp.Any], chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    Write rows to file as a sequence of pickled chunks, return number of rows written
+    :param path: path to file
+    :param rows: rows to write
+    :param chunk_rows: number of rows in one pickled chunk
+    """
+    count = 0
+    chunk: tp.List[tp.Any] = []
+    with open(path, 'wb') as file:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                dump_chunk(file, chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            dump_chunk(file, chunk)
+            count += len(chunk)
+    return count
+
+
+def read_rows(path: str) -> tp.Generator[tp.Any, None, None]:
+    """
+    Lazily read rows written by write_rows, only one chunk is kept in memory
+    :param path: path to file
+    """
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                chunk = pickle.load(file)
+            except EOFError:
+                break
+            yield from chunk
+
+
+def run_path(directory: str, name: str) -> str:
+    """
+    Make unique path for spill file in directory
+    :param directory: spill directory
+    :param name: prefix of file name
+    """
+    descriptor, path = tempfile.mkstemp(prefix=name, suffix='.run', dir=directory)
+    os.close(descriptor)
+    return path
@@ -0,0 +1,136 @@
+import os
+import pickle
+import typing as tp
+
+from collections import deque
+from os import environ
+
+from . import operations as ops
+from . import rows
+from . import spill
+
+TEE_BUFFER_ROWS = int(environ.get("TEE_BUFFER_ROWS", "10000"))
+
+
+class SpillQueue:
+    """
+    FIFO queue of rows which keeps at most buffer_rows rows in memory, the rest is spooled to file.
+    Rows are stored packed, so popped row is a copy of appended one
+    """
+
+    def __init__(self, buffer_rows: int, make_path: tp.Callable[[], str]) -> None:
+        """
+        :param buffer_rows: maximum number of rows kept in memory
+        :param make_path: function creating path for spool file
+        """
+        self._buffer_rows = buffer_rows
+        self._make_path = make_path
+        self._memory: tp.Deque[rows.TPackedRow] = deque()
+        self._pending: tp.List[rows.TPackedRow] = []
+        self._path: tp.Optional[str] = None
+        self._writer: tp.Optional[tp.BinaryIO] = None
+        self._reader: tp.Optional[tp.BinaryIO] = None
+        self._unread_chunks = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._memory) or self._unread_chunks > 0 or bool(self._pending)
+
+    def _spilling(self) -> bool:
+        return self._unread_chunks > 0 or bool(self._pending)
+
+    def append(self, row: ops.TRow) -> None:
+        """
+        :param row: row to put to the end of queue
+        """
+        packed = rows.pack(row)
+        if not self._spilling() and len(self._memory) < self._buffer_rows:
+            self._memory.append(packed)
+            return
+        self._pending.append(packed)
+        if len(self._pending) >= spill.CHUNK_ROWS:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._writer is None:
+            self._path = self._make_path()
+            self._writer = open(self._path, 'wb')
+            self._reader = open(self._path, 'rb')
+        pickle.dump(self._pending, self._writer, pickle.HIGHEST_PROTOCOL)
+        self._writer.flush()
+        self._unread_chunks += 1
+        self._pending = []
+
+    def popleft(self) -> ops.TRow:
+        """Remove row from the beginning of queue and return it"""
+        if not self._memory:
+            if self._unread_chunks:
+                assert self._reader is not None
+                self._memory.extend(pickle.load(self._reader))
+                self._unread_chunks -= 1
+            else:
+                self._memory.extend(self._pending)
+                self._pending = []
+        return rows.unpack(self._memory.popleft())
+
+    def close(self) -> None:
+        """Remove spool file"""
+        if self._writer is not None and self._reader is not None and self._path is not None:
+            self._writer.close()
+            self._reader.close()
+            os.remove(self._path)
+            self._writer = self._reader = self._path = None
+        self._memory.clear()
+        self._pending = []
+        self._unread_chunks = 0
+
+
+class Tee:
+    """
+    Evaluate stream of rows once and replay it to several consumers. Every consumer has its own queue of rows
+    which were already pulled from the source by other consumers; queue is spooled to disk when consumers
+    advance at very different speeds. Consumers except the one which pulled the row get its copy made by queue.
+    """
+
+    def __init__(self, rows: ops.TRowsIterable, consumers: int, make_path: tp.Callable[[], str],
+                 buffer_rows: tp.Optional[int] = None) -> None:
+        """
+        :param rows: source rows
+        :param consumers: number of consumers
+        :param make_path: function creating path for spool files
+        :param buffer_rows: number of rows kept in memory for every consumer, TEE_BUFFER_ROWS by default
+        """
+        buffer_rows = buffer_rows if buffer_rows is not None else TEE_BUFFER_ROWS
+        self._rows = iter(rows)
+        self._queues = [SpillQueue(buffer_rows, make_path) for _ in range(consumers)]
+        self._active = [True] * consumers
+        self._next_consumer = 0
+        self._exhausted = False
+
+    def consumer(self) -> ops.TRowsGenerator:
+        """Create generator for next consumer"""
+        index = self._next_consumer
+        assert index < len(self._queues), 'All consumers of tee are already created'
+        self._next_consumer += 1
+        return self._consume(index)
+
+    def _consume(self, index: int) -> ops.TRowsGenerator:
+        queue = self._queues[index]
+        try:
+            while True:
+                if queue:
+                    yield queue.popleft()
+                    continue
+                if self._exhausted:
+                    break
+                try:
+                    row = next(self._rows)
+                except StopIteration:
+                    self._exhausted = True
+                    break
+                for other, other_queue in enumerate(self._queues):
+                    if other != index and self._active[other]:
+                        other_queue.append(row)
+                yield row
+        finally:
+            self._active[index] = False
+            queue.close()
@@ -0,0 +1,112 @@
+import typing as tp
+
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from . import columnar
+from . import operations as ops
+
+
+def test_batches_round_trip() -> None:
+    tests: ops.TRowsIterable = [
+        {'a': 1, 'b': 1.5, 'c': [1, 2]},
+        {'a': 2, 'b': 2.5, 'c': [3, 4]},
+        {'a': 3, 'c': 'x'},
+        {'a': 2 ** 70, 'c': None}
+    ]
+
+    batches = list(columnar.to_batches(tests, batch_rows=3))
+
+    assert 3 == len(batches)
+    assert [1.5, 2.5] == batches[0]['b']
+    assert tests == [row for batch in batches for row in columnar.to_rows(batch)]
+
+
+def test_vectorized_mappers() -> None:
+    start = datetime(2020, 1, 1, 12)
+    tests = [
+        {'start': [37.84 + i / 100, 55.73], 'end': [37.85, 55.74 - i / 100], 'a': i + 1, 'b': 2 * i + 1,
+         'enter': start, 'leave': start + timedelta(seconds=i, microseconds=7)}
+        for i in range(10)
+    ]
+    mappers = [
+        ops.Length('start', 'end', 'length'),
+        ops.DeltaTime('enter', 'leave', 'dt'),
+        ops.Speed('length', 'dt', 'speed'),
+        ops.Product(['a', 'b'], 'product'),
+        ops.Idf('b', 'a', 'idf'),
+        ops.Project(['length', 'dt', 'speed', 'product', 'idf'])
+    ]
+
+    etalon: tp.List[ops.TRow] = [dict(row) for row in tests]
+    for mapper in mappers:
+        etalon = list(ops.Map(mapper)(etalon))
+
+    result = list(columnar.BatchMap(mappers, batch_rows=4)(dict(row) for row in tests))
+
+    assert len(etalon) == len(result)
+    assert etalon == result
+
+
+def test_row_mapper_adapter() -> None:
+    tests: ops.TRowsIterable = [
+        {'doc_id': 1, 'text': 'hello, my little WORLD'},
+        {'doc_id': 2, 'text': 'Hello, my little little hell'}
+    ]
+    mappers = [ops.FilterPunctuation('text'), ops.LowerCase('text'), ops.Split('text')]
+
+    etalon: tp.List[ops.TRow] = [dict(row) for row in tests]
+    for mapper in mappers:
+        etalon = list(ops.Map(mapper)(etalon))
+
+    assert etalon == list(columnar.BatchMap(mappers, batch_rows=1)(dict(row) for row in tests))
+
+
+def test_batch_reduce() -> None:
+    tests = [{'a': i % 3, 'b': str(i % 2), 'int': i, 'float': i / 7} for i in range(100)]
+    sorted_tests = sorted(tests, key=itemgetter('b', 'a'))
+
+    for reducer in [ops.Count('int'), ops.Sum('int'), ops.Sum('float'), ops.Mean('int'), ops.Mean('float')]:
+        etalon = list(ops.Reduce(reducer, ['a', 'b'])(sorted_tests))
+
+        result = columnar.BatchReduce(reducer, ['a', 'b'], sort_keys=['b', 'a'], batch_rows=16)(iter(tests))
+
+        assert etalon == list(result)
+
+
+def test_batch_reduce_large_sum() -> None:
+    tests = [{'key': 1, 'value': 2 ** 62} for _ in range(4)]
+
+    result = columnar.BatchReduce(ops.Sum('value'), ['key'], batch_rows=3)(iter(tests))
+
+    assert [{'key': 1, 'value': 2 ** 64}] == list(result)
+
+
+def test_cached_edge_lengths() -> None:
+    tests = [{'edge_id': i % 7, 'start': [37.5 + i % 7 / 10, 55.7], 'end': [37.6, 55.8 - i % 7 / 10]}
+             for i in range(30)]
+    etalon = list(ops.Map(ops.Length('start', 'end', 'length'))(dict(row) for row in tests))
+
+    mapper = ops.Length('start', 'end', 'length', 'edge_id')
+    assert etalon == list(columnar.BatchMap([mapper], batch_rows=8)(dict(row) for row in tests))
+    assert 7 == len(mapper.lengths)
+    assert etalon == list(columnar.BatchMap([mapper], batch_rows=8)(dict(row) for row in tests))
+    assert etalon == list(ops.Map(mapper)(dict(row) for row in tests))
+
+
+def test_vectorized_dates() -> None:
+    tests = [{'enter': f'201710{i % 28 + 1:02}T{i % 24:02}2238.{i}', 'leave': f'201710{i % 28 + 1:02}T235959'}
+             for i in range(50)]
+    mappers = [
+        ops.FormatDate('enter', 'enter_dt'),
+        ops.FormatDate('leave', 'leave_dt'),
+        ops.WeekDay('enter_dt', 'weekday'),
+        ops.Hour('enter_dt', 'hour'),
+        ops.DeltaTime('enter_dt', 'leave_dt', 'dt')
+    ]
+
+    etalon: tp.List[ops.TRow] = [dict(row) for row in tests]
+    for mapper in mappers:
+        etalon = list(ops.Map(mapper)(etalon))
+
+    assert etalon == list(columnar.BatchMap(mappers, batch_rows=16)(dict(row) for row in tests))
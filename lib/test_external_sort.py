@@ -0,0 +1,100 @@
+from operator import itemgetter
+
+from pytest import MonkeyPatch, raises
+
+from . import external_sort as es
+from . import operations as ops
+
+
+def test_external_sort_in_memory() -> None:
+    tests: ops.TRowsIterable = [
+        {'key': 3, 'value': 'a'},
+        {'key': 1, 'value': 'b'},
+        {'key': 2, 'value': 'c'},
+        {'key': 1, 'value': 'd'}
+    ]
+
+    etalon: ops.TRowsIterable = [
+        {'key': 1, 'value': 'b'},
+        {'key': 1, 'value': 'd'},
+        {'key': 2, 'value': 'c'},
+        {'key': 3, 'value': 'a'}
+    ]
+
+    result = es.ExternalSort(['key'])(tests)
+
+    assert etalon == list(result)
+
+
+def test_external_sort_spills_runs() -> None:
+    tests = [{'key': (i * 7919) % 100, 'order': i} for i in range(1000)]
+
+    result = es.ExternalSort(['key'], memory_limit=1024)(iter(tests))
+
+    assert sorted(tests, key=itemgetter('key')) == list(result)
+
+
+def test_external_sort_multiple_keys() -> None:
+    tests = [{'a': i % 3, 'b': -i % 5, 'order': i} for i in range(100)]
+
+    result = es.ExternalSort(['a', 'b'], memory_limit=512)(iter(tests))
+
+    assert sorted(tests, key=itemgetter('a', 'b')) == list(result)
+
+
+def test_external_sort_empty() -> None:
+    assert [] == list(es.ExternalSort(['key'])(iter([])))
+
+
+def test_external_sort_parallel_workers() -> None:
+    tests = [{'key': (i * 31) % 17, 'order': i} for i in range(2000)]
+
+    result = es.ExternalSort(['key'], memory_limit=4096, workers=3)(iter(tests))
+
+    assert sorted(tests, key=itemgetter('key')) == list(result)
+
+
+def test_external_sort_global_workers(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(es, 'SORT_WORKERS', 2)
+    tests = [{'key': -i % 5, 'order': i} for i in range(100)]
+
+    result = es.ExternalSort(['key'])(iter(tests))
+
+    assert sorted(tests, key=itemgetter('key')) == list(result)
+
+
+def test_external_sort_multi_pass_merge(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(es, 'SORT_MERGE_FAN_IN', 3)
+    tests = [{'key': (i * 7919) % 50, 'order': i} for i in range(500)]
+
+    result = es.ExternalSort(['key'], memory_limit=1)(iter(tests))
+
+    assert sorted(tests, key=itemgetter('key')) == list(result)
+
+
+def test_external_sort_rejects_non_positive_memory_limit() -> None:
+    with raises(ValueError):
+        es.ExternalSort(['key'], memory_limit=0)
+
+
+def test_external_sort_worker_failure() -> None:
+    tests = [{'key': 1}, {'other': 2}]
+
+    with raises(RuntimeError):
+        list(es.ExternalSort(['key'])(iter(tests)))
+
+
+def test_external_sort_worker_failure_while_sending() -> None:
+    tests = [{'other': 0}] + [{'key': i, 'value': 'x' * 100} for i in range(50000)]
+
+    with raises(RuntimeError):
+        list(es.ExternalSort(['key'], memory_limit=1024)(iter(tests)))
+
+
+def test_group_sort() -> None:
+    tests = [{'a': i // 100, 'b': (i * 7919) % 13, 'order': i} for i in range(500)]
+
+    for memory_limit in [None, 1024]:
+        result = es.GroupSort(es.ExternalSort(['a', 'b'], memory_limit=memory_limit), 1)(iter(tests))
+
+        assert sorted(tests, key=itemgetter('a', 'b')) == list(result)
@@ -0,0 +1,49 @@
+import typing as tp
+
+from . import fusion
+from . import operations as ops
+
+
+class Duplicate(ops.Mapper):
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        yield dict(row)
+        yield dict(row)
+
+
+class UpperFilter(ops.Filter):
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        yield row
+
+
+def apply_chain(mappers: tp.Sequence[ops.Mapper], rows: tp.List[ops.TRow]) -> tp.List[ops.TRow]:
+    result = [dict(row) for row in rows]
+    for mapper in mappers:
+        result = list(ops.Map(mapper)(result))
+    return result
+
+
+def test_fused_map() -> None:
+    tests = [{'doc_id': i, 'text': f'Hello, little WORLD {i}!', 'other': i % 3} for i in range(20)]
+    mappers = [
+        ops.FilterPunctuation('text'),
+        ops.LowerCase('text'),
+        ops.Filter(lambda row: row['other'] != 1),
+        Duplicate(),
+        ops.Split('text'),
+        ops.Project(['doc_id', 'text']),
+        ops.DummyMapper(),
+        ops.Filter(lambda row: row['text'] != 'little'),
+        ops.Project(['text'])
+    ]
+
+    for length in range(len(mappers) + 1):
+        etalon = apply_chain(mappers[:length], tests)
+
+        assert etalon == list(fusion.FusedMap(mappers[:length])(dict(row) for row in tests))
+
+
+def test_subclass_is_not_inlined() -> None:
+    tests = [{'a': 1}, {'a': 2}]
+    mappers = [UpperFilter(lambda row: False)]
+
+    assert tests == list(fusion.FusedMap(mappers)(dict(row) for row in tests))
@@ -0,0 +1,165 @@
+import typing as tp
+
+from operator import itemgetter
+
+from pytest import MonkeyPatch, raises
+
+from . import hashing
+from . import operations as ops
+
+
+def sort_reduce(reducer: ops.Reducer, keys: tp.Sequence[str], rows: tp.List[ops.TRow]) -> tp.List[ops.TRow]:
+    return list(ops.Reduce(reducer, keys)(sorted(rows, key=ops.key_func_maker(keys))))
+
+
+def test_hash_reduce_in_memory() -> None:
+    tests = [{'key': (i * 7919) % 10, 'value': i} for i in range(100)]
+
+    result = hashing.HashReduce(ops.Sum('value'), ['key'])(iter(tests))
+
+    assert sort_reduce(ops.Sum('value'), ['key'], tests) == list(result)
+
+
+def test_hash_reduce_keeps_order_inside_group() -> None:
+    tests = [{'a': i % 3, 'b': i % 2, 'value': i} for i in range(30)]
+
+    result = hashing.HashReduce(ops.FirstReducer(), ['b', 'a'], sort_keys=['a', 'b'])(iter(tests))
+
+    assert sort_reduce(ops.FirstReducer(), ['a', 'b'], tests) == list(result)
+
+
+def test_hash_reduce_spills_partitions(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, 'HASH_PARTITIONS', 4)
+    tests = [{'key': (i * 7919) % 300, 'text': str(i)} for i in range(3000)]
+
+    result = hashing.HashReduce(ops.TermFrequency('text'), ['key'], memory_limit=16 * 1024)(iter(tests))
+
+    assert sort_reduce(ops.TermFrequency('text'), ['key'], tests) == list(result)
+
+
+def test_hash_reduce_falls_back_to_sort_for_large_group(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, 'HASH_PARTITIONS', 2)
+    tests = [{'key': 1, 'value': i} for i in range(1000)] + [{'key': 0, 'value': 1}]
+
+    result = hashing.HashReduce(ops.Count('count'), ['key'], memory_limit=1024)(iter(tests))
+
+    assert [{'key': 0, 'count': 1}, {'key': 1, 'count': 1000}] == list(result)
+
+
+def test_hash_reduce_unhashable_key() -> None:
+    tests = [{'key': [i % 2], 'value': i} for i in range(10)]
+
+    result = hashing.HashReduce(ops.Sum('value'), ['key'])(iter(tests))
+
+    assert [{'key': [0], 'value': 20}, {'key': [1], 'value': 25}] == list(result)
+
+
+def test_hash_reduce_rejects_non_positive_memory_limit() -> None:
+    with raises(ValueError):
+        hashing.HashReduce(ops.Count('count'), ['key'], memory_limit=0)
+
+
+def test_combine_reduce(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, 'HASH_PARTITIONS', 4)
+    tests = [{'key': (i * 7919) % 300, 'value': i % 11, 'order': i} for i in range(3000)]
+
+    reducers = [ops.Count('count'), ops.Sum('value'), ops.Mean('value'), ops.FirstReducer()]
+    for reducer in reducers:
+        for memory_limit in [None, 4096]:
+            result = hashing.CombineReduce(reducer, ['key'], memory_limit=memory_limit)(iter(tests))
+
+            assert sort_reduce(reducer, ['key'], tests) == list(result)
+
+
+def test_combine_reduce_unhashable_key() -> None:
+    tests = [{'key': [i % 2], 'value': i} for i in range(10)]
+
+    result = hashing.CombineReduce(ops.Mean('value'), ['key'])(iter(tests))
+
+    assert [{'key': [0], 'value': 4}, {'key': [1], 'value': 5}] == list(result)
+
+
+def test_combine_reduce_requires_combiner() -> None:
+    with raises(ValueError):
+        hashing.CombineReduce(ops.TermFrequency('text'), ['key'])
+
+
+def test_hash_top_n(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, 'HASH_PARTITIONS', 4)
+    tests = [{'key': (i * 7919) % 50, 'value': i % 7, 'order': i} for i in range(2000)]
+
+    for keys in [['key'], []]:
+        for memory_limit in [None, 2048]:
+            result = hashing.HashTopN(ops.TopN('value', 3), keys, memory_limit=memory_limit)(iter(tests))
+
+            assert sort_reduce(ops.TopN('value', 3), keys, tests) == list(result)
+
+
+def test_hash_top_n_unhashable_key() -> None:
+    tests = [{'key': [i % 2], 'value': -i} for i in range(10)]
+
+    result = hashing.HashTopN(ops.TopN('value', 2), ['key'])(iter(tests))
+
+    assert [{'key': [0], 'value': 0}, {'key': [0], 'value': -2}, {'key': [1], 'value': -1},
+            {'key': [1], 'value': -3}] == list(result)
+
+
+def merge_join(joiner: ops.Joiner, keys: tp.Sequence[str], rows_a: tp.List[ops.TRow],
+               rows_b: tp.List[ops.TRow]) -> tp.List[ops.TRow]:
+    return list(ops.Join(joiner, keys)(sorted(rows_a, key=itemgetter(*keys)), sorted(rows_b, key=itemgetter(*keys))))
+
+
+def canonical(rows: tp.Iterable[ops.TRow]) -> tp.List[tp.Any]:
+    return sorted(sorted(row.items()) for row in rows)
+
+
+JOINERS = [ops.InnerJoiner(), ops.LeftJoiner(), ops.RightJoiner(), ops.OuterJoiner()]
+
+
+def test_hash_join_small_left() -> None:
+    rows_a = [{'key': i, 'a': i} for i in range(0, 10, 2)]
+    rows_b = [{'key': (i * 7) % 13, 'b': i} for i in range(50)]
+
+    for joiner in JOINERS:
+        result = hashing.HashJoin(joiner, ['key'])(iter(rows_a), iter(rows_b))
+
+        assert canonical(merge_join(joiner, ['key'], rows_a, rows_b)) == canonical(result)
+
+
+def test_hash_join_small_right() -> None:
+    rows_a = [{'key': (i * 7) % 13, 'value': i} for i in range(200)]
+    rows_b = [{'key': i, 'value': -i} for i in range(0, 10, 3)]
+
+    for joiner in JOINERS:
+        result = hashing.HashJoin(joiner, ['key'], memory_limit=4096)(iter(rows_a), iter(rows_b))
+
+        assert canonical(merge_join(joiner, ['key'], rows_a, rows_b)) == canonical(result)
+
+
+def test_grace_hash_join(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, 'HASH_PARTITIONS', 4)
+    rows_a = [{'key': (i * 7) % 101, 'value': i} for i in range(300)]
+    rows_b = [{'key': (i * 11) % 97, 'value': -i} for i in range(300)]
+
+    for joiner in [ops.InnerJoiner(), ops.OuterJoiner()]:
+        result = hashing.HashJoin(joiner, ['key'], memory_limit=16 * 1024)(iter(rows_a), iter(rows_b))
+
+        assert canonical(merge_join(joiner, ['key'], rows_a, rows_b)) == canonical(result)
+
+
+def test_hash_join_unhashable_key() -> None:
+    rows_a = [{'key': [i % 2], 'a': i} for i in range(4)]
+    rows_b = [{'key': [1], 'b': 0}]
+
+    result = hashing.HashJoin(ops.InnerJoiner(), ['key'])(iter(rows_a), iter(rows_b))
+
+    assert [{'key': [1], 'a': 1, 'b': 0}, {'key': [1], 'a': 3, 'b': 0}] == list(result)
+
+
+def test_partition_of_unhashable_key() -> None:
+    keys = [([1, {'a': [2]}],), ([1, {'a': [2]}],), ({1, 2}, 'x'), ((1, [2]),)]
+
+    assert hashing.hashable(keys[0]) == hashing.hashable(keys[1])
+    assert hashing.partition_of(keys[0], 0, 7) == hashing.partition_of(keys[1], 0, 7)
+    assert all(0 <= hashing.partition_of(key, salt, 7) < 7 for key in keys for salt in range(3))
+    assert hashing.hashable(((1, [2]),)) == hashing.hashable(([1, (2,)],))
@@ -1,6 +1,8 @@
+import typing as tp
+
 from operator import itemgetter
 
-from pytest import approx
+from pytest import approx, raises
 
 from . import operations as ops
 from datetime import datetime as dt
@@ -84,6 +86,34 @@ def test_splitting() -> None:
     assert etalon == sorted(result, key=itemgetter('test_id', 'text'))
 
 
+def test_tokenize() -> None:
+    tests: ops.TRowsIterable = [
+        {'test_id': 1, 'text': 'Hello, my little WORLD!'},
+        {'test_id': 2, 'text': '"Quoted"\ttext--with\u00A0dashes'},
+        {'test_id': 3, 'text': '...'}
+    ]
+
+    etalon: ops.TRowsIterable = [
+        {'test_id': 1, 'text': 'hello'},
+        {'test_id': 1, 'text': 'little'},
+        {'test_id': 1, 'text': 'my'},
+        {'test_id': 1, 'text': 'world'},
+
+        {'test_id': 2, 'text': 'dashes'},
+        {'test_id': 2, 'text': 'quoted'},
+        {'test_id': 2, 'text': 'textwith'}
+    ]
+
+    chain = [dict(row) for row in tests]
+    for mapper in [ops.FilterPunctuation('text'), ops.LowerCase('text'), ops.Split('text')]:
+        chain = list(ops.Map(mapper)(chain))
+
+    result = list(ops.Map(ops.Tokenize(column='text'))(tests))
+
+    assert etalon == sorted(result, key=itemgetter('test_id', 'text'))
+    assert chain == result
+
+
 def test_product() -> None:
     tests: ops.TRowsIterable = [
         {'test_id': 1, 'speed': 5, 'distance': 10},
@@ -145,6 +175,51 @@ def test_projection() -> None:
     assert etalon == list(result)
 
 
+def test_prune() -> None:
+    tests: ops.TRowsIterable = [
+        {'test_id': 1, 'junk': 'x', 'value': 42},
+        {'test_id': 2, 'value': 1},
+        {'junk': 'z'}
+    ]
+
+    etalon: ops.TRowsIterable = [
+        {'test_id': 1, 'value': 42},
+        {'test_id': 2, 'value': 1},
+        {}
+    ]
+
+    result = ops.Map(ops.Prune(['value', 'test_id']))(tests)
+
+    assert etalon == list(result)
+
+
+def test_required_columns() -> None:
+    needed = frozenset(['a', 'day'])
+
+    assert frozenset(['a', 'date']) == ops.WeekDay('date').required_columns(needed)
+    assert ops.Filter(lambda row: row['b'] > 0).required_columns(needed) is None
+    assert frozenset(['a', 'b', 'day']) == ops.Filter(lambda row: row['b'] > 0, ['b']).required_columns(needed)
+    assert frozenset(['b']) == ops.Project(['b']).required_columns(None)
+    assert ops.Tokenize('text').required_columns(None) is None
+    assert frozenset(['k', 'c']) == ops.Sum('c').required_columns(['k'], needed)
+    assert frozenset(['k', 'c', 'a', 'day']) == ops.TopN('c', 3).required_columns(['k'], needed)
+
+
+def test_joiner_required_columns() -> None:
+    class SwappedJoiner(ops.InnerJoiner):
+        def join_row_pair(self, keys: tp.Sequence[str], row_a: ops.TRow, row_b: ops.TRow) -> ops.TRow:
+            return super().join_row_pair(keys, row_b, row_a)
+
+    needed = frozenset(['score_game', 'username'])
+
+    assert frozenset(['player_id', 'score', 'score_game', 'username']) == \
+        ops.InnerJoiner('_game', '_max').required_columns(['player_id'], needed)
+    assert SwappedJoiner().required_columns(['player_id'], needed) is None
+    assert frozenset(['player_id', 'score', 'score_game', 'score_max', 'username', 'game_id']) == \
+        ops.InnerJoiner('_game', '_max').output_columns(['player_id'], frozenset(['player_id', 'score', 'game_id']),
+                                                        frozenset(['player_id', 'score', 'username']))
+
+
 def test_dummy_reduce() -> None:
     tests: ops.TRowsIterable = [
         {'test_id': 1, 'text': 'hello, world'},
@@ -315,6 +390,32 @@ def test_mean() -> None:
     assert etalon == sorted(result, key=itemgetter('match_id'))
 
 
+def test_combiners() -> None:
+    tests: ops.TRowsIterable = [
+        {'a': 1, 'b': 2, 'f': 1.5},
+        {'a': 1, 'b': 3, 'f': 2.0},
+        {'a': 1, 'b': 4, 'f': 0.5},
+        {'a': 1, 'b': 5, 'f': 4.0}
+    ]
+
+    reducers: tp.List[ops.Reducer] = [ops.Count('count'), ops.Sum('b'), ops.Mean('f'), ops.FirstReducer()]
+    for reducer in reducers:
+        combiner = reducer.combiner(['a'])
+        assert combiner is not None
+        parts = []
+        for part in [tests[:1], tests[1:]]:
+            partial = combiner.start(['a'], dict(part[0]))
+            for row in part[1:]:
+                combiner.add(partial, row)
+            parts.append(partial)
+        combiner.merge(parts[0], parts[1])
+
+        assert list(reducer(['a'], tests)) == [combiner.finish(['a'], parts[0])]
+
+    assert ops.Sum('a').combiner(['a']) is None
+    assert ops.TopN('b', 2).combiner(['a']) is None
+
+
 def test_speed() -> None:
     races: ops.TRowsIterable = [
         {'race_id': 1, 'length': 10, 'time': 0.2},
@@ -366,6 +467,17 @@ def test_format_date() -> None:
     assert etalon == sorted(result, key=itemgetter('id'))
 
 
+def test_parse_datetime() -> None:
+    tests = ['20171020T112238.7', '20171020T112238.123456', '2017102T112238.5']
+
+    for date in tests:
+        assert dt.strptime(date, "%Y%m%dT%H%M%S.%f") == ops.parse_datetime(date)
+
+    for date in ['20171320T112238.5', '20171020T112238.1234567', '20171020T112238.', 'x']:
+        with raises(ValueError):
+            ops.parse_datetime(date)
+
+
 def test_week_day() -> None:
     visitors: ops.TRowsIterable = [
         {'id': 1, 'datetime': dt.strptime('20200429T112238.723000', "%Y%m%dT%H%M%S.%f")},
@@ -441,6 +553,26 @@ def test_delta_time() -> None:
     assert etalon == sorted(result, key=itemgetter('id'))
 
 
+def test_length() -> None:
+    edges: ops.TRowsIterable = [
+        {'edge_id': 1, 'start': [37.84870228730142, 55.73853974696249], 'end': [37.8490418381989, 55.73832445777953]},
+        {'edge_id': 2, 'start': [37.524768467992544, 55.88785375468433], 'end': [37.52415172755718, 55.88807155843824]}
+    ]
+
+    etalon = [0.03201, 0.04545]
+
+    mapper = ops.Length('start', 'end', 'length', 'edge_id')
+    for _ in range(2):
+        result = ops.Map(mapper)([dict(row) for row in edges])
+
+        assert approx(etalon, 0.001) == [row['length'] for row in result]
+    assert 2 == len(mapper.lengths)
+
+    point = [37.84870228730142, 55.73853974696249]
+    moved = [{'edge_id': 1, 'start': point, 'end': point}]
+    assert [0.] == [row['length'] for row in ops.Map(mapper)(moved)]
+
+
 def test_idf() -> None:
     data: ops.TRowsIterable = [
         {'id': 1, '1': 10, '2': 100},
@@ -625,3 +757,46 @@ def test_simple_join_with_collision() -> None:
                       keys=['player_id'])(presorted_games, presorted_players)
 
     assert etalon == sorted(result, key=itemgetter('game_id'))
+
+
+def test_broadcast_join() -> None:
+    words: ops.TRowsIterable = [
+        {'text': 'a', 'count': 2},
+        {'text': 'b', 'count': 1},
+        {'text': 'c'}
+    ]
+
+    totals: ops.TRowsIterable = [
+        {'count': 10, 'docs': 3},
+        {'count': 20, 'docs': 4}
+    ]
+
+    joiners = [ops.InnerJoiner('', '_total'), ops.LeftJoiner(), ops.RightJoiner(), ops.OuterJoiner()]
+    for joiner in joiners:
+        for left, right in [(words, totals), (words, []), ([], totals), ([], [])]:
+            etalon = list(ops.Join(joiner, keys=[])(left, right))
+
+            result = ops.BroadcastJoin(joiner)(iter(left), iter(right))
+
+            assert etalon == list(result)
+
+
+def test_broadcast_join_supports() -> None:
+    class SwappedJoiner(ops.InnerJoiner):
+        def join_row_pair(self, keys: tp.Sequence[str], row_a: ops.TRow, row_b: ops.TRow) -> ops.TRow:
+            return super().join_row_pair(keys, row_b, row_a)
+
+    assert ops.BroadcastJoin.supports(ops.InnerJoiner())
+    assert not ops.BroadcastJoin.supports(SwappedJoiner())
+
+
+def test_filtered_tables() -> None:
+    columns_a = frozenset(['player_id', 'score', 'username'])
+    columns_b = frozenset(['player_id', 'score', 'game_id'])
+
+    assert (True, True) == ops.OuterJoiner().filtered_tables(['player_id'], ['player_id'], None, None)
+    assert (True, False) == ops.InnerJoiner().filtered_tables(['player_id'], ['username'], columns_a, columns_b)
+    assert (False, True) == ops.RightJoiner().filtered_tables(['player_id'], ['game_id'], columns_a, columns_b)
+    assert (False, False) == ops.RightJoiner().filtered_tables(['player_id'], ['username'], columns_a, columns_b)
+    assert (False, False) == ops.InnerJoiner().filtered_tables(['player_id'], ['score_1'], columns_a, columns_b)
+    assert (False, False) == ops.InnerJoiner().filtered_tables(['player_id'], ['username'], columns_a, None)
@@ -0,0 +1,31 @@
+import typing as tp
+
+from pytest import MonkeyPatch, raises
+
+from . import operations as ops
+from . import parallel
+
+
+def run_task(task: int) -> tp.List[ops.TRow]:
+    if task < 0:
+        raise ValueError('Broken task')
+    return [{'task': task, 'index': index} for index in range(task % 5)]
+
+
+def test_parallel_map_keeps_order_of_tasks() -> None:
+    tasks = list(range(50))
+
+    assert [row for task in tasks for row in run_task(task)] == list(parallel.ParallelMap(run_task, 3)(tasks))
+    assert [] == list(parallel.ParallelMap(run_task, 2)([]))
+
+
+def test_parallel_map_worker_failure(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(parallel, 'PARALLEL_TASKS_IN_FLIGHT', 1)
+    with raises(RuntimeError):
+        list(parallel.ParallelMap(run_task, 2)([1, 2, 3, -1, 4]))
+
+
+def test_parallel_map_is_stopped_early() -> None:
+    rows = parallel.ParallelMap(run_task, 2)(range(1000))
+    assert {'task': 1, 'index': 0} == next(rows)
+    rows.close()
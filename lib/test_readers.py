@@ -0,0 +1,142 @@
+import os
+import tempfile
+
+from pytest import MonkeyPatch, raises
+
+from . import readers
+from . import testing
+
+
+def test_literal_row() -> None:
+    tests = [
+        {'doc_id': 1, 'text': 'hello, little world'},
+        {'text': "it's", 'quote': 'say "hi"', 'escaped': 'a\\b\tc'},
+        {'flag': True, 'none': None, 'pair': (1, 2.5), 'big': 2 ** 80, 'float': 1e-7},
+        {'edge_id': 8414926848168493057, 'start': [37.84870228730142, 55.73853974696249]},
+        {1: 'int key', 'nested': {'a': [{'b': 'c'}]}},
+    ]
+
+    for row in tests:
+        result = readers.literal_row(repr(row) + '\n')
+        assert row == result
+        assert [type(value) for value in row.values()] == [type(value) for value in result.values()]
+
+
+def test_literal_row_does_not_evaluate_code() -> None:
+    for line in ["__import__('os').system('true')", "{'a': __import__('os').getcwd()}", "{'a': 1 + 2}"]:
+        with raises(ValueError):
+            readers.literal_row(line)
+    with raises(ValueError):
+        readers.literal_row("[1, 2]")
+
+
+def test_testing_parser_reads_resources() -> None:
+    for path in [testing.text_path, testing.road_path, testing.travel_path]:
+        with open(path) as file:
+            lines = file.readlines()
+        assert [eval(line) for line in lines] == [testing.parser(line) for line in lines]
+
+
+def test_formats_round_trip(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(readers, 'BINARY_BLOCK_ROWS', 3)
+    monkeypatch.setattr(readers, 'READ_BLOCK_BYTES', 7)
+    rows = [{'id': i, 'text': f'row "{i}"\n', 'value': i / 3} for i in range(10)] + \
+        [{'other': [1, 'a', {'b': None}]}, {'id': -1, 'text': '', 'value': 0.0}]
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = f'{directory}/source.txt'
+        assert len(rows) == readers.write_lines(source, rows, repr)
+        for name in readers.WRITERS:
+            target = f'{directory}/{name}'
+            assert len(rows) == readers.convert(source, target, target_format=name)
+            assert rows == list(readers.READERS[name](target))
+            assert rows == list(readers.make_reader(name)(target))
+
+
+def test_binary_reader_rejects_wrong_files() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = f'{directory}/rows'
+        with open(path, 'w') as file:
+            file.write("{'a': 1}\n")
+        with raises(ValueError):
+            list(readers.BinaryReader()(path))
+
+        readers.write_binary(path, [{'a': 1}, {'a': 2}])
+        with open(path, 'rb') as file:
+            data = file.read()
+        with open(path, 'wb') as file:
+            file.write(data[:-1])
+        with raises(ValueError):
+            list(readers.BinaryReader()(path))
+
+        readers.write_binary(path, [{'a': compile('1', '<test>', 'eval')}])
+        with raises(ValueError):
+            list(readers.BinaryReader()(path))
+        readers.write_binary(path, [{'a': [(1, frozenset([compile('1', '<test>', 'eval')]))]}])
+        with raises(ValueError):
+            list(readers.BinaryReader()(path))
+
+
+def test_make_reader() -> None:
+    assert readers.READERS['json'] is readers.make_reader('json')
+    assert isinstance(readers.make_reader(testing.parser), readers.LineReader)
+    reader = readers.BinaryReader()
+    assert reader is readers.make_reader(reader)
+    with raises(ValueError):
+        readers.make_reader('xml')
+
+
+def test_block_parsers() -> None:
+    assert [{'a': 1}, {'b': 'x'}] == readers.literal_block("{'a': 1}\n\n{'b': 'x'}\n")
+    assert [{'a': 'it\'s'}, {'b': True}] == readers.literal_block("{'a': \"it's\"}\n{'b': True}")
+    assert [{'a': 1}, {'b': None}] == readers.json_block('{"a": 1}\r\n  \n{"b": null}\r\n')
+    assert [] == readers.json_block('\n')
+    with raises(ValueError):
+        readers.json_block('{"a": 1}, {"b": 2}\n')
+    with raises(ValueError):
+        readers.json_block('{"a": 1}\n[1]\n')
+
+
+def test_read_blocks_split_lines_between_ranges() -> None:
+    lines = [f'{"x" * (i % 7)}{i}\n'.encode() for i in range(50)] + [b'\n', b'last']
+    with tempfile.TemporaryDirectory() as directory:
+        path = f'{directory}/lines'
+        with open(path, 'wb') as file:
+            file.write(b''.join(lines))
+        size = os.path.getsize(path)
+        for use_mmap in [False, True]:
+            for block_bytes in [1, 5, 1000]:
+                assert b''.join(lines) == b''.join(readers.read_blocks(path, 0, None, block_bytes, use_mmap))
+                for middle in range(size + 1):
+                    first = list(readers.read_blocks(path, 0, middle, block_bytes, use_mmap))
+                    second = list(readers.read_blocks(path, middle, size, block_bytes, use_mmap))
+                    if middle <= size - len(lines[-1]):
+                        assert all(block.endswith(b'\n') for block in first)
+                    assert b''.join(lines) == b''.join(first + second)
+
+
+def test_readers_split_file(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(readers, 'BINARY_BLOCK_ROWS', 4)
+    monkeypatch.setattr(readers, 'READ_BLOCK_BYTES', 50)
+    rows = [{'id': i, 'text': 'word ' * (i % 5)} for i in range(40)]
+    with tempfile.TemporaryDirectory() as directory:
+        for name, write in readers.WRITERS.items():
+            path = f'{directory}/{name}'
+            write(path, rows)
+            for use_mmap in [0, 1]:
+                monkeypatch.setattr(readers, 'READ_MMAP', use_mmap)
+                for parts in [1, 2, 3, 7, 100]:
+                    ranges = readers.split_file(path, parts)
+                    assert parts == len(ranges)
+                    assert rows == [row for start, end in ranges for row in readers.READERS[name](path, start, end)]
+
+
+def test_abandoned_reader_closes_file() -> None:
+    if not os.path.isdir('/proc/self/fd'):
+        return
+    opened = len(os.listdir('/proc/self/fd'))
+    rows = testing.make_reader(testing.text_path)()
+    next(rows)
+    assert opened + 1 == len(os.listdir('/proc/self/fd'))
+    rows.close()
+    assert opened == len(os.listdir('/proc/self/fd'))
@@ -0,0 +1,28 @@
+from pytest import MonkeyPatch
+
+from . import rows
+from . import spill
+
+
+def test_pack_unpack() -> None:
+    tests = [{'a': 1, 'b': [1, 2]}, {'b': 'x', 'a': None}, {}]
+
+    packed = [rows.pack(row) for row in tests]
+
+    assert tests == [rows.unpack(row) for row in packed]
+    assert list(tests[1]) == list(rows.unpack(packed[1]))
+    assert rows.packed_size(packed[0]) < spill.row_size(tests[0])
+
+
+def test_schema_is_shared(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(rows, '_schemas', {})
+    monkeypatch.setattr(rows, 'ROW_SCHEMAS', 2)
+
+    first = rows.pack({'a': 1, 'b': 2})
+    second = rows.pack({'a': 3, 'b': 4})
+    assert first[0] is second[0]
+
+    rows.pack({'c': 1})
+    rows.pack({'d': 1})
+    assert 2 == len(rows._schemas)
+    assert {'d': 1} == rows.unpack(rows.pack({'d': 1}))
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import typing as tp
+
+from pytest import MonkeyPatch, raises
+
+from . import hashing
+from . import operations as ops
+from . import shuffle
+
+
+def sort_reduce(reducer: ops.Reducer, keys: tp.Sequence[str], rows: tp.List[ops.TRow]) -> tp.List[ops.TRow]:
+    return list(ops.Reduce(reducer, keys)(sorted(rows, key=ops.key_func_maker(keys))))
+
+
+def sort_join(joiner: ops.Joiner, keys: tp.Sequence[str], rows_a: tp.List[ops.TRow],
+              rows_b: tp.List[ops.TRow]) -> tp.List[ops.TRow]:
+    key = ops.key_func_maker(keys)
+    return list(ops.Join(joiner, keys)(sorted(rows_a, key=key), sorted(rows_b, key=key)))
+
+
+def test_shuffle_split() -> None:
+    tests = [{'key': (i * 7919) % 30, 'value': i} for i in range(1000)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = shuffle.Shuffle(['key'], 4, 1024).split(iter(tests), directory)
+        partitions = [list(shuffle.read_partition([path])) for path in paths]
+
+    assert 4 == len(partitions)
+    assert all(partitions)
+    assert sorted(tests, key=lambda row: row['value']) == sorted(sum(partitions, []), key=lambda row: row['value'])
+    keys = [{row['key'] for row in partition} for partition in partitions]
+    assert all(not keys[i] & keys[j] for i in range(4) for j in range(i))
+    assert all(partition == [row for row in tests if row['key'] in partition_keys]
+               for partition, partition_keys in zip(partitions, keys))
+    with raises(ValueError):
+        shuffle.Shuffle(['key'], 0)
+
+
+def test_transpose() -> None:
+    assert [['a0', 'b0'], ['a1', 'b1']] == shuffle.transpose(iter([['a0', 'a1'], ['b0', 'b1']]))
+    assert [] == shuffle.transpose([])
+
+
+def test_shuffle_reduce(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(hashing, 'HASH_PARTITIONS', 4)
+    tests = [{'key': (i * 7919) % 300, 'text': str(i % 7), 'value': i} for i in range(3000)]
+
+    for reducer, keys in [(ops.Sum('value'), ['key']), (ops.TermFrequency('text'), ['key']),
+                          (ops.FirstReducer(), ['text', 'key']), (ops.TopN('value', 2), ['text'])]:
+        reduce = hashing.HashReduce(reducer, keys, memory_limit=16 * 1024)
+        result = shuffle.ShuffleReduce(reduce, 5, 4096, workers=2)(iter(tests))
+        assert sort_reduce(reducer, keys, tests) == list(result)
+
+
+def test_shuffle_reduce_unhashable_key() -> None:
+    tests = [{'key': [i % 4, [i % 3]], 'value': i} for i in range(50)]
+
+    reduce = hashing.CombineReduce(ops.Count('count'), ['key'])
+    result = shuffle.ShuffleReduce(reduce, 3, workers=2)(iter(tests))
+
+    assert sort_reduce(ops.Count('count'), ['key'], tests) == list(result)
+
+
+def test_shuffle_reduce_removes_files() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        tempfile.tempdir, old_tempdir = directory, tempfile.tempdir
+        try:
+            reduce = hashing.HashReduce(ops.FirstReducer(), ['key'])
+            rows = shuffle.ShuffleReduce(reduce, 3, workers=2)(iter([{'key': i} for i in range(100)]))
+            next(rows)
+            rows.close()
+        finally:
+            tempfile.tempdir = old_tempdir
+        assert [] == os.listdir(directory)
+
+
+def test_shuffle_join() -> None:
+    rows_a = [{'key': (i * 7919) % 40, 'a': i} for i in range(300)]
+    rows_b = [{'key': (i * 31) % 60, 'b': i} for i in range(200)] + [{'key': 7, 'b': -1}]
+
+    for joiner in [ops.InnerJoiner(), ops.OuterJoiner(), ops.LeftJoiner(), ops.RightJoiner()]:
+        result = shuffle.ShuffleJoin(joiner, ['key'], 4, 4096, workers=2, memory_limit=1024)(iter(rows_a),
+                                                                                             iter(rows_b))
+        assert sort_join(joiner, ['key'], rows_a, rows_b) == list(result)
+
+
+def test_shuffle_combines_hot_keys(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(shuffle, 'SHUFFLE_SAMPLE_ROWS', 100)
+    tests = [{'key': -1 if i % 2 else i, 'value': i} for i in range(1000)]
+    combiner = ops.Sum('value').combiner(['key'])
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = shuffle.Shuffle(['key'], 4, combiner=combiner).split(iter(tests), directory)
+        partials = list(shuffle.read_partition(paths))
+
+    assert 501 == len(partials)
+    assert [{'key': -1, 'value': sum(range(1, 1000, 2))}] == [row for row in partials if row['key'] == -1]
+
+    for reducer in [ops.Count('count'), ops.Mean('value'), ops.FirstReducer()]:
+        reduce = hashing.CombineReduce(reducer, ['key'])
+        assert sort_reduce(reducer, ['key'], tests) == list(shuffle.ShuffleReduce(reduce, 4, workers=2)(iter(tests)))
+
+
+def test_boundaries() -> None:
+    pieces = [('a', 100, list(range(0, 100, 2))), ('b', 50, list(range(1, 100, 2)))]
+    assert [24, 49, 74] == shuffle.boundaries(pieces, 4)
+    assert [] == shuffle.boundaries(pieces, 1)
+    assert [] == shuffle.boundaries([], 4)
+    assert ['b', 'c'] == shuffle.boundaries([('a', 10, ['a', 'b', 'b', 'b', 'b', 'b', 'b', 'c'])], 4)
+
+
+def test_range_sort(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(shuffle, 'SHUFFLE_SAMPLE_ROWS', 50)
+    uniform = [{'key': (i * 7919) % 1000, 'order': i} for i in range(2000)]
+    skewed = [{'key': 'hot' if i % 3 else str(i), 'order': i} for i in range(2000)]
+
+    for tests in [uniform, skewed, sorted(uniform, key=lambda row: row['key']), []]:
+        sort = shuffle.RangeSort(['key'], 8, workers=2, memory_limit=16 * 1024)
+        assert sorted(tests, key=lambda row: row['key']) == list(sort(iter(tests)))
+        assert sort.skew is not None and len(tests) == sum(sort.skew.rows)
+
+    monkeypatch.setattr(shuffle.parallel, 'PARALLEL_TASK_BYTES', 4096)
+    sort = shuffle.RangeSort(['key'], 8, workers=2)
+    assert sorted(uniform, key=lambda row: row['key']) == list(sort(iter(uniform)))
+    assert sort.skew is not None and 8 == len(sort.skew.rows) and sort.skew.ratio() < 2
@@ -0,0 +1,42 @@
+import tempfile
+
+from . import tee
+
+
+def test_spill_queue() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        paths = iter(f'{directory}/{i}' for i in range(100))
+        queue = tee.SpillQueue(10, lambda: next(paths))
+        rows = [{'id': i} for i in range(5000)]
+        result = []
+        for row in rows:
+            queue.append(row)
+            if row['id'] % 3 == 0:
+                result.append(queue.popleft())
+        while queue:
+            result.append(queue.popleft())
+        queue.close()
+
+        assert rows == result
+
+
+def test_tee_replays_rows_to_all_consumers() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        paths = iter(f'{directory}/{i}' for i in range(100))
+        rows = [{'id': i} for i in range(3000)]
+        splitter = tee.Tee(iter(rows), 2, lambda: next(paths), buffer_rows=100)
+        first = splitter.consumer()
+        second = splitter.consumer()
+
+        assert rows == list(first)
+        assert rows == list(second)
+
+
+def test_tee_copies_rows_for_other_consumers() -> None:
+    splitter = tee.Tee(iter([{'id': 1}]), 2, lambda: '')
+    first = splitter.consumer()
+    second = splitter.consumer()
+    row = next(first)
+    row['id'] = 2
+
+    assert [{'id': 1}] == list(second)
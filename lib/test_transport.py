@@ -0,0 +1,72 @@
+import os
+import pickle
+import typing as tp
+
+from multiprocessing import Process
+
+from pytest import raises
+
+from . import transport
+
+
+def produce(channel: transport.Channel, messages: tp.List[tp.Any]) -> None:
+    channel.open(sending=True)
+    for message in messages:
+        transport.send(channel, message)
+    transport.send_end(channel)
+
+
+def check_round_trip(channel: transport.Channel) -> None:
+    messages = [list(range(i * 100)) for i in range(50)]
+    process = Process(target=produce, args=(channel, messages))
+    process.start()
+    channel.open(sending=False, peer=process)
+    assert messages == list(transport.receive(channel))
+    process.join()
+    channel.close()
+
+
+def test_pipe_channel() -> None:
+    check_round_trip(transport.make_channel('pipe'))
+
+
+def test_ring_buffer() -> None:
+    check_round_trip(transport.make_channel('shm'))
+
+
+def test_ring_buffer_message_larger_than_capacity() -> None:
+    check_round_trip(transport.RingBuffer(capacity=64))
+
+
+def die(channel: transport.Channel) -> None:
+    channel.open(sending=False)
+    os._exit(1)
+
+
+def check_dead_receiver(channel: transport.Channel) -> None:
+    process = Process(target=die, args=(channel,))
+    process.start()
+    channel.open(sending=True, peer=process)
+    with raises(BrokenPipeError):
+        for _ in range(1000):
+            channel.send_bytes(bytes(64 * 1024))
+    process.join()
+    channel.close()
+
+
+def test_pipe_channel_dead_receiver() -> None:
+    check_dead_receiver(transport.make_channel('pipe'))
+
+
+def test_ring_buffer_dead_receiver() -> None:
+    check_dead_receiver(transport.make_channel('shm'))
+
+
+def test_batched() -> None:
+    rows = [{'id': i} for i in range(10)]
+
+    batches = [pickle.loads(data) for _, data in transport.batched(rows, batch_rows=4)]
+    assert [(0, rows[:4]), (4, rows[4:8]), (8, rows[8:])] == batches
+
+    batches = [pickle.loads(data) for _, data in transport.batched(rows, batch_rows=4, batch_bytes=1)]
+    assert [(0, rows[:4])] + [(i, [rows[i]]) for i in range(4, 10)] == batches
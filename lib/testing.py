@@ -1,5 +1,7 @@
+import functools
 import typing as tp
 from . import operations as ops
+from . import readers
 
 MiB = 1024 ** 2
 
@@ -10,19 +12,9 @@ travel_path = './resource/travel_times.txt'
 
 def parser(line: str) -> ops.TRow:
     """Convert string to TRow"""
-    return eval(line)
+    return readers.literal_row(line)
 
 
 def make_reader(filename: str) -> tp.Callable[[], ops.TRowsGenerator]:
     """Create function that returns Generator, reading from file"""
-    def reader() -> ops.TRowsGenerator:
-        """Work as generator, reading from file"""
-        file = open(filename, 'r')
-        while True:
-            line = file.readline()
-            if not line:
-                file.close()
-                break
-            else:
-                yield parser(line)
-    return reader
+    return functools.partial(readers.READERS['literal'], filename)
@@ -0,0 +1,218 @@
+import pickle
+import struct
+import typing as tp
+
+from abc import ABC, abstractmethod
+from itertools import islice
+from multiprocessing import Condition, Pipe, Value, parent_process
+from multiprocessing.process import BaseProcess
+from multiprocessing.shared_memory import SharedMemory
+from os import environ
+
+from . import operations as ops
+
+TRANSPORT = environ.get("TRANSPORT", "shm")  # "shm" or "pipe"
+BATCH_ROWS = int(environ.get("TRANSPORT_BATCH_ROWS", "1024"))
+BATCH_BYTES = int(environ.get("TRANSPORT_BATCH_BYTES", str(1024 ** 2)))
+RING_CAPACITY = int(environ.get("TRANSPORT_RING_CAPACITY", str(1024 ** 2)))
+RING_POLL_PERIOD = 0.1  # in seconds
+
+_HEADER = struct.Struct('<Q')
+
+
+class Channel(ABC):
+    """One-directional channel of byte messages between two processes"""
+
+    def open(self, sending: bool, peer: tp.Optional[BaseProcess] = None) -> None:
+        """
+        Prepare channel for use in current process, must be called after peer process is started
+        :param sending: whether current process sends or receives messages
+        :param peer: process on the other side, parent process by default
+        """
+        pass
+
+    @abstractmethod
+    def send_bytes(self, data: bytes) -> None:
+        """
+        Send message, raise BrokenPipeError if peer process exited
+        :param data: message to send
+        """
+        pass
+
+    @abstractmethod
+    def recv_bytes(self) -> bytes:
+        """Block until next message arrives and return it, raise EOFError if peer process exited"""
+        pass
+
+    def close(self) -> None:
+        """Release resources of channel, must be called by process which created it"""
+        pass
+
+
+class PipeChannel(Channel):
+    """Channel over multiprocessing pipe"""
+
+    def __init__(self) -> None:
+        self._reader, self._writer = Pipe(duplex=False)
+
+    def open(self, sending: bool, peer: tp.Optional[BaseProcess] = None) -> None:
+        # Unused end is closed so that exit of peer is seen as broken pipe or end of file
+        if sending:
+            self._reader.close()
+        else:
+            self._writer.close()
+
+    def send_bytes(self, data: bytes) -> None:
+        self._writer.send_bytes(data)
+
+    def recv_bytes(self) -> bytes:
+        return self._reader.recv_bytes()
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
+
+
+class RingBuffer(Channel):
+    """
+    Channel over ring buffer in shared memory for single producer and single consumer.
+    Messages are length-prefixed and may be larger than the buffer, in this case they are streamed through it.
+    """
+
+    def __init__(self, capacity: tp.Optional[int] = None) -> None:
+        """
+        :param capacity: size of ring buffer in bytes, RING_CAPACITY by default
+        """
+        self._capacity = capacity if capacity is not None else RING_CAPACITY
+        self._memory = SharedMemory(create=True, size=self._capacity)
+        self._written = Value('Q', 0, lock=False)
+        self._read = Value('Q', 0, lock=False)
+        self._condition = Condition()
+        self._peer: tp.Optional[BaseProcess] = None
+
+    def open(self, sending: bool, peer: tp.Optional[BaseProcess] = None) -> None:
+        self._peer = peer if peer is not None else parent_process()
+
+    def _wait(self, error: tp.Type[Exception]) -> None:
+        """
+        Wait for notification from peer, raise error if peer process exited meanwhile
+        :param error: exception type to raise
+        """
+        if not self._condition.wait(RING_POLL_PERIOD) and self._peer is not None and not self._peer.is_alive():
+            raise error('Peer process exited')
+
+    def _write(self, data: tp.Union[bytes, memoryview]) -> None:
+        view = memoryview(data)
+        offset = 0
+        while offset < len(view):
+            with self._condition:
+                while self._written.value - self._read.value == self._capacity:
+                    self._wait(BrokenPipeError)
+                free = self._capacity - (self._written.value - self._read.value)
+            written = self._written.value
+            position = written % self._capacity
+            size = min(free, len(view) - offset, self._capacity - position)
+            self._memory.buf[position:position + size] = view[offset:offset + size]
+            offset += size
+            with self._condition:
+                self._written.value = written + size
+                self._condition.notify_all()
+
+    def _read_into(self, size: int) -> bytearray:
+        data = bytearray(size)
+        offset = 0
+        while offset < size:
+            with self._condition:
+                while self._written.value == self._read.value:
+                    self._wait(EOFError)
+                available = self._written.value - self._read.value
+            read = self._read.value
+            position = read % self._capacity
+            chunk = min(available, size - offset, self._capacity - position)
+            data[offset:offset + chunk] = self._memory.buf[position:position + chunk]
+            offset += chunk
+            with self._condition:
+                self._read.value = read + chunk
+                self._condition.notify_all()
+        return data
+
+    def send_bytes(self, data: bytes) -> None:
+        self._write(_HEADER.pack(len(data)))
+        self._write(data)
+
+    def recv_bytes(self) -> bytes:
+        size, = _HEADER.unpack(self._read_into(_HEADER.size))
+        return bytes(self._read_into(size))
+
+    def close(self) -> None:
+        self._memory.close()
+        self._memory.unlink()
+
+
+def make_channel(kind: tp.Optional[str] = None) -> Channel:
+    """
+    :param kind: "shm" for shared memory ring buffer or "pipe", TRANSPORT by default
+    """
+    kind = kind if kind is not None else TRANSPORT
+    if kind == 'shm':
+        return RingBuffer()
+    if kind == 'pipe':
+        return PipeChannel()
+    raise ValueError(f'Unknown transport: {kind}')
+
+
+def batched(rows: ops.TRowsIterable, batch_rows: tp.Optional[int] = None,
+            batch_bytes: tp.Optional[int] = None) -> tp.Generator[tp.Tuple[int, bytes], None, None]:
+    """
+    Group rows into pickled batches, yield pairs of number of rows in batch and message with pair of
+    number of first row and list of rows. Batches are limited by number of rows; size of every pickled batch
+    is measured, and if it exceeds batch_bytes the following batches are made smaller.
+    :param rows: rows to group
+    :param batch_rows: maximum number of rows in batch, BATCH_ROWS by default
+    :param batch_bytes: approximate maximum size of pickled batch in bytes, BATCH_BYTES by default
+    """
+    max_rows = batch_rows if batch_rows is not None else BATCH_ROWS
+    max_bytes = batch_bytes if batch_bytes is not None else BATCH_BYTES
+    iterator = iter(rows)
+    limit = max_rows
+    first_index = 0
+    while True:
+        batch = list(islice(iterator, limit))
+        if not batch:
+            break
+        data = pickle.dumps((first_index, batch), pickle.HIGHEST_PROTOCOL)
+        yield len(batch), data
+        first_index += len(batch)
+        if len(data) > max_bytes:
+            limit = max(1, len(batch) * max_bytes // len(data))
+        elif limit < max_rows and 2 * len(data) < max_bytes:
+            limit = min(max_rows, 2 * limit)
+
+
+def send(channel: Channel, message: tp.Any) -> None:
+    """
+    Send picklable object through channel
+    :param channel: channel to send to
+    :param message: object to send
+    """
+    channel.send_bytes(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+
+def send_end(channel: Channel) -> None:
+    """
+    Mark end of stream of messages
+    :param channel: channel to send to
+    """
+    channel.send_bytes(b'')
+
+
+def receive(channel: Channel) -> tp.Generator[tp.Any, None, None]:
+    """
+    Yield objects sent through channel until end of stream
+    :param channel: channel to receive from
+    """
+    while True:
+        data = channel.recv_bytes()
+        if not data:
+            break
+        yield pickle.loads(data)
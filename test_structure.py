@@ -1,4 +1,15 @@
+import tempfile
+import typing as tp
+
+from pytest import CaptureFixture, MonkeyPatch, raises
+
 from . import graphs
+from .lib import graph as graph_lib
+from .lib import parallel
+from .lib import readers
+from .lib import shuffle
+from .lib import testing
+from .lib import transport
 
 
 def test_map() -> None:
@@ -73,3 +84,361 @@ def test_creation() -> None:
     result = graph.run(input=lambda: iter(data))
 
     assert correct_result == result
+
+
+def test_shared_subgraph_runs_once() -> None:
+    data = [
+        {'1': 1, '2': 2},
+        {'1': 2, '2': 3}
+    ]
+    calls = []
+
+    def source() -> tp.Iterator[tp.Dict[str, tp.Any]]:
+        calls.append(1)
+        return iter(data)
+
+    shared = graphs.Graph.graph_from_iter('input')\
+        .map(graphs.operations.DummyMapper())
+    graph = shared.join(graphs.operations.InnerJoiner(), shared, ['1'])
+
+    correct_result = [
+        {'1': 1, '2_1': 2, '2_2': 2},
+        {'1': 2, '2_1': 3, '2_2': 3}
+    ]
+
+    result = graph.run(input=source)
+
+    assert correct_result == result
+    assert 1 == len(calls)
+
+
+def test_extending_graph_keeps_original() -> None:
+    data = [
+        {'1': 1, '2': 2},
+        {'1': 2, '2': 3}
+    ]
+    graph = graphs.Graph.graph_from_iter('input')
+    last_node = graph.last_node
+
+    extended = graph.map(graphs.operations.Filter(lambda row: row['1'] > 1))
+
+    assert last_node is graph.last_node
+    assert extended.last_node.source is graph.last_node
+    assert data == graph.run(input=lambda: iter(data))
+    assert data[1:] == extended.run(input=lambda: iter(data))
+
+
+def test_node_is_immutable() -> None:
+    graph = graphs.Graph.graph_from_iter('input').map(graphs.operations.DummyMapper())
+
+    with raises(AttributeError):
+        graph.last_node.source = graph.last_node
+
+
+def test_stream() -> None:
+    data = [
+        {'1': 1, '2': 2},
+        {'1': 2, '2': 3}
+    ]
+    pulled = []
+
+    def source() -> tp.Iterator[tp.Dict[str, tp.Any]]:
+        for row in data:
+            pulled.append(row)
+            yield row
+
+    graph = graphs.Graph.graph_from_iter('input')
+
+    stream = graph.stream(input=source)
+    assert [] == pulled
+    assert data[0] == next(stream)
+    assert [data[0]] == pulled
+    assert data[1:] == list(stream)
+
+
+def test_run_to() -> None:
+    data = [
+        {'1': 1, '2': 2},
+        {'1': 2, '2': 3}
+    ]
+    result: tp.List[tp.Dict[str, tp.Any]] = []
+
+    count = graphs.Graph.graph_from_iter('input').run_to(result.append, input=lambda: iter(data))
+
+    assert 2 == count
+    assert data == result
+
+
+def test_sorted_stream_is_not_sorted_again() -> None:
+    data = [{'1': i % 3, '2': -i % 4, '3': i} for i in range(20)]
+
+    graph = graphs.Graph.graph_from_iter('input')\
+        .sort(['1', '2'])\
+        .map(graphs.operations.Filter(lambda row: row['3'] > 2))\
+        .sort(['1'])
+
+    executor = graph_lib.Executor(graph.last_node, {'input': lambda: iter(data)}, workers=1)
+
+    assert isinstance(executor.root, graph_lib.MapNode)
+    assert isinstance(executor.root.source, graph_lib.SortNode)
+    assert sorted(data[3:], key=lambda row: (row['1'], row['2'])) == graph.run(input=lambda: iter(data))
+
+
+def test_sort_by_longer_keys_sorts_groups() -> None:
+    data = [{'1': i % 3, '2': -i % 4, '3': i} for i in range(20)]
+
+    graph = graphs.Graph.graph_from_iter('input')\
+        .sort(['1'])\
+        .sort(['1', '2'])
+
+    executor = graph_lib.Executor(graph.last_node, {'input': lambda: iter(data)})
+
+    assert isinstance(executor.root, graph_lib.GroupSortNode)
+    assert sorted(data, key=lambda row: (row['1'], row['2'])) == graph.run(input=lambda: iter(data))
+
+
+def test_sort_before_reduce_is_replaced_with_hash_reduce() -> None:
+    data = [{'1': i % 3, '2': i} for i in range(20)]
+
+    graph = graphs.Graph.graph_from_iter('input')\
+        .sort(['1'])\
+        .reduce(graphs.operations.Count('count'), ['1'])
+
+    executor = graph_lib.Executor(graph.last_node, {'input': lambda: iter(data)}, columnar=False, workers=1)
+
+    assert isinstance(executor.root, graph_lib.HashReduceNode)
+    assert executor.explain().startswith('CombineReduce(Count')
+    assert [{'1': 0, 'count': 7}, {'1': 1, 'count': 7}, {'1': 2, 'count': 6}] == graph.run(input=lambda: iter(data))
+
+
+def test_sort_before_top_n_is_dropped() -> None:
+    data = [{'1': i % 3, '2': (i * 7) % 5, '3': i} for i in range(20)]
+
+    for keys in [['1'], []]:
+        graph = graphs.Graph.graph_from_iter('input')\
+            .sort([*keys, '2'])\
+            .reduce(graphs.operations.TopN('2', 2), keys)
+        unsorted = graphs.Graph.graph_from_iter('input')\
+            .sort([*keys, '3'])\
+            .reduce(graphs.operations.TopN('2', 2), keys)
+
+        assert graph.explain(columnar=False, workers=1).startswith('HashTopN(TopN')
+        assert unsorted.explain(columnar=False, workers=1).startswith('Reduce(TopN')
+        etalon = list(graphs.operations.Reduce(graphs.operations.TopN('2', 2), keys)(
+            sorted(data, key=lambda row: [row[key] for key in [*keys, '2']])))
+        assert etalon == graph.run(input=lambda: iter(data))
+
+
+def test_join_on_empty_keys_is_broadcast() -> None:
+    data = [{'1': i} for i in range(3)]
+    total = [{'total': 3}]
+
+    graph = graphs.Graph.graph_from_iter('data')\
+        .join(graphs.operations.InnerJoiner(), graphs.Graph.graph_from_iter('total'), [])
+
+    executor = graph_lib.Executor(graph.last_node, {})
+
+    assert isinstance(executor.root, graph_lib.BroadcastJoinNode)
+    assert [{'1': i, 'total': 3} for i in range(3)] == graph.run(data=lambda: iter(data), total=lambda: iter(total))
+
+
+def test_columnar_mode() -> None:
+    data = [{'1': i % 3, '2': i + 1, '3': 2.5} for i in range(20)]
+
+    graph = graphs.Graph.graph_from_iter('input')\
+        .map(graphs.operations.Product(['2', '3'], 'product'))\
+        .map(graphs.operations.Filter(lambda row: row['product'] > 10))\
+        .sort(['1'])\
+        .reduce(graphs.operations.Sum('product'), ['1'])
+
+    executor = graph_lib.Executor(graph.last_node, {'input': lambda: iter(data)}, columnar=True, workers=1)
+
+    assert isinstance(executor.root, graph_lib.BatchReduceNode)
+    assert isinstance(executor.root.source, graph_lib.BatchMapNode)
+    assert graph.run(input=lambda: iter(data)) == list(executor.rows(executor.root))
+
+
+def test_chain_of_maps_is_fused() -> None:
+    data = [{'1': i, '2': f'A{i}'} for i in range(10)]
+
+    shared = graphs.Graph.graph_from_iter('input')\
+        .map(graphs.operations.LowerCase('2'))\
+        .map(graphs.operations.Filter(lambda row: row['1'] % 2 == 0))
+    graph = shared\
+        .map(graphs.operations.Project(['2']))\
+        .join(graphs.operations.InnerJoiner(), shared.map(graphs.operations.DummyMapper()), ['2'])
+
+    executor = graph_lib.Executor(graph.last_node, {}, columnar=False, workers=1)
+
+    assert isinstance(executor.root.left, graph_lib.MapNode)
+    assert isinstance(executor.root.left.source, graph_lib.FusedMapNode)
+    assert 'FusedMap(LowerCase -> Filter)' in graph.explain(columnar=False, workers=1)
+    assert [{'1': i, '2': f'a{i}'} for i in range(0, 10, 2)] == graph.run(input=lambda: iter(data))
+
+
+def test_dead_columns_are_pruned() -> None:
+    data = [{'1': i % 3, '2': i, 'junk': 'x' * i} for i in range(20)]
+    totals = [{'1': i, 'total': i * 10, 'junk': 'y'} for i in range(3)]
+
+    graph = graphs.Graph.graph_from_iter('input')\
+        .map(graphs.operations.Filter(lambda row: row['2'] > 2, ['2']))\
+        .sort(['1'])\
+        .reduce(graphs.operations.Sum('2'), ['1'])\
+        .join(graphs.operations.InnerJoiner(), graphs.Graph.graph_from_iter('totals'), ['1'])\
+        .map(graphs.operations.Project(['1', '2', 'total']))
+
+    plan = graph.explain(columnar=False, workers=1)
+
+    assert "Prune -> Filter)\n" in plan
+    assert "Map(Prune)\n            Source('totals')" in plan
+    etalon = [{'1': 0, '2': 63, 'total': 0}, {'1': 1, '2': 69, 'total': 10}, {'1': 2, '2': 55, 'total': 20}]
+    for columnar in [False, True]:
+        executor = graph_lib.Executor(graph.last_node, {'input': lambda: iter(data), 'totals': lambda: iter(totals)},
+                                      columnar=columnar)
+        assert etalon == list(executor.rows(executor.root))
+        executor.close()
+
+
+def test_filter_is_pushed_below_sort() -> None:
+    data = [{'1': -i % 7, '2': i} for i in range(20)]
+
+    graph = graphs.Graph.graph_from_iter('input')\
+        .sort(['1'])\
+        .map(graphs.operations.Filter(lambda row: row['2'] % 3 == 0, ['2']))
+    unknown = graphs.Graph.graph_from_iter('input')\
+        .sort(['1'])\
+        .map(graphs.operations.Filter(lambda row: row['2'] % 3 == 0))
+
+    assert "Sort(keys=['1'])\n    Map(Filter)\n        Source('input')" == graph.explain(columnar=False, workers=1)
+    assert "Map(Filter)\n    Sort(keys=['1'])\n        Source('input')" == unknown.explain(columnar=False, workers=1)
+    assert unknown.run(input=lambda: iter(data)) == graph.run(input=lambda: iter(data))
+
+
+def test_filter_is_pushed_below_join() -> None:
+    left = [{'k': i // 2, 'a': i, 'junk': 0} for i in range(10)]
+    right = [{'k': i, 'b': -i} for i in range(0, 10, 2)]
+
+    def joined(joiner: graphs.operations.Joiner, condition: tp.Callable[[tp.Dict[str, tp.Any]], bool],
+               columns: tp.Optional[tp.Sequence[str]]) -> graphs.Graph:
+        return graphs.Graph.graph_from_iter('left')\
+            .map(graphs.operations.Project(['k', 'a']))\
+            .join(joiner, graphs.Graph.graph_from_iter('right').map(graphs.operations.Project(['k', 'b'])), ['k'])\
+            .map(graphs.operations.Filter(condition, columns))
+
+    cases = [
+        (graphs.operations.InnerJoiner(), lambda row: row['a'] > 3, ['a'], 1),
+        (graphs.operations.RightJoiner(), lambda row: row['b'] < -3, ['b'], 1),
+        (graphs.operations.OuterJoiner(), lambda row: row['k'] < 4, ['k'], 2),
+        (graphs.operations.OuterJoiner(), lambda row: row.get('a', 0) > 3, ['a'], 0),
+    ]
+    for joiner, condition, columns, pushed in cases:
+        graph = joined(joiner, condition, columns)
+        plan = graph.explain(columnar=False, workers=1)
+
+        assert plan.startswith('Join') == bool(pushed)
+        assert pushed == plan.count('Project -> Filter')
+        assert joined(joiner, condition, None).run(left=lambda: iter(left), right=lambda: iter(right)) == \
+            graph.run(left=lambda: iter(left), right=lambda: iter(right))
+
+
+def test_graph_from_file_formats() -> None:
+    data = [{'doc_id': i, 'text': f"it's row {i}"} for i in range(5)]
+    with tempfile.TemporaryDirectory() as directory:
+        source = f'{directory}/rows.txt'
+        readers.write_lines(source, data, repr)
+        parsed = graphs.Graph.graph_from_file(source, testing.parser)
+        assert data == parsed.run()
+        assert data == graphs.Graph.graph_from_file(source).run()
+        for name in readers.WRITERS:
+            target = f'{directory}/rows.{name}'
+            readers.convert(source, target, testing.parser, name)
+            graph = graphs.word_count_graph_file(target, name)
+            assert graphs.word_count_graph_file(source, testing.parser).run() == graph.run()
+
+
+def test_graph_from_file_ranges() -> None:
+    data = [{'doc_id': i, 'text': f'row {i}'} for i in range(100)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = f'{directory}/rows.txt'
+        readers.write_lines(path, data, repr)
+        ranges = readers.split_file(path, 4)
+        parts = [graphs.Graph.graph_from_file(path, 'literal', start, end) for start, end in ranges]
+
+        assert data == [row for part in parts for row in part.run()]
+        assert f"FileSource({path!r}, start={ranges[1][0]}, end={ranges[1][1]})" == parts[1].explain()
+        assert data == graphs.Graph.graph_from_iter('rows').run(rows=graphs.Graph.fabric(path))
+
+
+def test_chains_of_maps_run_on_workers(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(parallel, 'PARALLEL_TASK_BYTES', 64)
+    monkeypatch.setattr(transport, 'BATCH_ROWS', 7)
+    graph = graphs.word_count_graph_file(testing.text_path, 'literal')
+    executor = graph_lib.Executor(graph.last_node, workers=2)
+    assert "ParallelMap(workers=2: FusedMap(Prune -> Tokenize) <- FileSource('./resource/text_corpus.txt'))" \
+        in executor.explain()
+    executor.close()
+
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 1)
+    expected = graph.run()
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 2)
+    assert expected == graph.run()
+
+    data = [{'doc_id': i, 'text': f'hello little world {i % 3}'} for i in range(100)]
+    graph = graphs.word_count_graph('docs')
+    assert 'ParallelMap' in graph.explain(workers=2)
+    assert 'ParallelMap' not in graph.explain(workers=1)
+    parallel_result = graph.run(docs=lambda: iter(data))
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 1)
+    assert graph.run(docs=lambda: iter(data)) == parallel_result
+
+
+def test_reduces_joins_and_sorts_are_shuffled_to_workers(monkeypatch: MonkeyPatch,
+                                                         capsys: CaptureFixture[str]) -> None:
+    monkeypatch.setattr(parallel, 'PARALLEL_TASK_BYTES', 256)
+    graph = graphs.word_count_graph_file(testing.text_path, 'literal')
+    plan = graph.explain(columnar=False, workers=2)
+    assert plan.startswith("RangeSort(keys=['count', 'text'], partitions=16)\n")
+    assert "ShuffleReduce(CombineReduce(Count), keys=['text'], partitions=16)\n        ParallelMap(workers=2" in plan
+    assert 'Shuffle' not in graph.explain(columnar=False, workers=1)
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 1)
+    expected = graph.run()
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 2)
+    assert expected == graph.run()
+
+    graph = graphs.pmi_graph_file(testing.text_path, 'literal')
+    assert "ShuffleJoin(InnerJoiner, keys=['text'], partitions=16)" in graph.explain(columnar=False, workers=2)
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 1)
+    expected = graph.run()
+    monkeypatch.setattr(parallel, 'GRAPH_WORKERS', 2)
+    assert expected == graph.run()
+
+    monkeypatch.setattr(shuffle, 'SKEW_REPORT', 1)
+    capsys.readouterr()
+    graph.run()
+    report = capsys.readouterr().err
+    assert "ShuffleJoin(InnerJoiner, keys=['text'], partitions=16): partitions=16, rows=" in report
+    assert "RangeSort(keys=['doc_id', 'text'], partitions=16): partitions=" in report
+
+
+def test_skew_of_executor() -> None:
+    data = [{'doc_id': i, 'text': 'the the the ' + ('a b' if i % 2 else 'c')} for i in range(100)]
+    graph = graphs.word_count_graph('docs')
+    executor = graph_lib.Executor(graph.last_node, {'docs': lambda: iter(data)}, columnar=False, workers=2)
+    assert '' == executor.skew()
+    rows = list(executor.rows(executor.root))
+    executor.close()
+
+    assert [{'text': 'a', 'count': 50}, {'text': 'b', 'count': 50}, {'text': 'c', 'count': 50},
+            {'text': 'the', 'count': 300}] == rows
+    lines = executor.skew().split('\n')
+    assert 2 == len(lines)
+    assert lines[0].startswith("ShuffleReduce(CombineReduce(Count), keys=['text'], partitions=16): partitions=16, ")
+    assert lines[1].startswith("RangeSort(keys=['count', 'text'], partitions=16): partitions=")
+
+
+def test_source_read_twice_is_not_sent_to_workers() -> None:
+    graph = graphs.inverted_index_graph('docs')
+    plan = graph.explain(workers=2)
+
+    assert 'ParallelMap' not in plan
+    assert "Source('docs') [shared]" in plan